@@ -0,0 +1,104 @@
+"""
+Benchmark of the analytics job (see crowdsourcehinter/analytics.py).
+
+Writes a tracking log of --students students, each shown hints of --problems problems until they
+solve them, then times counting the conversions of the log and writing them to an in-memory
+key-value store, and reports the peak memory the counting used, which must not grow with the
+size of the log once --max-open students have unresolved hints.
+
+Usage: python -m benchmarks.bench_analytics [--students 20000] [--max-open 100000] [--problems 10] [--hints 50]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from crowdsourcehinter import analytics
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+
+def write_log(path, students, problems, hints):
+    """
+    Write a tracking log and return the number of its lines, with other events between the
+    hinter's. Students work on the problems in turn, so many are between two attempts at once.
+    """
+    lines = 0
+    with open(path, 'w') as log:
+        for second in range(students * problems):
+            student, problem = second % students, second // students
+            element = u'problem %d' % problem
+            for attempt in range(1, random.randint(2, 5)):
+                hint = random.randrange(hints)
+                log.write(json.dumps({
+                    "time": "%010d.%d" % (second, attempt), "username": u'student %d' % student,
+                    "event_type": analytics.SHOW_EVENT, "event": json.dumps({
+                        "student_answer": u'answer %d' % (hint % 5), "hint_received": u'hint %d' % hint,
+                        "hint_id": hint_id(u'hint %d' % hint), "hinting_element": element, "attempt": attempt,
+                    }),
+                }) + '\n')
+                log.write(json.dumps({
+                    "time": "%010d.%d" % (second, attempt), "event_type": "problem_check", "event": {},
+                }) + '\n')
+                lines += 2
+            if random.random() < 0.7:
+                log.write(json.dumps({
+                    "time": "%010d.9" % second, "username": u'student %d' % student,
+                    "event_type": analytics.SOLVED_EVENT,
+                    "event": json.dumps({"hinting_element": element, "attempt": attempt + 1}),
+                }) + '\n')
+                lines += 1
+    return lines
+
+
+def count_log(path, marker, max_open):
+    start = time.time()
+    events = analytics.hinter_events(analytics.merge_events([analytics.read_events(path, marker)]))
+    counts = analytics.count_conversions(analytics.outcomes(events, max_open=max_open))
+    return counts, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--problems', type=int, default=10)
+    parser.add_argument('--hints', type=int, default=50)
+    parser.add_argument('--max-open', type=int, default=analytics.MAX_OPEN)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'tracking.log')
+        lines = write_log(path, args.students, args.problems, args.hints)
+        print("%d lines, %.1f MB" % (lines, os.path.getsize(path) / 1e6))
+
+        for marker in (None, analytics.EVENT_MARKER):
+            counts, elapsed = count_log(path, marker, args.max_open)
+            print("count_conversions:    %8.3f s  (%6.0f ns per line, %s)" % (
+                elapsed, elapsed / lines * 1e9, "filtered" if marker else "all lines parsed"
+            ))
+        tracemalloc.start()
+        count_log(path, analytics.EVENT_MARKER, args.max_open)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("peak memory:          %8.1f MB  (%d hints)" % (peak / 1e6, len(counts)))
+
+        kvs = InMemoryKeyValueStore()
+        updates = {}
+        for hint in range(args.hints):
+            updates.setdefault(u'answer %d' % (hint % 5), []).append({"hint": u'hint %d' % hint, "rating": 0})
+        for problem in range(args.problems):
+            HintStorage(kvs, u'problem %d' % problem).bulk_update(updates)
+        start = time.time()
+        count = analytics.write_conversions(kvs, counts, u'bench')
+        print("write_conversions:    %8.3f s  (%d hints)" % (time.time() - start, count))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the answer matching index: building an AnswerIndex and looking up answers that
+are known, that differ from a known answer by punctuation, one or two typos or rounding, and
+that match nothing.
+
+Usage: python -m benchmarks.bench_answers [--answers 100000] [--lookups 2000]
+"""
+import argparse
+import random
+import string
+import time
+
+from crowdsourcehinter.answers import AnswerIndex
+
+
+def random_answer():
+    if random.random() < 0.2:
+        return u'%.4f' % random.uniform(-1000, 1000)
+    words = random.randint(1, 3)
+    return u' '.join(
+        u''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 9))) for _ in range(words)
+    )
+
+
+def typo(answer, edits):
+    answer = list(answer)
+    for _ in range(edits):
+        position = random.randrange(len(answer))
+        operation = random.choice(('insert', 'delete', 'replace'))
+        if operation == 'insert':
+            answer.insert(position, random.choice(string.ascii_lowercase))
+        elif operation == 'delete' and len(answer) > 1:
+            del answer[position]
+        else:
+            answer[position] = random.choice(string.ascii_lowercase)
+    return u''.join(answer)
+
+
+def query(answer, kind):
+    if kind == 'known':
+        return answer
+    if kind == 'punctuation':
+        return answer.upper() + u'!'
+    if kind == 'rounding':
+        return u'%.3f' % (float(answer) * 1.0002)
+    if kind == 'miss':
+        return random_answer() + u'qqq'
+    return typo(answer, int(kind[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--answers', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    answers = list(set(random_answer() for _ in range(args.answers)))
+    start = time.time()
+    index = AnswerIndex(answers)
+    print("build: %d answers in %.2fs" % (len(answers), time.time() - start))
+
+    words = [answer for answer in answers if not answer[0].isdigit() and answer[0] != '-' and len(answer) >= 8]
+    numbers = [answer for answer in answers if answer[0].isdigit() or answer[0] == "-"]
+    for kind in ('known', 'punctuation', '1 typo', '2 typos', 'rounding', 'miss'):
+        sample = numbers if kind == 'rounding' else words
+        queries = [query(random.choice(sample), kind) for _ in range(args.lookups)]
+        found = 0
+        times = []
+        for answer in queries:
+            start = time.time()
+            found += bool(index.match(answer))
+            times.append(time.time() - start)
+        times.sort()
+        print("%-12s mean %7.1f us   p99 %7.1f us   matched %5.1f%%" % (
+            kind, 1e6 * sum(times) / len(times), 1e6 * times[int(len(times) * 0.99)], 100.0 * found / len(queries)
+        ))
+
+
+if __name__ == '__main__':
+    main()
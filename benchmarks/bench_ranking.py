@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of finding the hint to show for an answer: the scan get_hint used to do
+against the lookup in a HintRanking kept by the hint storage.
+
+The scan is the old find_hints loop over every hint and every reported hint, followed by the
+max() over the answer's hints. The ranked lookup is what get_hint does now: read the shard's
+revision, take the cached ranking and return its best hint that the student has not used.
+
+Usage: python -m benchmarks.bench_ranking [--sizes 10,1000,50000]
+"""
+import argparse
+import operator
+import random
+import timeit
+
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore
+
+ANSWER = u'computerr'
+REPORTED = 20
+USED = 5
+
+
+def scan(hints, reported, used):
+    isreported = []
+    for hint in hints:
+        for reported_hint in reported:
+            if hint == reported_hint:
+                isreported.append(hint)
+    if len(hints) - len(isreported) > 0:
+        best_hint = max(hints.items(), key=operator.itemgetter(1))[0]
+        if best_hint not in reported and best_hint not in used:
+            return best_hint
+        for hint in hints:
+            if hint not in used and hint not in reported:
+                return hint
+    return None
+
+
+def bench(size, number):
+    hints = dict((u'hint %d' % i, random.randint(-50, 50)) for i in range(size))
+    storage = HintStorage(InMemoryKeyValueStore(), u'bench-%d' % size)
+    storage.migrate({ANSWER: hints})
+    reported = dict((hint, ANSWER) for hint in random.sample(sorted(hints), min(REPORTED, size // 2)))
+    for hint in reported:
+        storage.report_hint(ANSWER, hint)
+    used = set(storage.ranking(ANSWER).hints()[:USED])
+
+    scan_time = min(timeit.repeat(lambda: scan(hints, reported, used), number=number, repeat=3)) / number
+    ranked_time = min(timeit.repeat(
+        lambda: storage.ranking(ANSWER).best(exclude=used), number=number, repeat=3
+    )) / number
+    print("%8d hints: scan %10.2f us   ranked %8.2f us   speedup %8.1fx" % (
+        size, scan_time * 1e6, ranked_time * 1e6, scan_time / ranked_time
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,1000,50000')
+    args = parser.parse_args()
+    for size in [int(size) for size in args.sizes.split(',')]:
+        bench(size, number=max(10, 100000 // size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of recomputing the scores of hints (see crowdsourcehinter/scoring.py).
+
+Times HintScorer.scores over the votes of --hints hints, with NumPy (if it is installed) and in
+pure Python, and HintStorage.rescore over a block with as many hints, --per-answer hints for
+each answer, in an in-memory key-value store.
+
+Usage: python -m benchmarks.bench_scoring [--hints 1000000] [--per-answer 100] [--method wilson|bayesian]
+"""
+import argparse
+import random
+import time
+
+from crowdsourcehinter import scoring
+from crowdsourcehinter.scoring import HintScorer
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def bench_scorer(scorer, ups, downs):
+    if scoring.numpy is not None:
+        _, elapsed = timed(scorer.scores, ups, downs)
+        print("scores, NumPy:        %8.3f s  (%6.0f ns per hint)" % (elapsed, elapsed / len(ups) * 1e9))
+    numpy, scoring.numpy = scoring.numpy, None
+    try:
+        _, elapsed = timed(scorer.scores, ups, downs)
+    finally:
+        scoring.numpy = numpy
+    print("scores, pure Python:  %8.3f s  (%6.0f ns per hint)" % (elapsed, elapsed / len(ups) * 1e9))
+
+
+def bench_rescore(scorer, ups, downs, per_answer):
+    storage = HintStorage(InMemoryKeyValueStore(), u'bench', scorer=scorer)
+    updates = {}
+    for number, (up, down) in enumerate(zip(ups, downs)):
+        updates.setdefault(u'answer %d' % (number // per_answer), []).append({
+            "hint": u'hint %d' % number, "counter": {"p": {"r": up}, "n": {"r": down}},
+        })
+    _, elapsed = timed(storage.bulk_update, updates)
+    print("bulk_update:          %8.3f s  (scores all the hints)" % elapsed)
+    other = HintScorer('bayesian' if scorer.method == 'wilson' else 'wilson')
+    storage = HintStorage(storage.backend, u'bench', scorer=other)
+    count, elapsed = timed(storage.rescore)
+    print("rescore, changed:     %8.3f s  (%d hints, %6.0f ns per hint)" % (elapsed, count, elapsed / count * 1e9))
+    count, elapsed = timed(storage.rescore)
+    print("rescore, unchanged:   %8.3f s  (%d hints, %6.0f ns per hint)" % (elapsed, count, elapsed / count * 1e9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hints', type=int, default=1000000)
+    parser.add_argument('--per-answer', type=int, default=100)
+    parser.add_argument('--method', default='wilson', choices=('wilson', 'bayesian'))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    scorer = HintScorer(args.method)
+    ups = [random.randint(0, 50) for _ in range(args.hints)]
+    downs = [random.randint(0, 50) for _ in range(args.hints)]
+    print("%d hints, %s scores, NumPy %s" % (
+        args.hints, args.method, "installed" if scoring.numpy is not None else "not installed"
+    ))
+    bench_scorer(scorer, ups, downs)
+    bench_rescore(scorer, ups, downs, args.per_answer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+An in-memory XBlock runtime for driving the hinter's handlers outside of a course.
+
+Field data and the 'hint_storage' service are kept in dictionaries that count the bytes read
+and written, by field scope, as the serialized JSON of each value.
+"""
+import json
+from collections import defaultdict
+
+from webob import Request
+from xblock.fields import ScopeIds
+from xblock.runtime import DictKeyValueStore, KvsFieldData
+from xblock.test.tools import TestRuntime
+
+from crowdsourcehinter import CrowdsourceHinter
+from crowdsourcehinter.storage import InMemoryKeyValueStore
+
+
+class IOStats(object):
+    """
+    Number of reads and writes, and bytes read and written, by scope.
+    """
+    def __init__(self):
+        self.reads = defaultdict(int)
+        self.writes = defaultdict(int)
+        self.bytes_read = defaultdict(int)
+        self.bytes_written = defaultdict(int)
+
+    def read(self, scope, value):
+        self.reads[scope] += 1
+        self.bytes_read[scope] += len(value)
+
+    def write(self, scope, value):
+        self.writes[scope] += 1
+        self.bytes_written[scope] += len(value)
+
+    def to_json(self):
+        return dict(
+            (scope, {
+                'reads': self.reads[scope],
+                'writes': self.writes[scope],
+                'bytes_read': self.bytes_read[scope],
+                'bytes_written': self.bytes_written[scope],
+            })
+            for scope in sorted(set(self.reads) | set(self.writes))
+        )
+
+
+class CountingKeyValueStore(DictKeyValueStore):
+    """
+    Field data key-value store that keeps values serialized, as a database would, and counts
+    I/O by the scope of the field.
+    """
+    def __init__(self, stats):
+        super(CountingKeyValueStore, self).__init__()
+        self.stats = stats
+
+    def get(self, key):
+        value = super(CountingKeyValueStore, self).get(key)
+        self.stats.read(key.scope.name, value)
+        return json.loads(value)
+
+    def set(self, key, value):
+        value = json.dumps(value)
+        self.stats.write(key.scope.name, value)
+        super(CountingKeyValueStore, self).set(key, value)
+
+    def set_many(self, update_dict):
+        for key, value in update_dict.items():
+            self.set(key, value)
+
+
+class CountingHintStore(InMemoryKeyValueStore):
+    """
+    'hint_storage' service that counts I/O under the 'hint_storage' scope.
+    """
+    def __init__(self, stats):
+        super(CountingHintStore, self).__init__()
+        self.stats = stats
+
+    def get(self, key, default=None):
+        self.stats.read('hint_storage', self.data.get(key, ''))
+        return super(CountingHintStore, self).get(key, default)
+
+    def set(self, key, value):
+        super(CountingHintStore, self).set(key, value)
+        self.stats.write('hint_storage', self.data[key])
+
+
+class StaffStatus(object):
+    """
+    Stands in for the xmodule_runtime of the LMS, which the hinter asks whether the user is staff.
+    """
+    def __init__(self, user_is_staff):
+        self.user_is_staff = user_is_staff
+
+
+class InMemoryCourse(object):
+    """
+    One hinter block in a course, with its field data (and hint storage, if `service` is set)
+    kept in memory. Every handler call is made on a new block instance, as every request is
+    in the LMS, and the block is saved after the call.
+    """
+    def __init__(self, service=True, usage_id='hinter', **fields):
+        self.stats = IOStats()
+        self.field_data = KvsFieldData(CountingKeyValueStore(self.stats))
+        self.services = {'field-data': self.field_data}
+        if service:
+            self.services['hint_storage'] = CountingHintStore(self.stats)
+        self.usage_id = usage_id
+        block = self.block('instructor')
+        for name, value in fields.items():
+            setattr(block, name, value)
+        block.save()
+
+    def block(self, user_id, staff=False):
+        runtime = TestRuntime(services=self.services)
+        block = runtime.construct_xblock_from_class(
+            CrowdsourceHinter, ScopeIds(user_id, 'crowdsourcehinter', self.usage_id, self.usage_id)
+        )
+        block.xmodule_runtime = StaffStatus(staff)
+        return block
+
+    def call(self, user_id, handler, data, staff=False):
+        """
+        Call a JSON handler as a user and return the decoded response.
+        """
+        block = self.block(user_id, staff)
+        request = Request.blank('/', method='POST', body=json.dumps(data).encode('utf8'))
+        response = getattr(block, handler)(request)
+        block.save()
+        return json.loads(response.body.decode('utf8') or 'null')
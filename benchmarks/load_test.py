@@ -0,0 +1,240 @@
+"""
+Load test of the hinter's handlers with a simulated student population.
+
+Every simulated student submits one or more incorrect answers (drawn from a Zipf distribution
+over the distinct answers, so a few answers are common and most are rare) and asks for a hint
+for each, then answers correctly and goes through the feedback stage: the hints are loaded and
+rated, some are reported and some students contribute a new hint. Staff look at the moderation
+queue now and then. With --prefetch, students load the prefetched hints of the student view
+and, as the JavaScript does, only ask for hints of the answers that are not among them,
+reporting the prefetched hints they were shown with their next request.
+
+The report has the throughput, the p50 and p99 latency of every handler, the reads, writes and
+bytes of every field scope (and of the 'hint_storage' service) and the hits and misses of the
+process' cache of the hint storage. It can be saved as a baseline
+and later runs compared with it, failing if they are slower or do more I/O than the tolerance.
+The latencies of handlers called fewer than --min-calls times are too noisy to compare.
+
+Usage:
+  python -m benchmarks.load_test [--students 500] [--answers 200] [--hints 5] [--vote-rate 0.5]
+      [--report-rate 0.02] [--new-hint-rate 0.1] [--storage service|field] [--batched]
+      [--prefetch]
+      [--save-baseline FILE] [--baseline FILE] [--tolerance 0.25] [--min-delta 0.5] [--min-calls 50]
+"""
+import argparse
+import bisect
+import json
+import random
+import time
+from collections import defaultdict
+
+from crowdsourcehinter import prefetch
+from crowdsourcehinter.answers import normalize_answer
+from crowdsourcehinter.counters import VOTE_BUFFER
+from crowdsourcehinter.storage import STORAGE_CACHE
+
+from .harness import InMemoryCourse
+
+
+def zipf_sampler(count, exponent=1.1):
+    """
+    Return a function drawing an index in range(count), index i with weight 1 / (i + 1) ** exponent.
+    """
+    cumulative = []
+    total = 0.0
+    for index in range(count):
+        total += 1.0 / (index + 1) ** exponent
+        cumulative.append(total)
+    return lambda: min(bisect.bisect(cumulative, random.random() * total), count - 1)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class LoadTest(object):
+    def __init__(self, args):
+        self.args = args
+        self.latencies = defaultdict(list)
+        initial_hints = dict(
+            (u'answer %d' % answer, dict((u'hint %d for answer %d' % (hint, answer), 0) for hint in range(args.hints)))
+            for answer in range(args.answers)
+        )
+        self.course = InMemoryCourse(
+            service=args.storage == 'service',
+            initial_hints=initial_hints,
+            generic_hints=[u'Check your answer for typos.'],
+            Element=u'i4x://load_test/problem/%d' % random.getrandbits(32),
+        )
+        self.course.stats.__init__()
+        self.draw_answer = zipf_sampler(args.answers)
+
+    def call(self, user, handler, data, staff=False):
+        start = time.time()
+        result = self.course.call(user, handler, data, staff)
+        self.latencies[handler].append(time.time() - start)
+        return result
+
+    def prefetch_data(self, user):
+        start = time.time()
+        result = self.course.block(user).prefetch_data()
+        self.latencies['prefetch_data'].append(time.time() - start)
+        return result
+
+    def student(self, number):
+        args = self.args
+        user = u'student %d' % number
+        data = self.prefetch_data(user) if args.prefetch else {'bundle': {'hints': {}}}
+        shown = []
+        shown_hints = set(data.get('shownHints', ()))
+        for _ in range(random.randint(1, 3)):
+            answer = u'answer %d' % self.draw_answer()
+            bundled = data['bundle']['hints'].get(normalize_answer(answer))
+            if bundled and (data['showBest'] or bundled[0] not in shown_hints):
+                shown.append({"student_answer": normalize_answer(answer), "hint_id": bundled[0]})
+                shown_hints.add(bundled[0])
+                continue
+            request = {"submittedanswer": u'input_1_2_1=' + answer}
+            if shown:
+                request["shown"], shown = shown, []
+            self.call(user, 'get_hint', request)
+        if shown:
+            self.call(user, 'record_hints', {"shown": shown, "version": data['bundle']['version']})
+        ratings = []
+        if args.batched:
+            result = self.call(user, 'get_feedback_with_ratings', {})
+            feedback = [(entry['hint_id'], entry['student_answer']) for entry in result['feedback']]
+        else:
+            # the legacy handlers are sent the hint text, as older clients do
+            feedback = list(self.call(user, 'get_feedback', {}).items())
+        key = 'hint_id' if args.batched else 'hint'
+        for hint, answer in feedback:
+            if hint in (None, 'null'):
+                continue
+            if not args.batched:
+                self.call(user, 'get_ratings', {"student_answer": answer, "hint": hint})
+            if random.random() < args.report_rate:
+                ratings.append({"student_answer": answer, key: hint, "student_rating": "report"})
+            elif random.random() < args.vote_rate:
+                vote = random.choice(('upvote', 'upvote', 'downvote'))
+                ratings.append({"student_answer": answer, key: hint, "student_rating": vote})
+        if args.batched and ratings:
+            self.call(user, 'rate_hints', {"ratings": ratings})
+        for rating in ratings if not args.batched else ():
+            self.call(user, 'rate_hint', rating)
+        if feedback and random.random() < args.new_hint_rate:
+            answer = feedback[0][1]
+            self.call(user, 'add_new_hint', {"answer": answer, "submission": u'%s says: check %s' % (user, answer)})
+        if number % 100 == 99:
+            self.call(u'staff', 'get_moderation_queue', {}, staff=True)
+
+    def run(self):
+        start = time.time()
+        for number in range(self.args.students):
+            self.student(number)
+        VOTE_BUFFER.flush(True)
+        elapsed = time.time() - start
+        calls = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'parameters': dict(
+                (name, getattr(self.args, name)) for name in (
+                    'students', 'answers', 'hints', 'vote_rate', 'report_rate', 'new_hint_rate', 'storage', 'batched',
+                    'prefetch', 'seed',
+                )
+            ),
+            'calls': calls,
+            'throughput': calls / elapsed,
+            'handlers': dict(
+                (handler, {
+                    'calls': len(latencies),
+                    'p50_ms': 1000 * percentile(latencies, 0.5),
+                    'p99_ms': 1000 * percentile(latencies, 0.99),
+                })
+                for handler, latencies in sorted(self.latencies.items())
+            ),
+            'io': self.course.stats.to_json(),
+            'cache': STORAGE_CACHE.stats(),
+        }
+
+
+def print_report(report):
+    print("%d calls, %.0f calls/s" % (report['calls'], report['throughput']))
+    for handler, stats in sorted(report['handlers'].items()):
+        print("  %-26s %6d calls  p50 %8.3f ms  p99 %8.3f ms" % (
+            handler, stats['calls'], stats['p50_ms'], stats['p99_ms']
+        ))
+    for scope, stats in sorted(report['io'].items()):
+        print("  %-20s %7d reads %12d bytes   %7d writes %12d bytes" % (
+            scope, stats['reads'], stats['bytes_read'], stats['writes'], stats['bytes_written']
+        ))
+    cache = report.get('cache')
+    if cache:
+        print("  storage cache        %7d hits %7d misses %7d evictions" % (
+            cache['hits'], cache['misses'], cache['evictions']
+        ))
+
+
+def compare(report, baseline, tolerance, min_delta, min_calls=50):
+    """
+    Return the regressions of a report against a baseline: median latencies more than `tolerance`
+    and `min_delta` milliseconds slower, and I/O counts or bytes more than `tolerance` / 5 higher.
+    The p99 latencies of a few hundred calls are too noisy to compare, and so are the medians of
+    handlers called fewer than `min_calls` times, in the report or in the baseline.
+    """
+    regressions = []
+    for handler, stats in report['handlers'].items():
+        old = baseline['handlers'].get(handler)
+        if not old or min(stats['calls'], old['calls']) < min_calls:
+            continue
+        if stats['p50_ms'] > max(old['p50_ms'] * (1 + tolerance), old['p50_ms'] + min_delta):
+            regressions.append("%s p50_ms: %.3f -> %.3f" % (handler, old['p50_ms'], stats['p50_ms']))
+    for scope, stats in report['io'].items():
+        old = baseline['io'].get(scope, {})
+        for name, value in stats.items():
+            if value > old.get(name, 0) * (1 + tolerance / 5):
+                regressions.append("%s %s: %d -> %d" % (scope, name, old.get(name, 0), value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--answers', type=int, default=200, help="distinct incorrect answers")
+    parser.add_argument('--hints', type=int, default=5, help="initial hints per answer")
+    parser.add_argument('--vote-rate', type=float, default=0.5)
+    parser.add_argument('--report-rate', type=float, default=0.02)
+    parser.add_argument('--new-hint-rate', type=float, default=0.1)
+    parser.add_argument('--storage', choices=('service', 'field'), default='service')
+    parser.add_argument('--batched', action='store_true', help="use the batched feedback handlers")
+    parser.add_argument('--prefetch', action='store_true', help="use the prefetched hints of the student view")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE', help="compare with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta', type=float, default=0.5, help="latency change in ms below which it is noise")
+    parser.add_argument('--min-calls', type=int, default=50, help="calls below which latencies are not compared")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.prefetch:
+        # every student loads an up to date bundle, as they would after the cache interval
+        prefetch.CHECK_INTERVAL = 0
+    report = LoadTest(args).run()
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(
+                report, json.load(baseline_file), args.tolerance, args.min_delta, args.min_calls
+            )
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Stress test for the vote counters: N concurrent upvotes must produce exactly N increments.
+
+Several simulated workers, each with its own VoteBuffer (replica), upvote the same hint from
+many threads, and the flusher thread of each buffer writes the votes to one shared key-value
+store whenever the buffer is due. The final rating read from the store must equal the number of
+votes. The time printed is that of the votes, which never wait for a flush.
+
+Usage: python -m benchmarks.stress_votes [--votes N] [--workers W] [--threads T]
+"""
+import argparse
+import random
+import threading
+import time
+
+from crowdsourcehinter.counters import VoteBuffer
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+NAMESPACE = u'stress'
+ANSWER = u'computerr'
+HINT = u'You misspelled computer, remove the last r.'
+HINT_ID = hint_id(HINT)
+
+
+def run(votes, workers, threads):
+    kvs = InMemoryKeyValueStore()
+    HintStorage(kvs, NAMESPACE).add_hint(ANSWER, HINT)
+    buffers = [VoteBuffer(max_pending=random.randint(1, 50), max_delay=0.001) for _ in range(workers)]
+    remaining = [votes]
+    lock = threading.Lock()
+
+    def vote():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            # every vote is a new request, so it gets a new HintStorage, as with a new block instance
+            HintStorage(kvs, NAMESPACE, random.choice(buffers)).change_rating(ANSWER, HINT_ID, 1)
+
+    start = time.time()
+    pool = [threading.Thread(target=vote) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.time() - start
+    while any(vote_buffer.has_pending() for vote_buffer in buffers):
+        for vote_buffer in buffers:
+            vote_buffer.flush()
+    rating = HintStorage(kvs, NAMESPACE).get_hints(ANSWER)[HINT_ID]
+    print("%d votes from %d threads on %d workers in %.3fs: rating %d" % (votes, threads, workers, elapsed, rating))
+    return rating
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--votes', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+    rating = run(args.votes, args.workers, args.threads)
+    if rating != args.votes:
+        raise SystemExit("FAILED: expected rating %d, got %d" % (args.votes, rating))
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Offline analytics of the effectiveness of hints, from the tracking logs.
+
+The JavaScript logs a crowd_hinter.showHint event whenever it shows a hint, with the "hint_id",
+the "hinting_element" and the "attempt": the number of the student's graded submission of the
+problem since the page was loaded. When the student answers correctly, it logs a
+crowd_hinter.solved event with the attempt. A showing of a hint converts if the student solves
+the problem at most `attempts` submissions after it.
+
+The job streams the events of tracking log files through a pipeline of generators:
+
+  read_events -> merge_events -> hinter_events -> outcomes -> count_conversions
+
+so memory depends on the number of hints and of students with hints shown that are not resolved
+yet (at most `max_open`), not on the size of the logs. The counts of every hint are written back
+to the hint storage with HintStorage.bulk_update, in batches, as the "conversions" of the hint,
+which the HintScorer counts in its score (see scoring.py).
+
+Counts are stored by source, the name of the run, and a run replaces the counts of its source,
+so running the job again over the same logs does not count them twice. Runs over different logs
+must have different sources (by default, the source is a digest of the names of the log files).
+A student who was shown a hint in the logs of one run and solved the problem in those of the
+next is counted as not solving it.
+
+Usage:
+  crowdsourcehinter-analytics [--attempts 3] [--max-open 100000] [--source NAME] [--output FILE]
+      [--store hints.sqlite | --store-factory MODULE:CALLABLE] [--batch-size 5000] LOG [LOG ...]
+
+--store and --store-factory are those of crowdsourcehinter-hints (see bulk.py), so counts are not
+written back to blocks that keep their hints in their hint_shards field. Log files are in time
+order, as the LMS writes them; files whose name ends with .gz are decompressed.
+"""
+import argparse
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from .bulk import Importer, open_store
+from .storage import HintStorage
+
+log = logging.getLogger(__name__)
+
+SHOW_EVENT = 'crowd_hinter.showHint'
+SOLVED_EVENT = 'crowd_hinter.solved'
+# Bytes in the log lines of both events.
+EVENT_MARKER = b'crowd_hinter.'
+
+# Number of submissions after a hint within which solving the problem counts as a conversion.
+ATTEMPTS = 3
+# Number of students with unresolved showings of hints kept in memory, over all problems.
+MAX_OPEN = 100000
+
+
+def read_events(path, marker=None):
+    """
+    Iterate over the events of a tracking log file, which has one JSON object per line. Lines that
+    are not JSON objects, such as a line cut short by a crash, are skipped.
+
+    Args:
+      path: the log file
+      marker: bytes that the lines of the events of interest contain; other lines are skipped
+              without parsing them, which saves most of the time on the logs of a whole course
+    """
+    skipped = 0
+    with (gzip.open(path) if path.endswith('.gz') else io.open(path, 'rb')) as lines:
+        for line in lines:
+            if marker is not None and marker not in line:
+                continue
+            try:
+                event = json.loads(line.decode('utf8'))
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(event, dict):
+                yield event
+            else:
+                skipped += 1
+    if skipped:
+        log.warning("Skipped %d lines of %s that are not events", skipped, path)
+
+
+def _decorate(number, events):
+    for sequence, event in enumerate(events):
+        yield event.get('time', u''), number, sequence, event
+
+
+def merge_events(streams):
+    """
+    Merge streams of events that are each in time order, such as the logs of several servers, into
+    one stream in time order. Events at the same time keep the order of their streams.
+    """
+    for decorated in heapq.merge(*[_decorate(number, events) for number, events in enumerate(streams)]):
+        yield decorated[-1]
+
+
+def hinter_events(events):
+    """
+    Iterate over the showings of hints and the solutions among events, as (user, element, attempt,
+    answer, hint id), where the answer and hint id are None for solutions. Events logged before
+    the events had hint ids and attempts, and showings of no hint, are left out.
+    """
+    for event in events:
+        if event.get('event_type') not in (SHOW_EVENT, SOLVED_EVENT):
+            continue
+        data = event.get('event')
+        # browser events are logged with their data as a JSON string
+        if not isinstance(data, dict):
+            try:
+                data = json.loads(data)
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(data, dict):
+                continue
+        user = event.get('username') or (event.get('context') or {}).get('user_id')
+        element = data.get('hinting_element')
+        attempt = data.get('attempt')
+        if not user or not element or not isinstance(attempt, int):
+            continue
+        if event['event_type'] == SOLVED_EVENT:
+            yield user, element, attempt, None, None
+        elif data.get('hint_id') and data.get('student_answer') is not None:
+            yield user, element, attempt, data['student_answer'], data['hint_id']
+
+
+def outcomes(events, attempts=ATTEMPTS, max_open=MAX_OPEN):
+    """
+    Pair the showings of hints with the next solution of the same student and problem, and iterate
+    over (element, answer, hint id, solved), where solved is whether the problem was solved at most
+    `attempts` submissions after the hint was shown. A showing is not solved if there is no such
+    solution, if the attempts start over (the student loaded the page again) before it, or if its
+    student is the least recently active of more than `max_open` with unresolved showings.
+
+    Args:
+      events: the events of hinter_events, in time order
+    """
+    # (user, element) -> [last attempt, [(attempt, answer, hint id)]], least recently active first
+    sessions = OrderedDict()
+    for user, element, attempt, answer, hint in events:
+        session = sessions.pop((user, element), None)
+        if session is not None and attempt < session[0]:
+            for _, shown_answer, shown_hint in session[1]:
+                yield element, shown_answer, shown_hint, False
+            session = None
+        if hint is None:
+            for shown_attempt, shown_answer, shown_hint in session[1] if session is not None else ():
+                yield element, shown_answer, shown_hint, 0 < attempt - shown_attempt <= attempts
+            continue
+        if session is None:
+            session = [attempt, []]
+        session[0] = attempt
+        # hints shown `attempts` submissions ago or more can no longer be followed by a solution in time
+        while session[1] and attempt - session[1][0][0] >= attempts:
+            _, shown_answer, shown_hint = session[1].pop(0)
+            yield element, shown_answer, shown_hint, False
+        session[1].append((attempt, answer, hint))
+        sessions[(user, element)] = session
+        if len(sessions) > max_open:
+            (_, old_element), old_session = sessions.popitem(last=False)
+            for _, shown_answer, shown_hint in old_session[1]:
+                yield old_element, shown_answer, shown_hint, False
+    for (_, element), session in sessions.items():
+        for _, shown_answer, shown_hint in session[1]:
+            yield element, shown_answer, shown_hint, False
+
+
+def count_conversions(outcomes):
+    """
+    Return the {(element, answer, hint id): [shown, solved]} counts of outcomes.
+    """
+    counts = {}
+    for element, answer, hint, solved in outcomes:
+        count = counts.get((element, answer, hint))
+        if count is None:
+            count = counts[(element, answer, hint)] = [0, 0]
+        count[0] += 1
+        if solved:
+            count[1] += 1
+    return counts
+
+
+def write_conversions(kvs, counts, source, batch_size=5000):
+    """
+    Write counts of conversions to a hint storage as the conversions of `source` of the hints, with
+    HintStorage.bulk_update, `batch_size` hints at a time. The counts of hints that are not stored
+    for their answer, such as generic hints, are left out.
+
+    Returns the number of hints written.
+    """
+    importer = Importer(kvs, batch_size)
+    storage = None
+    for (element, answer, hint), (shown, solved) in sorted(counts.items()):
+        if storage is None or storage.namespace != element:
+            storage = HintStorage(kvs, element)
+        if storage.has_hint(answer, hint):
+            importer.add({
+                "element": element, "answer": answer, "hint_id": hint,
+                "conversions": {source: {"shown": shown, "solved": solved}},
+            })
+    importer.flush()
+    return importer.count
+
+
+def write_counts(counts, lines):
+    """
+    Write counts of conversions as JSON lines, one hint per line, with its conversion rate.
+    """
+    for (element, answer, hint), (shown, solved) in sorted(counts.items()):
+        lines.write(json.dumps(OrderedDict((
+            ("element", element), ("answer", answer), ("hint_id", hint),
+            ("shown", shown), ("solved", solved), ("conversion", round(solved / float(shown), 4)),
+        ))) + u'\n')
+
+
+def default_source(paths):
+    return hashlib.sha1(u'\n'.join(sorted(os.path.basename(path) for path in paths)).encode('utf8')).hexdigest()[:12]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='crowdsourcehinter-analytics',
+        description="Count how often crowdsourced hints were followed by a solution.",
+    )
+    parser.add_argument('logs', nargs='+', metavar='LOG', help="tracking log file")
+    parser.add_argument(
+        '--attempts', type=int, default=ATTEMPTS, help="submissions after a hint within which a solution counts"
+    )
+    parser.add_argument('--max-open', type=int, default=MAX_OPEN, help="students with unresolved hints kept in memory")
+    parser.add_argument(
+        '--source', help="name of the counts in the hint storage (a digest of the names of the logs by default)"
+    )
+    parser.add_argument(
+        '--output', metavar='FILE', help="write the counts of every hint as JSON lines ('-' for standard output)"
+    )
+    store = parser.add_mutually_exclusive_group()
+    store.add_argument('--store', help="SQLite file holding the hint storage")
+    store.add_argument(
+        '--store-factory', metavar='MODULE:CALLABLE', help="function returning the hint storage's key-value store"
+    )
+    parser.add_argument('--batch-size', type=int, default=5000, help="number of hints written at once")
+    args = parser.parse_args(argv)
+    if not (args.output or args.store or args.store_factory):
+        parser.error("one of --output, --store or --store-factory is required")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    start = time.time()
+    events = hinter_events(merge_events([read_events(path, EVENT_MARKER) for path in args.logs]))
+    counts = count_conversions(outcomes(events, args.attempts, args.max_open))
+    showings = sum(count[0] for count in counts.values())
+    log.info("counted %d showings of %d hints in %.1fs", showings, len(counts), time.time() - start)
+    if args.output == '-':
+        write_counts(counts, sys.stdout)
+    elif args.output:
+        with io.open(args.output, 'w', encoding='utf8') as lines:
+            write_counts(counts, lines)
+    if args.store or args.store_factory:
+        kvs = open_store(args)
+        try:
+            count = write_conversions(kvs, counts, args.source or default_source(args.logs), args.batch_size)
+        finally:
+            if hasattr(kvs, 'close'):
+                kvs.close()
+        log.info("wrote the conversions of %d hints", count)
+
+
+if __name__ == '__main__':
+    main()
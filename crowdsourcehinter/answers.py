@@ -0,0 +1,233 @@
+"""
+Matching of incorrect answers for the Crowd Sourced Hinter.
+
+Hints are stored for the normalized text of an incorrect answer. For an answer without hints, an
+AnswerIndex finds the known answers closest to it, so that an answer that differs from a known one
+only by a typo, punctuation or rounding gets the known answer's hints: answers with the same
+canonical form first, then numbers within a relative tolerance, then answers within a small edit
+distance.
+
+Edit distance lookups use a partition index: every canonical answer is cut into
+`max_distance + 1` parts, and an answer within distance d of it must contain at least
+`max_distance + 1 - d` of those parts unchanged, shifted by at most d characters. Only answers
+sharing enough parts with the query are compared with it, which keeps lookups well under a
+millisecond with hundreds of thousands of answers.
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from .cache import LRUCache
+
+_NOT_WORD = re.compile(r'[^\w\s]', re.UNICODE)
+
+
+def normalize_answer(answer):
+    """
+    Return the form of an incorrect answer that is used to key hints: lower case, with
+    surrounding whitespace removed and inner whitespace collapsed to single spaces.
+    """
+    return u" ".join(answer.lower().split())
+
+
+def parse_number(answer):
+    """
+    Return the value of an answer that is a number (commas and spaces allowed as thousands
+    separators), or None.
+    """
+    try:
+        value = float(answer.replace(u',', u'').replace(u' ', u''))
+    except ValueError:
+        return None
+    if value != value or value in (float('inf'), float('-inf')):
+        return None
+    return value
+
+
+def canonicalize_answer(answer):
+    """
+    Return the canonical form of an answer: numbers are written with 6 significant digits,
+    and other answers are normalized with their punctuation removed.
+    """
+    answer = normalize_answer(answer)
+    value = parse_number(answer)
+    if value is not None:
+        return u'%.6g' % value
+    return u" ".join(_NOT_WORD.sub(u' ', answer).split())
+
+
+def edit_distance(first, second, limit):
+    """
+    Return the Levenshtein distance between two strings, or limit + 1 if it is more than limit.
+    Only the diagonal band of width 2 * limit + 1 is computed, after removing the common prefix
+    and suffix of the strings.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < len(first) - start and end < len(second) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first, second = first[start:len(first) - end], second[start:len(second) - end]
+    if not first or not second:
+        return min(max(len(first), len(second)), limit + 1)
+    too_far = limit + 1
+    previous = [j if j <= limit else too_far for j in range(len(second) + 1)]
+    for i in range(1, len(first) + 1):
+        low, high = max(1, i - limit), min(len(second), i + limit)
+        current = [too_far] * (len(second) + 1)
+        if i <= limit:
+            current[0] = i
+        first_char = first[i - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (first_char != second[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost if cost < too_far else too_far
+        if min(current[low - 1:high + 1]) > limit:
+            return too_far
+        previous = current
+    return previous[-1]
+
+
+class AnswerIndex(object):
+    """
+    Index of the known answers of a hinter, for finding the ones closest to a new answer.
+
+    Args:
+      max_distance: the largest edit distance at which answers match. Shorter answers are
+                    allowed one edit per 5 characters, so that short answers do not match
+                    unrelated ones.
+      numeric_tolerance: the relative difference at which numeric answers match.
+    """
+    def __init__(self, answers=(), max_distance=2, numeric_tolerance=1e-3, revision=None):
+        self.max_distance = max_distance
+        self.numeric_tolerance = numeric_tolerance
+        self.revision = revision
+        # canonical form -> answers with that form
+        self._canonical = defaultdict(list)
+        # (length, part number, part text) -> canonical forms with that part
+        self._parts = defaultdict(set)
+        # values of the numeric answers, sorted, and the answers in the same order
+        self._values = []
+        self._numbers = []
+        # answers are added while requests look answers up
+        self._lock = threading.Lock()
+        for answer in answers:
+            self.add(answer)
+
+    def __len__(self):
+        return sum(len(answers) for answers in self._canonical.values())
+
+    def _bounds(self, length):
+        parts = self.max_distance + 1
+        return [length * part // parts for part in range(parts + 1)]
+
+    def add(self, answer):
+        canonical = canonicalize_answer(answer)
+        with self._lock:
+            self._add(canonical, answer)
+
+    def _add(self, canonical, answer):
+        if answer in self._canonical[canonical]:
+            return
+        self._canonical[canonical].append(answer)
+        value = parse_number(normalize_answer(answer))
+        if value is not None:
+            position = bisect.bisect_right(self._values, value)
+            self._values.insert(position, value)
+            self._numbers.insert(position, answer)
+        elif len(self._canonical[canonical]) == 1:
+            bounds = self._bounds(len(canonical))
+            for part in range(len(bounds) - 1):
+                self._parts[(len(canonical), part, canonical[bounds[part]:bounds[part + 1]])].add(canonical)
+
+    def _similar(self, canonical):
+        """
+        Return [(distance, canonical form)] of the indexed forms within the allowed edit distance.
+        """
+        distance = min(self.max_distance, len(canonical) // 5)
+        if not distance:
+            return []
+        matched_parts = defaultdict(set)
+        for length in range(len(canonical) - distance, len(canonical) + distance + 1):
+            bounds = self._bounds(length)
+            for part in range(len(bounds) - 1):
+                start, end = bounds[part], bounds[part + 1]
+                for shift in range(-distance, distance + 1):
+                    if start + shift < 0 or end + shift > len(canonical):
+                        continue
+                    for candidate in self._parts.get((length, part, canonical[start + shift:end + shift]), ()):
+                        matched_parts[candidate].add(part)
+        needed = self.max_distance + 1 - distance
+        similar = []
+        for candidate, parts in matched_parts.items():
+            if len(parts) >= needed and candidate != canonical:
+                candidate_distance = edit_distance(canonical, candidate, distance)
+                if candidate_distance <= distance:
+                    similar.append((candidate_distance, candidate))
+        return sorted(similar)
+
+    def match(self, answer):
+        """
+        Return the known answers that match an answer, closest first. The answer itself is
+        included if it is known.
+        """
+        canonical = canonicalize_answer(answer)
+        value = parse_number(normalize_answer(answer))
+        with self._lock:
+            return self._match(canonical, value)
+
+    def _match(self, canonical, value):
+        matches = list(self._canonical.get(canonical, ()))
+        if value is not None:
+            tolerance = abs(value) * self.numeric_tolerance
+            start = bisect.bisect_left(self._values, value - tolerance)
+            end = bisect.bisect_right(self._values, value + tolerance)
+            numbers = sorted(range(start, end), key=lambda position: abs(self._values[position] - value))
+            matches.extend(self._numbers[position] for position in numbers if self._numbers[position] not in matches)
+        else:
+            for _, similar in self._similar(canonical):
+                matches.extend(self._canonical[similar])
+        return matches
+
+
+# Answer indexes of this process, keyed by namespace.
+ANSWER_INDEXES = LRUCache(maxsize=100)
+# Threads building answer indexes (see build_index), keyed by namespace, and the lock that guards them.
+_BUILDING = {}
+_BUILDING_LOCK = threading.Lock()
+
+
+def build_index(namespace, answers, revision):
+    """
+    Start a thread that builds the AnswerIndex of a namespace and caches it in ANSWER_INDEXES, unless one
+    is building it already. An index of 100000 answers takes seconds to build, which requests do not wait for.
+
+    Args:
+      answers: a function returning the answers to index, which is called before the thread starts
+      revision: the revision of the answers
+
+    Returns the thread building the index.
+    """
+    with _BUILDING_LOCK:
+        thread = _BUILDING.get(namespace)
+        if thread is not None:
+            return thread
+        thread = _BUILDING[namespace] = threading.Thread(target=_build_index, args=(namespace, answers(), revision))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _build_index(namespace, answers, revision):
+    try:
+        ANSWER_INDEXES.set(namespace, AnswerIndex(answers, revision=revision))
+    finally:
+        with _BUILDING_LOCK:
+            del _BUILDING[namespace]
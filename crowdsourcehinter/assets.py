@@ -0,0 +1,136 @@
+"""
+Static assets of the Crowd Sourced Hinter, cached for the lifetime of the process.
+
+Assets are read from the package once, on first use, and the CSS and JavaScript are minified
+and concatenated into one bundle each, which the views add inline to their fragments. The
+minifiers tokenize their input, so strings, template literals, regular expressions and URLs are
+never mistaken for comments.
+"""
+import re
+import threading
+
+import pkg_resources
+
+# The bundles of the hinter, as lists of the files they are made of, in order.
+BUNDLES = {
+    'css': ["static/css/crowdsourcehinter.css"],
+    'js': ["static/js/src/crowdsourcehinter.js"],
+}
+
+# Strings and comments of a stylesheet, and the code between them.
+_CSS_TOKEN = re.compile(r"""
+    (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<comment>/\*.*?\*/)
+  | (?P<code>[^"'/]+|/)
+""", re.DOTALL | re.VERBOSE)
+_CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+
+# Tokens of a script: whitespace, comments, strings, slashes (which start a regular expression or
+# are a division) and the code between them.
+_JS_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+  | (?P<slash>/)
+  | (?P<code>[^\s/"'`]+|.)
+""", re.DOTALL | re.VERBOSE)
+_JS_REGEX = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+# A slash starts a regular expression after one of these characters or keywords, and is a division otherwise.
+_JS_BEFORE_REGEX = tuple('(,=:[!&|?{};+-*%<>~^')
+_JS_KEYWORDS_BEFORE_REGEX = frozenset([
+    'return', 'typeof', 'case', 'do', 'else', 'in', 'new', 'delete', 'void', 'throw',
+])
+
+
+def minify_css(css):
+    """
+    Remove the comments and the whitespace that is not needed from a stylesheet. Strings are kept as they are.
+    """
+    chunks = []
+    code = []
+    for token in _CSS_TOKEN.finditer(css):
+        if token.lastgroup == 'code':
+            code.append(token.group())
+        elif token.lastgroup == 'string':
+            chunks.append((code, token.group()))
+            code = []
+    chunks.append((code, ''))
+    minified = []
+    for code, string in chunks:
+        code = _CSS_SPACE.sub(r'\1', ''.join(code))
+        minified.append(re.sub(r'\s+', ' ', code).replace(';}', '}'))
+        minified.append(string)
+    return ''.join(minified).strip()
+
+
+def minify_js(js):
+    """
+    Remove the comments, the indentation and the blank lines of a script, and collapse other whitespace
+    to one space. Strings, template literals and regular expressions are kept as they are, and line breaks
+    are kept so that no statement runs into the next.
+    """
+    minified = []
+    space = None
+    previous = None
+    position = 0
+    while position < len(js):
+        token = _JS_TOKEN.match(js, position)
+        kind, text = token.lastgroup, token.group()
+        if kind == 'slash' and (
+                previous is None or previous.endswith(_JS_BEFORE_REGEX) or previous in _JS_KEYWORDS_BEFORE_REGEX
+        ):
+            regex = _JS_REGEX.match(js, position)
+            if regex is not None:
+                kind, text = 'regex', regex.group()
+        position += len(text)
+        if kind in ('space', 'comment'):
+            if '\n' in text or text.startswith('//'):
+                space = '\n'
+            elif space is None:
+                space = ' '
+            continue
+        if space is not None and minified:
+            minified.append(space)
+        space = None
+        minified.append(text)
+        previous = text
+    return ''.join(minified) + '\n'
+
+
+class AssetCache(object):
+    """
+    Assets of the hinter, read from the package once and kept in memory.
+    """
+    MINIFIERS = {'css': minify_css, 'js': minify_js}
+
+    def __init__(self, package):
+        self.package = package
+        self._assets = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key, load):
+        asset = self._assets.get(key)
+        if asset is None:
+            with self._lock:
+                asset = self._assets.get(key)
+                if asset is None:
+                    asset = self._assets[key] = load()
+        return asset
+
+    def text(self, path):
+        """
+        Return the content of a file of the package.
+        """
+        return self._get(path, lambda: pkg_resources.resource_string(self.package, path).decode("utf8"))
+
+    def bundle(self, kind):
+        """
+        Return the minified and concatenated content of the 'css' or 'js' files.
+        """
+        def load():
+            minify = self.MINIFIERS[kind]
+            return "\n".join(minify(self.text(path)) for path in BUNDLES[kind])
+        return self._get(('bundle', kind), load)
+
+
+ASSETS = AssetCache(__name__)
@@ -0,0 +1,204 @@
+"""
+Bulk import and export of the hints of many hinters, as JSON lines.
+
+Every line is one hint of one hinter:
+
+  {"element": "i4x://edX/DemoX/problem/Text_Input", "answer": "michiganp", "hint": "remove the p", "rating": 0}
+
+with the optional "counter", "impressions", "conversions", "reporters" and "removed" fields of
+HintStorage.bulk_update. A line with only a "hint" adds it with a rating of 0. A hint can be given
+by its "hint_id" (see storage.hint_id) instead of its text, as exports do for removed hints, whose
+text is not kept. Hints that are reported but not stored are exported without a rating, and are
+imported as reports only. The "element" is the hinter's Element (or its usage id, if it has no
+Element), which is the namespace of its hints in the hint storage. An export writes a block's hints
+grouped by answer, and can be imported again; imports are idempotent, since votes are merged as
+conflict-free counters.
+
+Imports are streamed: lines are read one at a time and written in batches of `batch_size` hints,
+with one write per answer in the batch, so memory does not depend on the size of the input.
+Exports read one answer's shard at a time. Consecutive lines for the same hinter and answer
+(as exports write them) make the fewest writes.
+
+Usage:
+  crowdsourcehinter-hints export --store hints.sqlite [--element ELEMENT ...] [FILE]
+  crowdsourcehinter-hints import --store hints.sqlite [--batch-size 5000] [FILE]
+
+--store is an SQLite file (see storage.SqliteKeyValueStore). --store-factory module:callable
+uses the key-value store returned by a function instead, such as the one a runtime provides as
+its 'hint_storage' service. Blocks in a runtime without the service keep their hints in their
+hint_shards field, which neither command reads or writes.
+"""
+import argparse
+import importlib
+import io
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+from .storage import NAMESPACES_KEY, HintStorage, SqliteKeyValueStore
+
+log = logging.getLogger(__name__)
+
+META_SUFFIX = u':meta'
+
+
+def namespaces(kvs):
+    """
+    Iterate over the namespaces (Elements) of the hinters in a key-value store: those in the list of
+    NAMESPACES_KEY and, if the store can list its keys (like SqliteKeyValueStore), those of every meta
+    key, which include the hinters migrated before the list was kept.
+    """
+    listed = kvs.get(NAMESPACES_KEY, [])
+    for namespace in listed:
+        yield namespace
+    if hasattr(kvs, 'keys'):
+        listed = set(listed)
+        for key in kvs.keys(META_SUFFIX):
+            if key[:-len(META_SUFFIX)] not in listed:
+                yield key[:-len(META_SUFFIX)]
+
+
+def export_hints(kvs, elements, lines):
+    """
+    Write the hints of hinters as JSON lines.
+
+    Args:
+      kvs: the key-value store of the hint storage
+      elements: the Elements of the hinters to export
+      lines: a text file to write the lines to
+
+    Returns the number of hints written.
+    """
+    count = 0
+    for element in elements:
+        for answer, changes in HintStorage(kvs, element).export():
+            for change in changes:
+                record = OrderedDict((("element", element), ("answer", answer)))
+                record.update(sorted(change.items()))
+                lines.write(json.dumps(record) + u'\n')
+                count += 1
+    return count
+
+
+class Importer(object):
+    """
+    Collects imported hints and writes them with HintStorage.bulk_update, `batch_size` hints
+    at a time.
+    """
+    def __init__(self, kvs, batch_size=5000):
+        self.kvs = kvs
+        self.batch_size = batch_size
+        self.element = None
+        self.updates = OrderedDict()
+        self.pending = 0
+        self.count = 0
+
+    def add(self, record):
+        element = record.pop('element')
+        answer = record.pop('answer')
+        if element != self.element:
+            self.flush()
+            self.element = element
+        self.updates.setdefault(answer, []).append(record)
+        self.pending += 1
+        self.count += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            storage = HintStorage(self.kvs, self.element)
+            storage.bulk_update(self.updates)
+            # the meta key records the layout of the storage, and lists the hinter for exports (see namespaces)
+            if not storage.is_migrated():
+                storage.mark_migrated()
+            if hasattr(self.kvs, 'commit'):
+                self.kvs.commit()
+        self.updates = OrderedDict()
+        self.pending = 0
+
+
+def import_hints(kvs, lines, batch_size=5000):
+    """
+    Import hints from JSON lines.
+
+    Args:
+      kvs: the key-value store of the hint storage
+      lines: an iterable of JSON lines
+      batch_size: the number of hints written at once
+
+    Returns the number of hints read.
+    """
+    importer = Importer(kvs, batch_size)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("not a JSON object")
+            importer.add(record)
+        except (ValueError, KeyError) as error:
+            raise ValueError("Line %d is not a hint: %s" % (number, error))
+    importer.flush()
+    return importer.count
+
+
+def open_store(args):
+    if args.store_factory:
+        module, name = args.store_factory.split(':')
+        return getattr(importlib.import_module(module), name)()
+    return SqliteKeyValueStore(args.store)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='crowdsourcehinter-hints', description="Import or export crowdsourced hints as JSON lines."
+    )
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    for command in ('import', 'export'):
+        subparser = commands.add_parser(command)
+        subparser.add_argument(
+            'file', nargs='?', default='-', help="the JSON lines file (standard input or output by default)"
+        )
+        store = subparser.add_mutually_exclusive_group(required=True)
+        store.add_argument('--store', help="SQLite file holding the hint storage")
+        store.add_argument(
+            '--store-factory', metavar='MODULE:CALLABLE', help="function returning the hint storage's key-value store"
+        )
+        if command == 'import':
+            subparser.add_argument('--batch-size', type=int, default=5000, help="number of hints written at once")
+        else:
+            subparser.add_argument(
+                '--element', action='append', help="Element of a hinter to export (all of them by default)"
+            )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    kvs = open_store(args)
+    start = time.time()
+    try:
+        if args.command == 'export':
+            elements = args.element or namespaces(kvs)
+            if args.file == '-':
+                count = export_hints(kvs, elements, sys.stdout)
+            else:
+                with io.open(args.file, 'w', encoding='utf8') as lines:
+                    count = export_hints(kvs, elements, lines)
+        else:
+            if args.file == '-':
+                count = import_hints(kvs, sys.stdin, args.batch_size)
+            else:
+                with io.open(args.file, encoding='utf8') as lines:
+                    count = import_hints(kvs, lines, args.batch_size)
+    finally:
+        if hasattr(kvs, 'close'):
+            kvs.close()
+    log.info("%sed %d hints in %.1fs", args.command, count, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
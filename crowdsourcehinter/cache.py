@@ -0,0 +1,167 @@
+"""
+Process-level caches of the Crowd Sourced Hinter.
+
+Besides the caches of derived data (rankings, answer indexes, hint texts, bundles), the values of
+the hint storage are cached in the process (see CachedKeyValueStore), so that requests for the
+same hinter mostly read its version from the key-value store and nothing else.
+"""
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe dictionary holding at most `maxsize` items, dropping the least recently used.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value = self._items.pop(key)
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class VersionedCache(object):
+    """
+    A thread-safe cache of serialized values shared by the requests of a process, holding at
+    most `max_bytes` of values (values larger than `max_bytes` / 8 are not cached) and dropping
+    the least recently used. Every value is stored with the version of the data it was read
+    from, and is only returned for that version. `hits`, `misses` and `evictions` count what the
+    cache did since it was created.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        # key -> (version, serialized value)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Return the serialized value of a key stored for `version`, or None.
+        """
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            del self._items[key]
+            self._items[key] = entry
+            return entry[1]
+
+    def set(self, key, version, serialized):
+        size = len(key) + len(serialized)
+        if size > self.max_bytes // 8:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(key) + len(old[1])
+            self._items[key] = (version, serialized)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, (_, old_value) = self._items.popitem(last=False)
+                self.bytes -= len(old_key) + len(old_value)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._items),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class CachedKeyValueStore(object):
+    """
+    Reads a key-value store through a VersionedCache, for the lifetime of one request.
+
+    The data of a block has a version, stored under `version_key`: a counter, with a random
+    suffix so that concurrent writers never store the same version. Every write through this
+    class stores a new version after the values. The version is read once, by the first read,
+    and cached values are only used if they were read at that version, so a request never sees
+    values older than the last write that completed before it started. Values that a request
+    reads after its own write are cached for its new version; values it wrote are not cached,
+    since another process may have overwritten them before the version was stored.
+
+    Keys starting with one of the `uncached` prefixes are read and written directly, without
+    changing the version, for values that are written often and read rarely. Every writer of a
+    store that is read through a cache must write through this class.
+    """
+    def __init__(self, kvs, version_key, cache, uncached=()):
+        self.kvs = kvs
+        self.version_key = version_key
+        self.cache = cache
+        self.uncached = tuple(uncached) + (version_key,)
+        self._version = None
+        self._version_read = False
+
+    def version(self):
+        if not self._version_read:
+            self._version = self.kvs.get(self.version_key)
+            self._version_read = True
+        return self._version
+
+    def get(self, key, default=None):
+        version = self.version()
+        if version is None or key.startswith(self.uncached):
+            return self.kvs.get(key, default)
+        serialized = self.cache.get(key, version)
+        if serialized is not None:
+            value = json.loads(serialized)
+        else:
+            value = self.kvs.get(key)
+            self.cache.set(key, version, json.dumps(value))
+        return default if value is None else value
+
+    def _bump(self):
+        version = self.version()
+        counter = int(version.split(u'.')[0]) + 1 if version else 1
+        self._version = u'%d.%s' % (counter, uuid.uuid4().hex[:8])
+        self.kvs.set(self.version_key, self._version)
+
+    def set(self, key, value):
+        self.kvs.set(key, value)
+        if not key.startswith(self.uncached):
+            self._bump()
+
+    def set_many(self, values):
+        """
+        Write many {key: value} with one new version, with one call if the key-value store has set_many.
+        """
+        if hasattr(self.kvs, 'set_many'):
+            self.kvs.set_many(values)
+        else:
+            for key, value in values.items():
+                self.kvs.set(key, value)
+        self._bump()
+
+    def delete(self, key):
+        self.kvs.delete(key)
+        if not key.startswith(self.uncached):
+            self._bump()
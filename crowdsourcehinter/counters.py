@@ -0,0 +1,346 @@
+"""
+Conflict-free vote counters for the Crowd Sourced Hinter.
+
+Votes are kept as PN-counters: every replica (worker) only ever increases its own up and down
+totals, and the counters of different replicas are merged by taking the maximum of each
+replica's totals. Merging is commutative and idempotent, so writes from different workers can
+be applied in any order, and a write that is lost to a concurrent one is restored by the next
+flush of the same replica.
+
+Votes are first collected in a VoteBuffer in the worker process and added to the hint storage
+in batches. The buffer also counts impressions, the number of times each hint was shown, as
+grow-only counters of every replica, which are written with the votes of their answer or, for
+answers without votes, less often. Every flush updates the index of the answers shown most
+often of the hinters it writes.
+
+Every process has a replica id of its own (see worker_replica), since two processes writing the
+totals of the same replica would overwrite each other's votes. The totals of replicas that have
+not written a shard for REPLICA_TTL seconds, such as those of processes that were restarted, are
+folded into those of MERGED_REPLICA when the shard is compacted (see HintStorage.compact), which
+keeps the number of replicas in a counter bounded.
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+import weakref
+
+# Environment variable setting the replica id of this process' VOTE_BUFFER, for deployments that
+# name their workers themselves. Every process must have an id of its own.
+REPLICA_ENV = 'CROWDSOURCEHINTER_REPLICA'
+
+# Replica into which the totals of idle replicas are folded, and how long a replica must have been idle.
+MERGED_REPLICA = u'merged'
+REPLICA_TTL = 24 * 60 * 60
+
+
+def worker_replica():
+    """
+    Return a replica id for the VoteBuffer of this process: 12 random hex digits, so that processes
+    never share an id, even on hosts (or containers) with the same name and process ids, and the
+    id, which is stored in every counter the process writes, stays short.
+    """
+    return u'%s' % uuid.uuid4().hex[:12]
+
+
+def _flush_when_woken(ref, wake, interval):
+    """
+    Body of the flusher thread of a VoteBuffer: flush the buffer when it is woken, and whenever
+    it is due, checking at least every `interval` seconds, until the buffer is garbage collected.
+    """
+    while True:
+        wake.wait(interval)
+        wake.clear()
+        vote_buffer = ref()
+        if vote_buffer is None:
+            return
+        if vote_buffer.is_due():
+            vote_buffer.flush()
+        del vote_buffer
+
+
+class PNCounter(object):
+    """
+    A counter that can be incremented and decremented by several replicas independently.
+    `p` and `n` map a replica id to the total of increments and decrements made by it.
+    """
+    def __init__(self, p=None, n=None):
+        self.p = dict(p or {})
+        self.n = dict(n or {})
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(value.get('p'), value.get('n'))
+
+    def to_json(self):
+        return {'p': self.p, 'n': self.n}
+
+    def add(self, replica, amount):
+        """
+        Count `amount` (which may be negative) on behalf of a replica.
+        """
+        if amount > 0:
+            self.p[replica] = self.p.get(replica, 0) + amount
+        elif amount < 0:
+            self.n[replica] = self.n.get(replica, 0) - amount
+
+    def merge(self, other):
+        """
+        Merge another counter into this one, keeping the highest total of every replica.
+        """
+        for mine, theirs in ((self.p, other.p), (self.n, other.n)):
+            for replica, total in theirs.items():
+                if total > mine.get(replica, 0):
+                    mine[replica] = total
+        return self
+
+    def fold(self, replicas, into=MERGED_REPLICA):
+        """
+        Move the totals of `replicas` into those of the replica `into`.
+        """
+        for totals in (self.p, self.n):
+            for replica in replicas:
+                if replica in totals and replica != into:
+                    totals[into] = totals.get(into, 0) + totals.pop(replica)
+        return self
+
+    @property
+    def ups(self):
+        return sum(self.p.values())
+
+    @property
+    def downs(self):
+        return sum(self.n.values())
+
+    @property
+    def value(self):
+        return self.ups - self.downs
+
+
+class VoteBuffer(object):
+    """
+    Buffer of the votes counted by this process, added to the hint storage in batches.
+
+    The buffer holds the votes and impressions that have not been written yet. A flush reads the
+    shard of every answer with votes again and adds them to this replica's stored totals. The
+    buffer is flushed once `max_pending` votes are waiting or `max_delay` seconds have passed since
+    the last flush, whichever comes first, by a thread of its own, so requests never wait for a
+    flush. Impressions of answers without votes to flush are written every `impressions_delay`
+    seconds.
+
+    The replica id is chosen (see worker_replica) when the buffer is first used in a process, so
+    that workers forked from a process that created the buffer have ids of their own.
+
+    A replica whose write read the shard before this one wrote it can overwrite this replica's
+    totals. The totals written for every answer are therefore kept and read back by the following
+    flushes, which write them again if they were overwritten, until the shard has not been written
+    for `verify_delay` seconds; then they are dropped.
+    """
+    def __init__(self, replica=None, max_pending=100, max_delay=1.0, impressions_delay=60.0, verify_delay=5.0):
+        self._replica = replica
+        self._fixed_replica = replica is not None
+        self._pid = None
+        self._flusher = None
+        self._wake = threading.Event()
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.impressions_delay = impressions_delay
+        self.verify_delay = verify_delay
+        # reentrant, since the replica id is claimed with it held
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        # (namespace, answer) -> {"hint": [upvotes, downvotes]} of this replica that have not been written
+        self._votes = {}
+        # (namespace, answer) -> {"hint": number of times this replica showed the hint, not written yet}
+        self._impressions = {}
+        # (namespace, answer) -> ({"hint": (upvotes, downvotes)}, {"hint": impressions}), this replica's
+        # totals as last written, for the answers whose totals may still be overwritten
+        self._written = {}
+        # (namespace, answer) -> key-value store, for the answers with unflushed votes
+        self._dirty = {}
+        # (namespace, answer) -> key-value store, for the answers with only unflushed impressions
+        self._shown = {}
+        # (namespace, answer) -> (key-value store, revision of the shard, time it was first read back),
+        # for the answers whose totals may still be overwritten
+        self._unverified = {}
+        self._pending = 0
+        self._last_flush = self._last_impressions_flush = time.time()
+
+    @property
+    def replica(self):
+        if not self._fixed_replica and self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._replica = worker_replica()
+                    self._pid = os.getpid()
+        return self._replica
+
+    def add(self, kvs, namespace, answer, hint, amount):
+        """
+        Count a vote of `amount` for a hint. A vote of 0 only records that the hint exists.
+        """
+        with self._lock:
+            votes = self._votes.setdefault((namespace, answer), {}).setdefault(hint, [0, 0])
+            votes[0 if amount > 0 else 1] += abs(amount)
+            self._dirty[(namespace, answer)] = kvs
+            self._shown.pop((namespace, answer), None)
+            self._pending += 1
+
+    def show(self, kvs, namespace, answer, hint):
+        """
+        Count an impression of a hint. Impressions do not count towards `max_pending`.
+        """
+        with self._lock:
+            impressions = self._impressions.setdefault((namespace, answer), {})
+            impressions[hint] = impressions.get(hint, 0) + 1
+            if (namespace, answer) not in self._dirty:
+                self._shown[(namespace, answer)] = kvs
+
+    def _counter_totals(self, key, stored):
+        # the highest of the stored and written totals of this replica, plus its unwritten votes
+        replica = self.replica
+        written = self._written.get(key, ({}, {}))[0]
+        votes = self._votes.get(key, {})
+        totals = {}
+        for hint in set(written).union(votes):
+            counter = stored.get(hint, {})
+            ups, downs = written.get(hint, (0, 0))
+            ups = max(counter.get('p', {}).get(replica, 0), ups) + votes.get(hint, (0, 0))[0]
+            downs = max(counter.get('n', {}).get(replica, 0), downs) + votes.get(hint, (0, 0))[1]
+            totals[hint] = PNCounter({replica: ups} if ups else {}, {replica: downs} if downs else {})
+        return totals
+
+    def _impression_totals(self, key, stored):
+        written = self._written.get(key, ({}, {}))[1]
+        impressions = self._impressions.get(key, {})
+        return dict(
+            (hint, max(stored.get(hint, {}).get(self.replica, 0), written.get(hint, 0)) + impressions.get(hint, 0))
+            for hint in set(written).union(impressions)
+        )
+
+    def counters(self, namespace, answer, stored):
+        """
+        Return this replica's totals for the hints of an answer that it has voted on since they
+        were last verified, as {"hint": PNCounter}, given the stored {"hint": PNCounter JSON}.
+        """
+        with self._lock:
+            return self._counter_totals((namespace, answer), stored)
+
+    def impressions(self, namespace, answer, stored):
+        """
+        Return this replica's impressions of the hints of an answer that it has shown since they were
+        last verified, as {"hint": count}, given the stored {"hint": {"replica": count}}.
+        """
+        with self._lock:
+            return self._impression_totals((namespace, answer), stored)
+
+    def has_pending(self):
+        return bool(self._dirty or self._shown or self._unverified)
+
+    def is_due(self):
+        now = time.time()
+        return self._pending >= self.max_pending or (
+            bool(self._dirty or self._unverified) and now - self._last_flush >= self.max_delay
+        ) or (
+            bool(self._shown) and now - self._last_impressions_flush >= self.impressions_delay
+        )
+
+    def flush_if_due(self):
+        """
+        Wake the flusher thread of the buffer if the buffer is due, starting the thread if this
+        process has none.
+        """
+        if not self.is_due():
+            return
+        if self._flusher is None or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._flusher = threading.Thread(
+                        target=_flush_when_woken, args=(weakref.ref(self), self._wake, max(self.max_delay, 1.0)),
+                    )
+                    self._flusher.daemon = True
+                    self._flusher.start()
+        self._wake.set()
+
+    def flush(self, impressions=False):
+        """
+        Write this replica's votes and impressions for every answer with unflushed votes to the
+        hint storage, and for the answers with only unflushed impressions if `impressions` is True
+        or `impressions_delay` seconds have passed since they were last written. Answers whose
+        totals were overwritten by another replica, now or since the last flush, are flushed again.
+        """
+        with self._flush_lock:
+            self._flush(impressions)
+
+    def _flush(self, impressions):
+        replica = self.replica
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            unverified, self._unverified = self._unverified, {}
+            self._pending = 0
+            self._last_flush = time.time()
+            if impressions or self._last_flush - self._last_impressions_flush >= self.impressions_delay:
+                dirty.update(self._shown)
+                self._shown = {}
+                self._last_impressions_flush = self._last_flush
+        # one HintStorage per hinter, which updates the popular answers of the hinter once
+        storages = {}
+        shown = {}
+        for key, (kvs, revision, since) in unverified.items():
+            if key in dirty:
+                continue
+            namespace, answer = key
+            storage = self._storage(storages, shown, namespace, kvs)
+            current = storage.revisions([answer])[0]
+            if current != revision:
+                # the shard was written since it was checked, maybe by a write that read it before
+                written, impressions = self._written[key]
+                counters = dict(
+                    (hint, PNCounter({replica: ups}, {replica: downs})) for hint, (ups, downs) in written.items()
+                )
+                if not storage.has_counters(answer, counters, impressions, replica):
+                    dirty[key] = kvs
+                    continue
+                revision, since = current, self._last_flush
+            with self._lock:
+                if self._last_flush - since < self.verify_delay:
+                    self._unverified.setdefault(key, (kvs, revision, since))
+                else:
+                    # the stored totals include the written ones, which are no longer needed
+                    del self._written[key]
+        for key, kvs in dirty.items():
+            namespace, answer = key
+            storage = self._storage(storages, shown, namespace, kvs)
+            shard = storage.reload(answer)
+            with self._lock:
+                counters = self._counter_totals(key, shard.get('counters', {}))
+                impressions = self._impression_totals(key, shard.get('impressions', {}))
+                self._written[key] = (
+                    dict((hint, (counter.ups, counter.downs)) for hint, counter in counters.items()), impressions,
+                )
+                self._votes.pop(key, None)
+                self._impressions.pop(key, None)
+            revision = storage.merge_counters(answer, counters, impressions, replica)
+            with self._lock:
+                self._unverified[key] = (kvs, revision, self._last_flush)
+            if impressions:
+                shown[(namespace, id(kvs))].append(answer)
+        for hinter, storage in storages.items():
+            if shown[hinter]:
+                storage.update_popular(shown[hinter])
+
+    @staticmethod
+    def _storage(storages, shown, namespace, kvs):
+        # imported here because storage imports this module
+        from .storage import HintStorage
+        hinter = (namespace, id(kvs))
+        if hinter not in storages:
+            storages[hinter] = HintStorage(kvs, namespace)
+            shown[hinter] = []
+        return storages[hinter]
+
+
+# Votes counted by this process.
+VOTE_BUFFER = VoteBuffer(os.environ.get(REPLICA_ENV) or None)
+atexit.register(VOTE_BUFFER.flush, True)
@@ -1,17 +1,28 @@
 import ast
 import logging
-import operator
-import pkg_resources
 import random
-import json
 import copy
 
 from xblock.core import XBlock
+from xblock.exceptions import JsonHandlerError
 from xblock.fields import Scope, Dict, List, Boolean, String
 from xblock.fragment import Fragment
 
+from .answers import normalize_answer
+from .assets import ASSETS
+from .counters import VOTE_BUFFER
+from .metrics import INSTRUMENTATION, instrumented, metered, span
+from .prefetch import cached_bundle, get_bundle
+from .retention import DEFAULT_RETENTION
+from .state import MAX_HISTORY, add_to_history, add_vote
+from .storage import STORAGE_CACHE, HintStorage, FieldKeyValueStore, hint_id
+
 log = logging.getLogger(__name__)
 
+# The largest number of ratings that rate_hints applies in one request.
+MAX_BATCHED_RATINGS = 50
+
+@XBlock.wants('hint_storage')
 class CrowdsourceHinter(XBlock):
     """
     This is the Crowd Sourced Hinter XBlock. This Xblock seeks to provide students with hints
@@ -22,15 +33,23 @@ class CrowdsourceHinter(XBlock):
     # has a corresponding dictionary (in which hints are keys and the hints' ratings are the values).
     #
     # Example: {"computerr": {"You misspelled computer, remove the last r.": 5}}
+    #
+    # This is the legacy layout. Hints are now kept in a HintStorage (see get_hint_storage), and hint_database
+    # is only read once, to migrate its contents.
     hint_database = Dict(default={}, scope=Scope.user_state_summary)
-    # Database of initial hints, set by the course instructor. If initial hints are set by the instructor, hint_database's contents
-    # will become identical to initial_hints. The datastructure for initial_hints is the same as for hint_databsae,
-    # {"incorrect_answer": {"hint": rating}}
+    # Hint shards, used as the key-value store of the HintStorage when the runtime does not provide a
+    # 'hint_storage' service. The keys and values are described in storage.HintStorage.
+    hint_shards = Dict(default={}, scope=Scope.user_state_summary)
+    # Database of initial hints, set by the course instructor. If initial hints are set by the instructor, they are
+    # migrated into the hint storage the first time it is used. The datastructure for initial_hints is the same as
+    # for hint_databsae, {"incorrect_answer": {"hint": rating}}
     initial_hints = Dict(default={}, scope=Scope.content)
     # This is a list of incorrect answer submissions made by the student. this list is mostly used for
     # feedback, to find which incorrect answer's hint a student voted on.
     #
     # Example: ["personal computer", "PC", "computerr"]
+    #
+    # This is the legacy layout, read once to move its contents to hint_history.
     WrongAnswers = List([], scope=Scope.user_state)
     # A dictionary of generic_hints. default hints will be shown to students when there are no matches with the
     # student's incorrect answer within the hint_database dictionary (i.e. no students have made hints for the
@@ -43,16 +62,34 @@ class CrowdsourceHinter(XBlock):
     # multiple times)
     #
     # Example: ["You misspelled computer, remove the last r."]
+    #
+    # This is the legacy layout, read once to move its contents to hint_history.
     Used = List([], scope=Scope.user_state)
+    # The incorrect answers the student submitted since the last feedback stage, with the id (see storage.hint_id)
+    # of the hint shown for each, or None if there was no hint. This replaces WrongAnswers and Used, and only
+    # the first and the last few pairs are kept (see state.MAX_HISTORY).
+    #
+    # Example: [["computerr", "3f786850e387"], ["pc", None]]
+    hint_history = List(default=[], scope=Scope.user_state)
     # This list is used to prevent students from voting multiple times on the same hint during the feedback stage.
     # i believe this will also prevent students from voting again on a particular hint if they were to return to
     # a particular problem later
+    #
+    # This is the legacy layout, read once to move its contents to voted_hints.
     Voted = List(default=[], scope=Scope.user_state)
+    # The ids of the hints the student has voted on, numbered in the order of the votes, which prevents voting
+    # multiple times on the same hint. This replaces Voted, and only the latest votes are kept (see state.MAX_VOTED).
+    #
+    # Example: {"3f786850e387": 1}
+    voted_hints = Dict(default={}, scope=Scope.user_state)
     # This is a dictionary of hints that have been reported. the values represent the incorrect answer submission, and the
     # keys are the hints the corresponding hints. hints with identical text for differing answers will all not show up for the
     # student.
     #
     # Example: {"desk": "You're completely wrong, the answer is supposed to be computer."}
+    #
+    # This is the legacy layout. Reports are now kept in the hint storage, with the reporters of each hint and
+    # an index of the reported hints of each answer, and Reported is only read once, to migrate its contents.
     Reported = Dict(default={}, scope=Scope.user_state_summary)
     # This string determines whether or not to show only the best (highest rated) hint to a student
     # When set to 'True' only the best hint will be shown to the student.
@@ -71,18 +108,25 @@ class CrowdsourceHinter(XBlock):
         """
         html = self.resource_string("static/html/crowdsourcehinterstudio.html")
         frag = Fragment(html.format(self=self))
-        frag.add_javascript_url('//cdnjs.cloudflare.com/ajax/libs/mustache.js/0.8.1/mustache.min.js')
-        frag.add_css(self.resource_string("static/css/crowdsourcehinter.css"))
-        frag.add_javascript(self.resource_string("static/js/src/crowdsourcehinter.js"))
+        self.add_assets(frag)
         frag.initialize_js('CrowdsourceHinter')
         return frag
 
     def resource_string(self, path):
         """
-        This function is used to get the path of static resources.
+        This function is used to get the content of static resources. Resources are read from the package
+        only once per process.
+        """
+        return ASSETS.text(path)
+
+    def add_assets(self, frag):
+        """
+        Add the hinter's scripts and stylesheets to a fragment. Our CSS and JS are added from the process'
+        asset cache, already minified, and the bundled mustache.js is served by the runtime rather than a CDN.
         """
-        data = pkg_resources.resource_string(__name__, path)
-        return data.decode("utf8")
+        frag.add_javascript_url(self.runtime.local_resource_url(self, "public/3rdParty/mustache.js"))
+        frag.add_css(ASSETS.bundle('css'))
+        frag.add_javascript(ASSETS.bundle('js'))
 
     def get_user_is_staff(self):
         """
@@ -92,42 +136,102 @@ class CrowdsourceHinter(XBlock):
         """
         return self.xmodule_runtime.user_is_staff
 
+    def get_hint_storage(self):
+        """
+        Return the HintStorage holding this block's hints. The 'hint_storage' runtime service is used
+        as its key-value store if available, read through the process' STORAGE_CACHE, with votes buffered in
+        the worker process and written in batches. Otherwise the hint_shards field is used, and votes are
+        written with the rest of the block; the field is saved whole, so of concurrent requests that change
+        it, only the last one saved keeps its changes (see FieldKeyValueStore). It is not read through
+        STORAGE_CACHE, since the runtime loads all of it to read even its version.
+        A storage of an older layout is upgraded, and the first time each block uses the storage, the block's
+        hints are merged into it from hint_database (or from initial_hints if hint_database is empty). The
+        storage is compacted with the DEFAULT_RETENTION policy as it is written (see retention.py).
+        """
+        storage = getattr(self, '_hint_storage', None)
+        if storage is None:
+            kvs = self.runtime.service(self, 'hint_storage')
+            if kvs is None:
+                kvs = FieldKeyValueStore(self, 'hint_shards')
+                storage = HintStorage(
+                    metered(kvs), self.get_hint_namespace(), retention=DEFAULT_RETENTION, cache=None,
+                    texts_in_shards=True,
+                )
+            else:
+                storage = HintStorage(metered(kvs), self.get_hint_namespace(), VOTE_BUFFER, DEFAULT_RETENTION)
+            if storage.is_migrated() and not storage.is_upgraded():
+                storage.upgrade()
+            block = str(self.scope_ids.usage_id)
+            if not storage.is_migrated(block):
+                storage.migrate(self.hint_database or self.initial_hints, self.Reported, block)
+            self._hint_storage = storage
+        return storage
+
+    def get_hint_namespace(self):
+        """
+        Return the prefix of this block's keys in the hint storage. Hints belong to the problem being
+        hinted, so hinters for the same Element (e.g. in reruns of a course) share their hints.
+        """
+        if self.Element:
+            return self.Element
+        return str(self.scope_ids.usage_id)
+
     def student_view(self, context=None):
         """
         This view renders the hint view to the students. The HTML has the hints templated
-        in, and most of the remaining functionality is in the JavaScript.
+        in, and most of the remaining functionality is in the JavaScript. The JavaScript is given
+        the prefetched hints (see prefetch_data).
         """
         html = self.resource_string("static/html/crowdsourcehinter.html")
         frag = Fragment(html)
-        frag.add_javascript_url('//cdnjs.cloudflare.com/ajax/libs/mustache.js/0.8.1/mustache.min.js')
-        frag.add_css(self.resource_string("static/css/crowdsourcehinter.css"))
-        frag.add_javascript(self.resource_string("static/js/src/crowdsourcehinter.js"))
-        frag.initialize_js('CrowdsourceHinter', {'hinting_element': self.Element, 'isStaff': self.xmodule_runtime.user_is_staff})
+        self.add_assets(frag)
+        js_data = {'hinting_element': self.Element, 'isStaff': self.xmodule_runtime.user_is_staff}
+        js_data.update(self.prefetch_data())
+        frag.initialize_js('CrowdsourceHinter', js_data)
         return frag
 
+    def prefetch_data(self):
+        """
+        Returns the data with which the JavaScript shows the hints of common incorrect answers without
+        calling get_hint (see prefetch.py). A bundle the process checked recently is used without
+        reading the hint storage.
+
+        Returns:
+          'bundle': the 'version' of the prefetched hints and the 'hints', as {"answer": ["hint id", "hint text"]}
+          'showBest': show_best; unless it is set, the JavaScript only shows hints the student has not been shown
+          'shownHints': the ids of the hints the student has been shown since the last feedback stage
+        """
+        return {
+            'bundle': (cached_bundle(self.get_hint_namespace()) or get_bundle(self.get_hint_storage())).to_json(),
+            'showBest': self.show_best,
+            'shownHints': [hint for _, hint in self.get_hint_history() if hint is not None],
+        }
+
+    @instrumented
     @XBlock.json_handler
     def get_hint(self, data, suffix=''):
         """
-        Returns hints to students. Hints with the highest rating are shown to students unless the student has already
-        submitted the same incorrect answer previously.
+        Returns hints to students. Hints with the highest score are shown to students unless the student has already
+        submitted the same incorrect answer previously. If there are no hints for the answer, the hints of the closest
+        known answer are shown (see match_answer). The student's own answer is still the one recorded and given new
+        hints, but votes on and reports of a hint of the close answer go to the close answer (see hint_answer).
 
         Args:
           data['submittedanswer']: The string of text that the student submits for a problem.
+          data['shown']: the prefetched hints shown since the JavaScript last reported them, which are
+                         recorded first (see record_hints)
 
         returns:
           'Hints': the highest rated hint for an incorrect answer
                         or another random hint for an incorrect answer
                         or 'Sorry, there are no more hints for this answer.' if no more hints exist
+          'HintId': the id of the hint, which is used to rate it (None if there is no hint)
+          'StudentAnswer': the normalized answer of the student
         """
-        # populate hint_database with hints from initial_hints if there are no hints in hint_database.
-        # this probably will occur only on the very first run of a unit containing this block.
-        if not bool(self.hint_database):
-            self.hint_database = copy.copy(self.initial_hints)
+        self.record_shown(data.get('shown', []))
         answer = str(data["submittedanswer"])
-        answer = answer.lower() # for analyzing the student input string I make it lower case.
         found_equal_sign = 0
         remaining_hints = int(0)
-        best_hint = ""
         # the string returned by the event problem_graded is very messy and is different
         # for each problem, but after all of the numbers/letters there is an equal sign, after which the
         # student's input is shown. I use the function below to remove everything before the first equal
@@ -137,40 +241,28 @@ class CrowdsourceHinter(XBlock):
                 found_equal_sign = 1
                 eqplace = answer.index("=") + 1
                 answer = answer[eqplace:]
-        remaining_hints = str(self.find_hints(answer))
+        # hints are keyed by the normalized (lower case, whitespace collapsed) answer
+        answer = normalize_answer(answer)
+        hint_answer = self.match_answer(answer)
+        self.get_hint_storage().touch(hint_answer)
+        remaining_hints = str(self.find_hints(hint_answer))
         if remaining_hints != str(0):
-            best_hint = max(self.hint_database[str(answer)].iteritems(), key=operator.itemgetter(1))[0]
-            if self.show_best:
-                # if set to show best, only the best hint will be shown. Different hints will not be shown
-                # for multiple submissions/hint requests
-                # currently set by default to True
-                if best_hint not in self.Reported.keys():
-                    self.Used.append(best_hint)
-                    return {'Hints': best_hint, "StudentAnswer": answer}
-            if best_hint not in self.Used:
-                # choose highest rated hint for the incorrect answer
-                if best_hint not in self.Reported.keys():
-                    self.Used.append(best_hint)
-                    return {'Hints': best_hint, "StudentAnswer": answer}
-            # choose another random hint for the answer.
-            temporary_hints_list = []
-            for hint_keys in self.hint_database[str(answer)]:
-                if hint_keys not in self.Used:
-                    if hint_keys not in self.Reported:
-                        temporary_hints_list.append(str(hint_keys))
-                        not_used = random.choice(temporary_hints_list)
-                        self.Used.append(not_used)
-                        return {'Hints': not_used, "StudentAnswer": answer}
+            best_hint = self.best_hint(hint_answer)
+            self.hint_history = add_to_history(self.get_hint_history(), answer, best_hint)
+            self.get_hint_storage().record_impression(hint_answer, best_hint)
+            hint_text = self.get_hint_storage().hint_text(best_hint, hint_answer)
+            return {'Hints': hint_text, 'HintId': best_hint, "StudentAnswer": answer}
         # find generic hints for the student if no specific hints exist
         if len(self.generic_hints) != 0:
             not_used = random.choice(self.generic_hints)
-            self.Used.append(not_used)
-            return {'Hints': not_used, "StudentAnswer": answer}
+            self.hint_history = add_to_history(self.get_hint_history(), answer, hint_id(not_used))
+            return {'Hints': not_used, 'HintId': hint_id(not_used), "StudentAnswer": answer}
         else:
             # if there are no more hints left in either the database or defaults
-            self.Used.append(str("There are no hints for" + " " + answer))
-            return {'Hints': "Sorry, there are no hints for this answer.", "StudentAnswer": answer}
+            self.hint_history = add_to_history(self.get_hint_history(), answer, None)
+            return {'Hints': "Sorry, there are no hints for this answer.", 'HintId': None, "StudentAnswer": answer}
 
+    @span
     def find_hints(self, answer):
         """
         This function is used to find all appropriate hints that would be provided for
@@ -181,25 +273,64 @@ class CrowdsourceHinter(XBlock):
 
         Returns 0 if no hints to show exist
         """
-        isreported = []
-        isused = 0
-        self.WrongAnswers.append(str(answer)) # add the student's input to the temporary list
-        if str(answer) not in self.hint_database:
-            # add incorrect answer to hint_database if no precedent exists
-            self.hint_database[str(answer)] = {}
+        if self.best_hint(answer) is None:
             return str(0)
-        for hint_keys in self.hint_database[str(answer)]:
-            for reported_keys in self.Reported:
-                if hint_keys == reported_keys:
-                    isreported.append(hint_keys)
-            if str(hint_keys) in self.Used:
-                if self.show_best is False:
-                    isused += 1
-        if (len(self.hint_database[str(answer)]) - len(isreported) - isused) > 0:
-            return str(1)
         else:
-            return str(0)
+            return str(1)
 
+    def match_answer(self, answer):
+        """
+        Return the known answer whose hints are shown for an incorrect answer. This is the answer itself
+        if it has a hint to show. Otherwise it is the closest known answer with a hint to show, where answers
+        are close if they only differ in punctuation, rounding or a typo. If there is none, the answer itself
+        is returned.
+
+        Args:
+          answer: the normalized incorrect answer
+        """
+        if self.best_hint(answer) is not None:
+            return answer
+        for known_answer in self.get_hint_storage().answer_index().match(answer):
+            if self.best_hint(known_answer) is not None:
+                return known_answer
+        return answer
+
+    def hint_answer(self, answer, hint):
+        """
+        Return the answer for which a hint shown for an incorrect answer is stored: the answer itself if it
+        has the hint, otherwise the closest known answer that has it (see match_answer), or None.
+
+        Args:
+          answer: the incorrect answer
+          hint: the id of the hint
+        """
+        storage = self.get_hint_storage()
+        answer = normalize_answer(answer)
+        if storage.has_hint(answer, hint):
+            return answer
+        for known_answer in storage.answer_index().match(answer):
+            if storage.has_hint(known_answer, hint):
+                return known_answer
+        return None
+
+    def best_hint(self, answer):
+        """
+        Return the id of the hint to show for an incorrect answer, or None if there is no hint to show. This is the
+        hint with the highest stored score (see scoring.py) that has not been reported. Unless show_best is set,
+        hints that the student has already been shown are skipped.
+
+        Args:
+          answer: the normalized incorrect answer
+        """
+        ranking = self.get_hint_storage().ranking(answer)
+        if self.show_best:
+            # if set to show best, only the best hint will be shown. Different hints will not be shown
+            # for multiple submissions/hint requests
+            # currently set by default to True
+            return ranking.best()
+        return ranking.best(exclude=set(hint for _, hint in self.get_hint_history()))
+
+    @instrumented
     @XBlock.json_handler
     def get_feedback(self, data, suffix=''):
         """
@@ -209,107 +340,366 @@ class CrowdsourceHinter(XBlock):
         Returns:
           feedback_data: This dicitonary contains all incorrect answers that a student submitted
                          for the question, all the hints the student recieved, as well as two
-                         more random hints that exist for an incorrect answer in the hint_database
+                         more random hints that exist for an incorrect answer in the hint storage
         """
         # feedback_data is a dictionary of hints (or lack thereof) used for a
         # specific answer, as well as 2 other random hints that exist for each answer
         # that were not used. The keys are the used hints, the values are the
-        # corresponding incorrect answer
+        # corresponding incorrect answer. Reported hints are moderated through get_moderation_queue.
         feedback_data = {}
-        if self.get_user_is_staff():
-            if len(self.Reported) != 0:
-                for answer_keys in self.hint_database:
-                    if str(len(self.hint_database[str(answer_keys)])) != str(0):
-                        for hints in self.hint_database[str(answer_keys)]:
-                            for reported_hints in self.Reported:
-                                if str(hints) == reported_hints:
-                                    feedback_data[str(hints)] = str("Reported")
-        if len(self.WrongAnswers) == 0:
-            return feedback_data
-        else:
-            for index in range(0, len(self.Used)):
-                # each index is a hint that was used, in order of usage
-                if str(self.Used[index]) in self.hint_database[self.WrongAnswers[index]]:
-                    # add new key (hint) to feedback_data with a value (incorrect answer)
-                    feedback_data[str(self.Used[index])] = str(self.WrongAnswers[index])
-                    self.WrongAnswers = []
-                    self.Used = []
-                    return feedback_data
-                else:
-                    # if the student's answer had no hints (or all the hints were reported and unavailable) return None
-                    feedback_data[None] = str(self.WrongAnswers[index])
-                    self.WrongAnswers = []
-                    self.Used = []
-                    return feedback_data
-        self.WrongAnswers=[]
-        self.Used=[]
+        storage = self.get_hint_storage()
+        for answer, hint in self.collect_feedback():
+            # add new key (hint) to feedback_data with a value (incorrect answer)
+            text = storage.hint_text(hint, self.hint_answer(answer, hint)) if hint is not None else None
+            feedback_data[text] = answer
         return feedback_data
 
+    def collect_feedback(self):
+        """
+        Returns the incorrect answers and the ids of the hints used for them, as [(answer, hint id)], and starts
+        over the student's record of incorrect answers and hints used. The hint id is None if the answer had no
+        hint from the hint storage.
+        """
+        history = self.get_hint_history()
+        if len(history) == 0:
+            return []
+        self.hint_history = []
+        # the first hint that was used, and its answer
+        answer, hint = history[0]
+        if hint is not None and self.hint_answer(answer, hint) is not None:
+            return [(answer, hint)]
+        # if the student's answer had no hints (or all the hints were reported and unavailable) return None
+        return [(answer, None)]
+
+    @instrumented
+    @XBlock.json_handler
+    def record_hints(self, data, suffix=''):
+        """
+        Records the prefetched hints that the JavaScript showed without calling get_hint, in batches, so
+        that the feedback stage asks about them.
+
+        Args:
+          data['shown']: the hints shown, oldest first, each with its 'student_answer' and 'hint_id'
+          data['version']: the version of the student's bundle of prefetched hints
+
+        Returns:
+          'bundle': a new bundle of prefetched hints if the student's is out of date, otherwise None
+        """
+        self.record_shown(data.get('shown', []))
+        bundle = get_bundle(self.get_hint_storage())
+        return {'bundle': bundle.to_json() if bundle.version != data.get('version') else None}
+
+    def record_shown(self, shown):
+        """
+        Adds prefetched hints that were shown to the student's hint history and counts their impressions,
+        as get_hint does for the hints it returns. Hints that are not stored for their answer are ignored,
+        and so are all but the first MAX_HISTORY hints.
+        """
+        if not shown:
+            return
+        storage = self.get_hint_storage()
+        history = self.get_hint_history()
+        for entry in shown[:MAX_HISTORY]:
+            answer = normalize_answer(entry['student_answer'])
+            if storage.has_hint(answer, entry['hint_id']):
+                storage.touch(answer)
+                storage.record_impression(answer, entry['hint_id'])
+                history = add_to_history(history, answer, entry['hint_id'])
+        if history is not self.hint_history:
+            self.hint_history = history
+
+    def get_hint_history(self):
+        """
+        Return hint_history, first moving into it the pairs of the legacy WrongAnswers and Used lists.
+        """
+        if self.WrongAnswers or self.Used:
+            history = self.hint_history
+            for answer, hint in zip(self.WrongAnswers, self.Used):
+                history = add_to_history(history, answer, hint_id(hint))
+            self.hint_history = history
+            del self.WrongAnswers
+            del self.Used
+        return self.hint_history
+
+    def get_voted_hints(self):
+        """
+        Return voted_hints, first moving into it the hints of the legacy Voted list.
+        """
+        if self.Voted:
+            for hint in self.Voted:
+                add_vote(self.voted_hints, hint_id(hint))
+            del self.Voted
+        return self.voted_hints
+
+    @instrumented
+    @XBlock.json_handler
+    def get_feedback_with_ratings(self, data, suffix=''):
+        """
+        Returns everything the feedback stage needs in one response: the hints of get_feedback with their
+        current ratings (so that get_ratings need not be called for each of them) and, for staff, the first
+        page of the moderation queue.
+
+        Returns:
+          'feedback': list of the hints used, each with its 'student_answer', 'hint_id' and 'hint' text (both
+                      None if the answer had no hint to show) and 'rating'
+          'moderation': the first page of get_moderation_queue, only for staff
+        """
+        storage = self.get_hint_storage()
+        feedback = []
+        for answer, hint in self.collect_feedback():
+            # the hint may be stored for a close answer (see match_answer)
+            hint_answer = self.hint_answer(answer, hint) if hint is not None else None
+            rating = storage.get_hints(hint_answer).get(hint) if hint_answer is not None else None
+            if rating is None:
+                # the answer had no hint, or its hint has been removed since
+                feedback.append({'student_answer': answer, 'hint_id': None, 'hint': None, 'rating': None})
+            else:
+                text = storage.hint_text(hint, hint_answer)
+                feedback.append({'student_answer': answer, 'hint_id': hint, 'hint': text, 'rating': rating})
+        result = {'feedback': feedback}
+        if self.get_user_is_staff():
+            reports, cursor = storage.moderation_queue()
+            result['moderation'] = {'reports': reports, 'cursor': cursor}
+        return result
+
+    @instrumented
     @XBlock.json_handler
     def get_ratings(self, data, suffix=''):
         """
         This function is used to return the ratings of hints during hint feedback.
 
         data['student_answer'] is the answer for the hint being displayed
-        data['hint'] is the hint being shown to the student
+        data['hint_id'] is the id of the hint being shown to the student (older clients send its text as data['hint'])
 
         returns:
             hint_rating: the rating of the hint as well as data on what the hint in question is
+
+        Raises a 404 error if the answer has no such hint, such as a hint removed since the feedback stage began.
         """
         hint_rating = {}
+        hint = self.get_requested_hint(data)
         if data['student_answer'] == 'Reported':
             hint_rating['rating'] = 0
             hint_rating['student_ansxwer'] = 'Reported'
-            hint_rating['hint'] = data['hint']
+            hint_rating['hint_id'] = hint
             return hint_rating
-        hint_rating['rating'] = self.hint_database[data['student_answer']][data['hint']]
+        hint_answer = self.hint_answer(data['student_answer'], hint)
+        rating = self.get_hint_storage().get_hints(hint_answer).get(hint) if hint_answer is not None else None
+        if rating is None:
+            raise JsonHandlerError(404, "The hint does not exist.")
+        hint_rating['rating'] = rating
         hint_rating['student_answer'] = data['student_answer']
-        hint_rating['hint'] = data['hint']
+        hint_rating['hint_id'] = hint
         return hint_rating
 
+    def get_requested_hint(self, data):
+        """
+        Return the id of the hint a request is about: data['hint_id'], or the id of data['hint'] for older
+        clients that send the text of the hint.
+        """
+        if 'hint_id' in data:
+            return data['hint_id']
+        return hint_id(data['hint'])
+
+    @instrumented
     @XBlock.json_handler
     def rate_hint(self, data, suffix=''):
         """
         Used to facilitate hint rating by students.
 
-        Hint ratings in hint_database are updated and the resulting hint rating (or reported status) is returned to JS.
+        Hint ratings in the hint storage are updated and the resulting hint rating (or reported status) is returned
+        to JS.
 
         Args:
           data['student_answer']: The incorrect answer that corresponds to the hint that is being voted on
-          data['hint']: The hint that is being voted on
+          data['hint_id']: The id of the hint that is being voted on (older clients send its text as data['hint'])
           data['student_rating']: The rating chosen by the student.
 
         Returns:
           "rating": The rating of the hint.
         """
+        self.check_rating(data)
+        return self.apply_rating(data)
+
+    @instrumented
+    @XBlock.json_handler
+    def rate_hints(self, data, suffix=''):
+        """
+        Applies several hint ratings or reports in one request, as rate_hint would apply each of them.
+        At most MAX_BATCHED_RATINGS ratings are applied; the rest are ignored. Every rating is checked
+        before any is applied, so if one is rejected, none is applied and the error of the first rejected
+        one is returned.
+
+        Args:
+          data['ratings']: list of ratings, each with the 'student_answer', 'hint_id' and 'student_rating'
+                           that rate_hint takes
+
+        Returns:
+          'results': what rate_hint returns for each rating that was applied, in the same order
+        """
+        ratings = data.get('ratings')
+        if not isinstance(ratings, list):
+            raise JsonHandlerError(400, "The ratings must be a list.")
+        ratings = ratings[:MAX_BATCHED_RATINGS]
+        for rating in ratings:
+            self.check_rating(rating)
+        return {'results': [self.apply_rating(rating) for rating in ratings]}
+
+    def check_rating(self, data):
+        """
+        Raises a JsonHandlerError if a rating cannot be applied: a 400 error if it is malformed, a 403 error
+        if a student moderates a hint, and a 404 error if staff moderate a hint that is not reported.
+        """
+        if not isinstance(data, dict) or 'student_answer' not in data or 'student_rating' not in data or not (
+            'hint_id' in data or 'hint' in data
+        ):
+            raise JsonHandlerError(400, "A rating needs a student_answer, a student_rating and a hint_id.")
+        if data['student_rating'] in ('unreport', 'remove'):
+            if not self.get_user_is_staff():
+                raise JsonHandlerError(403, "Only staff can moderate hints.")
+            if not self.get_reported_answers(self.get_requested_hint(data), data['student_answer']):
+                raise JsonHandlerError(404, "The hint is not reported.")
+
+    def apply_rating(self, data):
+        """
+        Applies a rating (a vote, report or staff moderation) of a hint that check_rating accepted. Called
+        by rate_hint and rate_hints, with the same arguments as rate_hint.
+        """
         answer_data = data['student_answer']
         data_rating = data['student_rating']
-        data_hint = data['hint']
-        if data['student_rating'] == 'unreport':
-            for reported_hints in self.Reported:
-                if reported_hints == data_hint:
-                    self.Reported.pop(data_hint, None)
-                    return {'rating': 'unreported'}
-        if data['student_rating'] == 'remove':
-            for reported_hints in self.Reported:
-                if data_hint == reported_hints:
-                    self.hint_database[self.Reported[data_hint]].pop(data_hint, None)
-                    self.Reported.pop(data_hint, None)
-                    return {'rating': 'removed'}
+        data_hint = self.get_requested_hint(data)
+        storage = self.get_hint_storage()
+        if data_rating in ('unreport', 'remove'):
+            for reported_answer in self.get_reported_answers(data_hint, answer_data):
+                if data_rating == 'unreport':
+                    storage.unreport_hint(reported_answer, data_hint)
+                else:
+                    storage.remove_hint(reported_answer, data_hint)
+            return {'rating': 'unreported' if data_rating == 'unreport' else 'removed'}
+        hint_answer = self.hint_answer(answer_data, data_hint)
+        if hint_answer is None:
+            # votes on and reports of hints that were not shown for the answer are dropped, and not recorded either
+            return {"rating": str(0), 'hint_id': data_hint}
         if data['student_rating'] == 'report':
-            # add hint to Reported dictionary
-            self.Reported[str(data_hint)] = answer_data
-            return {"rating": 'reported', 'hint': data_hint}
-        if str(data_hint) not in self.Voted:
-            self.Voted.append(str(data_hint)) # add data to Voted to prevent multiple votes
-            rating = self.change_rating(data_hint, data_rating, answer_data) # change hint rating
+            # add hint to the reported hints of the answer it is stored for, remembering who reported it
+            storage.report_hint(hint_answer, data_hint, self.scope_ids.user_id)
+            return {"rating": 'reported', 'hint_id': data_hint}
+        voted = self.get_voted_hints()
+        if data_hint not in voted:
+            add_vote(voted, data_hint) # add data to voted_hints to prevent multiple votes
+            # a hint of a close answer (see match_answer) is rated where it is stored, like its reports
+            rating = self.change_rating(data_hint, data_rating, hint_answer) # change hint rating
             if str(rating) == str(0):
-                return {"rating": str(0), 'hint': data_hint}
+                return {"rating": str(0), 'hint_id': data_hint}
             else:
-                return {"rating": str(rating), 'hint': data_hint}
+                return {"rating": str(rating), 'hint_id': data_hint}
         else:
-            return {"rating": str('voted'), 'hint': data_hint}
+            return {"rating": str('voted'), 'hint_id': data_hint}
+
+    def get_reported_answers(self, data_hint, answer_data):
+        """
+        Return the answers for which staff moderate a reported hint: the answer staff send with the hint, if
+        the hint is reported for it. Older clients send 'Reported' instead, in which case the hint is
+        moderated for every answer it was reported for.
+        """
+        reported_answers = self.get_hint_storage().reported_answers(data_hint)
+        if answer_data != 'Reported':
+            return [answer for answer in reported_answers if answer == normalize_answer(answer_data)]
+        return reported_answers
+
+    @instrumented
+    @XBlock.json_handler
+    def get_moderation_queue(self, data, suffix=''):
+        """
+        Returns a page of the reported hints, for staff to return to the hint pool or remove. Only staff can
+        see the moderation queue.
+
+        Args:
+          data['cursor']: the cursor returned with the previous page, omitted for the first page
+          data['limit']: the number of reported hints per page (at most 100, 20 by default)
+
+        Returns:
+          'reports': the reported hints on the page, each with its 'answer', 'hint_id', 'hint' text, 'rating',
+                     'ups', 'downs', 'impressions', report 'count' and 'reporters'
+          'cursor': the cursor of the next page, or None on the last page
+        """
+        if not self.get_user_is_staff():
+            raise JsonHandlerError(403, "Only staff can moderate hints.")
+        try:
+            limit = max(1, min(int(data.get('limit', 20)), 100))
+        except (TypeError, ValueError):
+            raise JsonHandlerError(400, "The limit must be a number.")
+        cursor = data.get('cursor')
+        if cursor is not None and not (
+            isinstance(cursor, list) and len(cursor) == 2 and all(isinstance(part, type(u'')) for part in cursor)
+        ):
+            raise JsonHandlerError(400, "The cursor must be one returned with the previous page.")
+        reports, cursor = self.get_hint_storage().moderation_queue(cursor, limit)
+        return {'reports': reports, 'cursor': cursor}
+
+    @instrumented
+    @XBlock.json_handler
+    def get_stats(self, data, suffix=''):
+        """
+        Returns the measurements of the handlers aggregated in this process (see metrics.py), the counters
+        of the process' cache of the hint storage, and the size of this block's hint storage. Only staff can
+        see the stats.
+
+        Returns:
+          'enabled': whether the handlers are being measured
+          'metrics': the counters, timers and gauges of the process' Collector, or None if there is none
+          'cache': the 'hits', 'misses' and 'evictions' of STORAGE_CACHE, and its 'entries', 'bytes' and 'max_bytes'
+          'storage': the number of 'answers', 'hints' and 'reported' hints of this block, and their size in 'bytes'
+        """
+        if not self.get_user_is_staff():
+            raise JsonHandlerError(403, "Only staff can see the hinter's stats.")
+        collector = INSTRUMENTATION.collector()
+        return {
+            'enabled': bool(INSTRUMENTATION.sinks),
+            'metrics': collector.snapshot() if collector is not None else None,
+            'cache': STORAGE_CACHE.stats(),
+            'storage': self.get_hint_storage().size(),
+        }
+
+    @instrumented
+    @XBlock.json_handler
+    def compact_hints(self, data, suffix=''):
+        """
+        Compacts the hint storage of this block with the DEFAULT_RETENTION policy: cold and empty answers
+        are evicted and persistently downvoted hints beyond the per-answer cap are dropped. Only staff can
+        compact the hints.
+
+        Returns:
+          'before', 'after': the number of 'answers', 'hints' and 'reported' hints, and the size in 'bytes',
+                             before and after the compaction
+          'evicted_answers', 'dropped_hints': what the compaction removed
+        """
+        if not self.get_user_is_staff():
+            raise JsonHandlerError(403, "Only staff can compact hints.")
+        storage = self.get_hint_storage()
+        result = {'before': storage.size()}
+        result.update(storage.compact(DEFAULT_RETENTION))
+        result['after'] = storage.size()
+        log.info("Compacted the hints of %s: %s", self.get_hint_namespace(), result)
+        return result
+
+    @instrumented
+    @XBlock.json_handler
+    def rescore_hints(self, data, suffix=''):
+        """
+        Recomputes the score of every hint of this block with the DEFAULT_SCORER (see scoring.py),
+        such as after its method or parameters were changed. Only staff can rescore the hints.
+
+        Returns:
+          'hints': the number of hints scored
+        """
+        if not self.get_user_is_staff():
+            raise JsonHandlerError(403, "Only staff can rescore hints.")
+        hints = self.get_hint_storage().rescore()
+        log.info("Rescored the %d hints of %s", hints, self.get_hint_namespace())
+        return {'hints': hints}
 
+    @span
     def change_rating(self, data_hint, data_rating, answer_data):
         """
         This function is used to change the rating of a hint when students vote on its helpfulness.
@@ -317,23 +707,24 @@ class CrowdsourceHinter(XBlock):
         in self.rate_hint
 
         Args:
-          data_hint: This is equal to the data['hint'] in self.rate_hint
+          data_hint: The id of the hint, which is equal to the data['hint_id'] in self.rate_hint
           data_rating: This is equal to the data['student_rating'] in self.rate_hint
           answer_data: This is equal to the data['student_answer'] in self.rate_hint
 
         Returns:
           The rating associated with the hint is returned. This rating is identical
-          to what would be found under self.hint_database[answer_string[hint_string]]
+          to what would be found in the hint storage for the answer and hint
         """
         if data_rating == 'upvote':
-            self.hint_database[str(answer_data)][str(data_hint)] += 1
+            return self.get_hint_storage().change_rating(str(answer_data), data_hint, 1)
         else:
-            self.hint_database[str(answer_data)][str(data_hint)] -= 1
+            return self.get_hint_storage().change_rating(str(answer_data), data_hint, -1)
 
+    @instrumented
     @XBlock.json_handler
     def add_new_hint(self, data, suffix=''):
         """
-        This function adds a new hint submitted by the student into the hint_database.
+        This function adds a new hint submitted by the student into the hint storage.
 
         Args:
           data['submission']: This is the text of the new hint that the student has submitted.
@@ -341,24 +732,30 @@ class CrowdsourceHinter(XBlock):
         """
         submission = data['submission']
         answer = data['answer']
-        if str(submission) not in self.hint_database[str(answer)]:
-            self.hint_database[str(answer)].update({submission: 0})
+        storage = self.get_hint_storage()
+        if not storage.has_hint(str(answer), hint_id(submission)):
+            storage.add_hint(str(answer), submission)
             return
         else:
             # if the hint exists already, simply upvote the previously entered hint
             if str(submission) in self.generic_hints:
                 return
             else:
-                self.hint_database[str(answer)][str(submission)] += 1
+                storage.change_rating(str(answer), hint_id(submission), 1)
                 return
 
+    @instrumented
     @XBlock.json_handler
     def studiodata(self, data, suffix=''):
         """
-        This function serves to return the dictionary of reported hints to JS. This is intended for use in
-        the studio_view, which is under construction at the moment
+        This function serves to return the first page of reported hints to JS, in the format of
+        get_moderation_queue. This is intended for use in the studio_view, which is under construction at the moment.
+        Only staff can see it.
         """
-        return self.Reported
+        if not self.get_user_is_staff():
+            raise JsonHandlerError(403, "Only staff can moderate hints.")
+        reports, cursor = self.get_hint_storage().moderation_queue()
+        return {'reports': reports, 'cursor': cursor}
 
     @staticmethod
     def workbench_scenarios():
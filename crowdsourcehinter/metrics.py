@@ -0,0 +1,300 @@
+"""
+Instrumentation of the Crowd Sourced Hinter.
+
+When instrumentation is enabled, every handler call is measured: its wall time, the fields it
+loaded and will save (with their serialized sizes), the reads and writes it made to the hint
+storage, the sizes of the request and response bodies, the time spent in find_hints and
+change_rating, and the number of answers and reported hints of the block. Each measurement is
+passed to the configured sinks: a LoggingSink writes one log line per call, and a Collector
+aggregates them in the process, statsd-style, for the staff-only get_stats handler.
+
+Instrumentation is disabled unless sinks are configured, with configure() or with the
+CROWDSOURCEHINTER_METRICS environment variable ("log", "collect" or "log,collect"; the
+CROWDSOURCEHINTER_METRICS_SAMPLE_RATE variable sets the fraction of calls measured). When it is
+disabled, the instrumented functions only check whether there are sinks.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+def _size(value):
+    return len(json.dumps(value))
+
+
+class Measurement(object):
+    """
+    What one handler call did. `counts` holds the I/O counters and sizes, `spans` the time in
+    milliseconds spent in the instrumented functions and `gauges` the sizes of the block's data.
+    """
+    def __init__(self, handler, block):
+        self.handler = handler
+        self.block = block
+        self.counts = {}
+        self.spans = {}
+        self.gauges = {}
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_json(self):
+        return {
+            'handler': self.handler, 'block': self.block,
+            'counts': self.counts, 'spans': self.spans, 'gauges': self.gauges,
+        }
+
+
+class LoggingSink(object):
+    """
+    Writes every measurement to a logger, as JSON.
+    """
+    def __init__(self, logger=log, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def record(self, measurement):
+        self.logger.log(self.level, "crowdsourcehinter %s", json.dumps(measurement.to_json(), sort_keys=True))
+
+
+class Collector(object):
+    """
+    Aggregates measurements in the process, like a statsd server would: the counts are summed,
+    the spans are timers (number, total and maximum milliseconds) and the gauges keep the last
+    value seen for every block. Names are '<handler>.<count or span>'.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.gauges = {}
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name, milliseconds):
+        timer = self.timers.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        timer['count'] += 1
+        timer['total_ms'] += milliseconds
+        timer['max_ms'] = max(timer['max_ms'], milliseconds)
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def record(self, measurement):
+        with self._lock:
+            self.incr(measurement.handler + '.calls')
+            for name, value in measurement.counts.items():
+                self.incr(measurement.handler + '.' + name, value)
+            for name, milliseconds in measurement.spans.items():
+                self.timing(measurement.handler + '.' + name, milliseconds)
+            for name, value in measurement.gauges.items():
+                self.gauge(measurement.block + '.' + name, value)
+
+    def snapshot(self):
+        """
+        Return the aggregated counters, timers (with their mean) and gauges.
+        """
+        with self._lock:
+            timers = dict(
+                (name, dict(timer, mean_ms=timer['total_ms'] / timer['count'])) for name, timer in self.timers.items()
+            )
+            return {'counters': dict(self.counters), 'timers': timers, 'gauges': dict(self.gauges)}
+
+
+class Instrumentation(object):
+    """
+    The sinks measurements go to, and the measurement of the handler call running in each thread.
+    """
+    def __init__(self, sinks=(), sample_rate=1.0):
+        self._local = threading.local()
+        self.configure(sinks, sample_rate)
+
+    def configure(self, sinks=(), sample_rate=1.0):
+        """
+        Send measurements to `sinks`, measuring a `sample_rate` fraction of the handler calls.
+        Without sinks, instrumentation is disabled.
+        """
+        self.sinks = list(sinks)
+        self.sample_rate = sample_rate
+
+    def collector(self):
+        """
+        Return the configured Collector, or None.
+        """
+        for sink in self.sinks:
+            if isinstance(sink, Collector):
+                return sink
+        return None
+
+    def current(self):
+        """
+        Return the Measurement of the handler call running in this thread, or None.
+        """
+        return getattr(self._local, 'measurement', None)
+
+    def start(self, handler, block):
+        if not self.sinks or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return None
+        self._local.measurement = Measurement(handler, block)
+        return self._local.measurement
+
+    def stop(self):
+        """
+        End the measurement of the handler call running in this thread.
+        """
+        self._local.measurement = None
+
+    def record(self, measurement):
+        for sink in self.sinks:
+            try:
+                sink.record(measurement)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Could not record a measurement in %r", sink)
+
+
+def _configure_from_environment(instrumentation):
+    sinks = []
+    for name in os.environ.get('CROWDSOURCEHINTER_METRICS', '').split(','):
+        if name.strip() == 'log':
+            sinks.append(LoggingSink())
+        elif name.strip() == 'collect':
+            sinks.append(Collector())
+    instrumentation.configure(sinks, float(os.environ.get('CROWDSOURCEHINTER_METRICS_SAMPLE_RATE', 1.0)))
+
+
+# Instrumentation of this process.
+INSTRUMENTATION = Instrumentation()
+_configure_from_environment(INSTRUMENTATION)
+
+
+def configure(sinks=(), sample_rate=1.0):
+    INSTRUMENTATION.configure(sinks, sample_rate)
+
+
+class MeteredKeyValueStore(object):
+    """
+    Wraps the key-value store of a HintStorage to count its reads and writes, and the serialized
+    size of the values, in the current measurement.
+    """
+    def __init__(self, kvs):
+        self.kvs = kvs
+
+    def get(self, key, default=None):
+        value = self.kvs.get(key, default)
+        measurement = INSTRUMENTATION.current()
+        if measurement is not None:
+            measurement.count('storage_reads')
+            if value is not default:
+                measurement.count('storage_bytes_read', _size(value))
+        return value
+
+    def set(self, key, value):
+        measurement = INSTRUMENTATION.current()
+        if measurement is not None:
+            measurement.count('storage_writes')
+            measurement.count('storage_bytes_written', _size(value))
+        self.kvs.set(key, value)
+
+    def delete(self, key):
+        measurement = INSTRUMENTATION.current()
+        if measurement is not None:
+            measurement.count('storage_writes')
+        self.kvs.delete(key)
+
+
+def metered(kvs):
+    """
+    Return `kvs`, wrapped in a MeteredKeyValueStore if instrumentation is enabled.
+    """
+    if not INSTRUMENTATION.sinks:
+        return kvs
+    return MeteredKeyValueStore(kvs)
+
+
+def span(func):
+    """
+    Decorator adding the time spent in a method to the current measurement, as a span named after it.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        measurement = INSTRUMENTATION.sinks and INSTRUMENTATION.current()
+        if not measurement:
+            return func(*args, **kwargs)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            name = func.__name__ + '_ms'
+            measurement.spans[name] = measurement.spans.get(name, 0.0) + 1000 * (time.time() - start)
+    return wrapper
+
+
+def _loaded_fields(block):
+    """
+    Return the {"name": value} of the fields a block has loaded. This is not a supported part of
+    the XBlock API, so in runtimes whose blocks do not keep it, no field is counted.
+    """
+    return getattr(block, '_field_data_cache', None) or {}
+
+
+def _dirty_fields(block):
+    """
+    Return the names of the fields the runtime will save for a block (none if it cannot tell).
+    """
+    get_fields_to_save = getattr(block, '_get_fields_to_save', None)
+    return get_fields_to_save() if get_fields_to_save is not None else []
+
+
+def _field_sizes(block, names):
+    loaded = _loaded_fields(block)
+    return sum(_size(block.fields[name].to_json(loaded[name])) for name in names if name in loaded)
+
+
+def instrumented(func):
+    """
+    Decorator measuring a handler of the hinter, put above @XBlock.json_handler (or @XBlock.handler).
+
+    Fields are counted as read when the handler loads them, and as written when they are dirty
+    when it returns (the runtime saves them right after). Sizes are those of the fields' JSON.
+    The block's gauges are read after the handler has run, and are not counted as its I/O.
+    """
+    @functools.wraps(func)
+    def wrapper(self, request, suffix=''):
+        if not INSTRUMENTATION.sinks:
+            return func(self, request, suffix)
+        measurement = INSTRUMENTATION.start(func.__name__, self.get_hint_namespace())
+        if measurement is None:
+            return func(self, request, suffix)
+        loaded = set(_loaded_fields(self))
+        start = time.time()
+        try:
+            response = func(self, request, suffix)
+        except Exception:
+            measurement.count('errors')
+            INSTRUMENTATION.stop()
+            INSTRUMENTATION.record(measurement)
+            raise
+        measurement.spans['wall_ms'] = 1000 * (time.time() - start)
+        read = set(_loaded_fields(self)) - loaded
+        written = _dirty_fields(self)
+        measurement.count('field_reads', len(read))
+        measurement.count('field_bytes_read', _field_sizes(self, read))
+        measurement.count('field_writes', len(written))
+        measurement.count('field_bytes_written', _field_sizes(self, written))
+        measurement.count('request_bytes', len(request.body))
+        measurement.count('response_bytes', len(response.body))
+        INSTRUMENTATION.stop()
+        measurement.gauges.update(self.get_hint_storage().gauges())
+        INSTRUMENTATION.record(measurement)
+        return response
+    return wrapper
@@ -0,0 +1,88 @@
+"""
+Prefetched hints of the Crowd Sourced Hinter.
+
+Most students make the same few mistakes, so the student view embeds a HintBundle: the best hint
+of each of the answers shown most often (see HintStorage.popular_answers). The JavaScript shows
+those hints without a request, calls get_hint for other answers, and reports the hints it showed
+in batches to the record_hints handler, which keeps the student's hint history and the
+impressions as get_hint would have.
+
+A bundle has a version, a digest of its hints, so that students with an out of date bundle
+get a new one from record_hints after votes, reports or removals changed the best hints.
+Bundles are cached in the process and checked every CHECK_INTERVAL seconds against the popular
+answers and the revisions of their shards, and rebuilt if either changed. A bundle checked less
+than CHECK_INTERVAL seconds ago is used without reading the hint storage at all (see
+cached_bundle), which saves loading the hint_shards field of blocks without a hint storage service.
+"""
+import hashlib
+import json
+import time
+
+from .cache import LRUCache
+
+# Number of answers in a bundle.
+BUNDLE_SIZE = 20
+# Seconds between two checks of a cached bundle.
+CHECK_INTERVAL = 10
+
+
+class HintBundle(object):
+    """
+    The best hints of the answers shown most often, as {"answer": ["hint id", "hint text"]}.
+    """
+    def __init__(self, hints, answers, revisions):
+        self.hints = hints
+        self.answers = answers
+        self.revisions = revisions
+        self.version = hashlib.sha1(json.dumps(hints, sort_keys=True).encode('utf8')).hexdigest()[:8]
+        self.checked = time.time()
+
+    def to_json(self):
+        return {"version": self.version, "hints": self.hints}
+
+
+def build_bundle(storage, size=BUNDLE_SIZE):
+    """
+    Return a new HintBundle of the `size` answers of a hint storage shown most often.
+    """
+    answers = storage.popular_answers(size)
+    revisions = storage.revisions(answers)
+    hints = {}
+    for answer in answers:
+        hint = storage.ranking(answer).best()
+        if hint is not None:
+            hints[answer] = [hint, storage.hint_text(hint, answer)]
+    return HintBundle(hints, answers, revisions)
+
+
+def cached_bundle(namespace):
+    """
+    Return the HintBundle of a namespace from the cache of the process if it was checked less than
+    CHECK_INTERVAL seconds ago, or None.
+    """
+    bundle = BUNDLES.get(namespace)
+    if bundle is not None and time.time() - bundle.checked < CHECK_INTERVAL:
+        return bundle
+    return None
+
+
+def get_bundle(storage, size=BUNDLE_SIZE):
+    """
+    Return the HintBundle of a hint storage, from the cache of the process if it is up to date.
+    """
+    bundle = cached_bundle(storage.namespace)
+    if bundle is not None:
+        return bundle
+    bundle = BUNDLES.get(storage.namespace)
+    if bundle is not None:
+        answers = storage.popular_answers(size)
+        if answers == bundle.answers and storage.revisions(answers) == bundle.revisions:
+            bundle.checked = time.time()
+            return bundle
+    bundle = build_bundle(storage, size)
+    BUNDLES.set(storage.namespace, bundle)
+    return bundle
+
+
+# Bundles of this process, keyed by namespace.
+BUNDLES = LRUCache(maxsize=1000)
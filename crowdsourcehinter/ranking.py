@@ -0,0 +1,92 @@
+"""
+Ranked hint index for the Crowd Sourced Hinter.
+
+A HintRanking keeps the hints of one answer sorted by their stored score (see scoring.py), leaving
+out reported hints, and is updated as scores change and reports and removals happen, so the best
+hint is found without a scan.
+
+Rankings are kept in a process-level cache and validated against the revision of the answer's
+shard in the hint storage, which changes on every write to the shard.
+"""
+import bisect
+import threading
+
+from .cache import LRUCache
+
+
+class HintRanking(object):
+    """
+    The hints of one answer, ordered by score (best first), without the reported hints.
+    Ties are ordered by hint id.
+    """
+    def __init__(self, scores=None, reported=(), revision=None):
+        scores = scores or {}
+        self.revision = revision
+        self._lock = threading.Lock()
+        # reported hints, with their scores, so that they can be ranked again if unreported
+        self._reported = dict((hint, scores[hint]) for hint in reported if hint in scores)
+        self._scores = dict((hint, score) for hint, score in scores.items() if hint not in self._reported)
+        self._order = sorted((-score, hint) for hint, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._order)
+
+    def _rank(self, hint, score):
+        self._unrank(hint)
+        self._scores[hint] = score
+        bisect.insort(self._order, (-score, hint))
+
+    def _unrank(self, hint):
+        if hint in self._scores:
+            entry = (-self._scores.pop(hint), hint)
+            del self._order[bisect.bisect_left(self._order, entry)]
+
+    def set_score(self, hint, score):
+        """
+        Add a hint or change its score.
+        """
+        with self._lock:
+            if hint in self._reported:
+                self._reported[hint] = score
+            else:
+                self._rank(hint, score)
+
+    def remove(self, hint):
+        with self._lock:
+            self._unrank(hint)
+            self._reported.pop(hint, None)
+
+    def report(self, hint):
+        """
+        Leave a hint out of the ranking until it is unreported.
+        """
+        with self._lock:
+            if hint in self._scores:
+                self._reported[hint] = self._scores[hint]
+                self._unrank(hint)
+
+    def unreport(self, hint):
+        with self._lock:
+            if hint in self._reported:
+                self._rank(hint, self._reported.pop(hint))
+
+    def best(self, exclude=()):
+        """
+        Return the best scored hint that is not in `exclude`, or None.
+        """
+        with self._lock:
+            for _, hint in self._order:
+                if hint not in exclude:
+                    return hint
+        return None
+
+    def hints(self):
+        """
+        Return the ranked hints, best first.
+        """
+        with self._lock:
+            return [hint for _, hint in self._order]
+
+
+# Rankings of this process, keyed by (namespace, answer).
+RANKINGS = LRUCache(maxsize=1000)
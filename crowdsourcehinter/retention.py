@@ -0,0 +1,80 @@
+"""
+Retention of the hints of the Crowd Sourced Hinter.
+
+A RetentionPolicy bounds the hint storage of a hinter, which gets a shard for every incorrect
+answer that gets a hint. It decides which answers are evicted and which hints are dropped when the
+storage is compacted (see HintStorage.compact):
+
+  - answers without hints (and without removed hints) are evicted,
+  - answers that have not been used for `ttl` seconds are evicted if none of their hints has a
+    positive rating and every one of them has been downvoted. Hints nobody has voted on, such as
+    the initial hints of an answer, keep it,
+  - if there are more than `max_answers` answers, the least recently used ones are evicted
+    (by a full compaction only),
+  - if an answer has more than `max_hints` hints, its lowest rated hints with a negative rating
+    and at least `min_downvotes` downvotes are dropped, down to `max_hints`. (Hints whose rating
+    predates the counting of votes, such as initial hints, need a rating of -min_downvotes.)
+
+Answers with reported hints are kept until staff have moderated them. Staff can compact a block
+with the compact_hints handler; it is also compacted incrementally, `batch_size` answers every
+`compact_every` writes.
+"""
+from .cache import LRUCache
+
+DAY = 24 * 60 * 60
+
+
+class RetentionPolicy(object):
+    """
+    Which answers and hints a compaction of the hint storage drops. See the module docstring.
+    Set `ttl`, `max_answers`, `max_hints` or `compact_every` to None to turn that rule off.
+    """
+    def __init__(
+        self, ttl=180 * DAY, max_answers=None, max_hints=20, min_downvotes=3, compact_every=100, batch_size=20,
+    ):
+        self.ttl = ttl
+        self.max_answers = max_answers
+        self.max_hints = max_hints
+        self.min_downvotes = min_downvotes
+        self.compact_every = compact_every
+        self.batch_size = batch_size
+
+    def should_evict(self, ratings, counters, removed, last_used, now):
+        """
+        Return whether to evict an answer, given its {"hint": rating}, {"hint": PNCounter}, its
+        removed hints and the time it was last used.
+        """
+        if not ratings and not removed:
+            return True
+        if self.ttl is not None and now - last_used > self.ttl:
+            return all(rating <= 0 and downvotes(rating, counters.get(hint)) for hint, rating in ratings.items())
+        return False
+
+    def hints_to_drop(self, ratings, counters):
+        """
+        Return the hints to drop from an answer, given its {"hint": rating} and {"hint": PNCounter}.
+        """
+        if self.max_hints is None or len(ratings) <= self.max_hints:
+            return []
+        negative = sorted(
+            (rating, hint) for hint, rating in ratings.items()
+            if rating < 0 and downvotes(rating, counters.get(hint)) >= self.min_downvotes
+        )
+        return [hint for _, hint in negative[:len(ratings) - self.max_hints]]
+
+
+def downvotes(rating, counter):
+    """
+    Return the downvotes of a hint: those of its PNCounter, or for a hint whose rating predates the
+    counting of votes, its negative rating.
+    """
+    return counter.downs if counter is not None else max(-rating, 0)
+
+
+# Retention policy of the hinters.
+DEFAULT_RETENTION = RetentionPolicy()
+
+# The time at which this process last recorded the use of an answer, keyed by (namespace, answer).
+# The use of an answer is written to the hint storage at most once every TOUCH_INTERVAL seconds.
+LAST_TOUCHED = LRUCache(maxsize=10000)
+TOUCH_INTERVAL = 60 * 60
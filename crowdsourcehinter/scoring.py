@@ -0,0 +1,108 @@
+"""
+Scores of the hints of the Crowd Sourced Hinter.
+
+A HintScorer turns the upvotes and downvotes of hints into a confidence-adjusted score, so that a
+new hint with a single upvote is not shown before an established one at +40/-38:
+
+  - "wilson": the lower bound of the Wilson score interval of the fraction of upvotes, at the
+    confidence given by `z`; hints without votes score 0,
+  - "bayesian": the fraction of upvotes with `prior_weight` votes at `prior` added to every hint.
+
+Hints can also be scored on their conversions, computed offline from the tracking logs (see
+analytics.py): every time a hint was shown counts as `conversion_weight` of an upvote if the
+student solved the problem within a few attempts, and of a downvote otherwise.
+
+Scores are computed in batches, for every hint of a set of answers at once, and stored with the
+hints (see HintStorage), so showing a hint only reads them. If NumPy is installed, large batches
+are computed with it; otherwise, and for small batches, in pure Python.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Batches with fewer hints than this are computed in pure Python, which is faster for them.
+NUMPY_MIN_BATCH = 64
+
+
+class HintScorer(object):
+    """
+    Computes the scores of hints from their votes. See the module docstring.
+    Scores are rounded to `digits` decimals, which keeps the stored scores short.
+    """
+    def __init__(self, method='wilson', z=1.96, prior=0.5, prior_weight=4, digits=4, conversion_weight=0.25):
+        if method not in ('wilson', 'bayesian'):
+            raise ValueError("Unknown scoring method: %s" % method)
+        self.method = method
+        self.z = z
+        self.prior = prior
+        self.prior_weight = prior_weight
+        self.digits = digits
+        self.conversion_weight = conversion_weight
+
+    def scores(self, ups, downs):
+        """
+        Return the list of scores of hints, given the sequences of their upvotes and downvotes.
+        """
+        if numpy is not None and len(ups) >= NUMPY_MIN_BATCH:
+            return self._vector_scores(numpy.asarray(ups, dtype=float), numpy.asarray(downs, dtype=float))
+        return [self.score(up, down) for up, down in zip(ups, downs)]
+
+    def score(self, ups, downs):
+        """
+        Return the score of one hint.
+        """
+        total = ups + downs
+        if self.method == 'bayesian':
+            return round((ups + self.prior * self.prior_weight) / float(total + self.prior_weight), self.digits)
+        if not total:
+            return 0.0
+        z2 = self.z * self.z
+        fraction = ups / float(total)
+        spread = self.z * math.sqrt((fraction * (1 - fraction) + z2 / (4 * total)) / total)
+        bound = (fraction + z2 / (2 * total) - spread) / (1 + z2 / total)
+        return round(bound, self.digits)
+
+    def evidence(self, ups, downs, conversions):
+        """
+        Return the (upvotes, downvotes) of a hint with its conversions counted in, given its
+        conversions as stored by the hint storage ({"source": {"shown": count, "solved": count}}), or None.
+        """
+        if conversions and self.conversion_weight:
+            for counts in conversions.values():
+                ups += self.conversion_weight * counts['solved']
+                downs += self.conversion_weight * (counts['shown'] - counts['solved'])
+        return ups, downs
+
+    def _vector_scores(self, ups, downs):
+        total = ups + downs
+        if self.method == 'bayesian':
+            scores = (ups + self.prior * self.prior_weight) / (total + self.prior_weight)
+        else:
+            z2 = self.z * self.z
+            # hints without votes are computed with one vote, and score 0
+            voted = numpy.maximum(total, 1)
+            fraction = ups / voted
+            spread = self.z * numpy.sqrt((fraction * (1 - fraction) + z2 / (4 * voted)) / voted)
+            bound = (fraction + z2 / (2 * voted) - spread) / (1 + z2 / voted)
+            scores = numpy.where(total > 0, bound, 0.0)
+        return numpy.round(scores, self.digits).tolist()
+
+
+def votes(rating, counter):
+    """
+    Return the (upvotes, downvotes) of a hint of the hint storage, given the rating it had before
+    votes were counted (such as the rating of an initial or imported hint), which counts as that
+    many upvotes, or downvotes if it is negative, and its counter as PNCounter JSON, or None.
+    """
+    ups, downs = (rating, 0) if rating > 0 else (0, -rating)
+    if counter:
+        ups += sum(counter['p'].values()) if 'p' in counter else 0
+        downs += sum(counter['n'].values()) if 'n' in counter else 0
+    return ups, downs
+
+
+# Scorer of the hinters.
+DEFAULT_SCORER = HintScorer()
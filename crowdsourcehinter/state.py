@@ -0,0 +1,37 @@
+"""
+Compact per-student state of the Crowd Sourced Hinter.
+
+Students' hints and votes are kept as hint ids (see storage.hint_id) in the hint_history and
+voted_hints fields: the hints shown since the last feedback stage are a bounded window of
+[answer, hint id] pairs, and the hints voted on are a dictionary of hint ids, bounded as well, so
+looking a hint up takes constant time and the state does not grow with the student's history.
+The legacy WrongAnswers, Used and Voted lists of hint texts are moved into them the first time
+they are read, and deleted.
+"""
+
+# The largest number of [answer, hint id] pairs kept until the feedback stage. The first pair,
+# which the feedback stage asks about, is always kept; the rest are the most recent ones.
+MAX_HISTORY = 10
+# The largest number of hints a student's votes are remembered for. The oldest are forgotten first.
+MAX_VOTED = 500
+
+
+def add_to_history(history, answer, hint):
+    """
+    Return the history with the [answer, hint id] pair of a hint shown for an answer added. The hint
+    id is None if there was no hint to show.
+    """
+    history = history + [[answer, hint]]
+    if len(history) > MAX_HISTORY:
+        history = history[:1] + history[len(history) - MAX_HISTORY + 1:]
+    return history
+
+
+def add_vote(voted, hint):
+    """
+    Record a vote on the hint with an id in the {hint id: vote number} dictionary of a student's votes.
+    """
+    voted[hint] = max([0] + list(voted.values())) + 1
+    if len(voted) > MAX_VOTED:
+        for oldest in sorted(voted, key=voted.get)[:len(voted) - MAX_VOTED]:
+            del voted[oldest]
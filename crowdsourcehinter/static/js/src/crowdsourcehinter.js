@@ -4,6 +4,22 @@ function CrowdsourceHinter(runtime, element, data){
     var isShowingHintFeedback = false;
     var voted = false;
     var correctSubmission = false;
+    var moderationCursor = null;
+    //ratings made during the feedback stage, sent together by sendPendingRatings
+    var pendingRatings = [];
+    var pendingRatingsTimer = null;
+    //prefetched hints of common incorrect answers, as {"answer": [hint_id, hint]}, and its version
+    var bundle = data.bundle || {"version": null, "hints": {}};
+    var showBest = data.showBest;
+    //ids of the hints shown since the last feedback stage
+    var shownHints = data.shownHints || [];
+    //prefetched hints shown without calling get_hint, sent together by sendPendingShown
+    var pendingShown = [];
+    var pendingShownTimer = null;
+    //number of graded submissions of the problem since the page was loaded, logged with the hinter's
+    //events so that the analytics job (analytics.py) can tell whether a hint was followed by a solution
+    var attempt = 0;
+    var hintingElement = data.hinting_element;
     
     $(".crowdsourcehinter_block", element).hide();
 
@@ -19,22 +35,96 @@ function CrowdsourceHinter(runtime, element, data){
      */
     function stopScript(){
         executeHinter = false;
+        sendPendingRatings();
+        sendPendingShown();
     }
     Logger.listen('seq_next', null, stopScript);
     Logger.listen('seq_prev', null, stopScript);
     Logger.listen('seq_goto', null, stopScript);
 
     /**
-     * Get a hint to show to the student after incorrectly answering a question.
+     * Return the answer of a problem_graded event the way get_hint finds it: the text after the
+     * first equal sign, lower case, with whitespace collapsed.
+     * @param submitted is the answer data of the problem_graded event
+     */
+    function normalizeAnswer(submitted){
+        var answer = submitted.substring(submitted.indexOf("=") + 1);
+        return $.trim(answer.toLowerCase()).split(/\s+/).join(" ");
+    }
+
+    /**
+     * Get a hint to show to the student after incorrectly answering a question. The prefetched
+     * hint of the answer is shown without a request, unless the student has already seen it and
+     * the hinter is not set to show the best hint.
      * @param data is data generated by the problem_graded event
      */
     function get_hint(data){
         $(".crowdsourcehinter_block", element).show();
+        var student_answer = normalizeAnswer(unescape(data[0]));
+        var prefetched = bundle.hints[student_answer];
+        var hintAttempt = attempt;
+        if(prefetched !== undefined && (showBest || $.inArray(prefetched[0], shownHints) === -1)){
+            queueShown(student_answer, prefetched[0]);
+            showHint({"Hints": prefetched[1], "HintId": prefetched[0], "StudentAnswer": student_answer}, hintAttempt);
+            return;
+        }
         $.ajax({
             type: "POST",
             url: runtime.handlerUrl(element, 'get_hint'),
-            data: JSON.stringify({"submittedanswer": unescape(data[0])}),
-            success: showHint
+            data: JSON.stringify({"submittedanswer": unescape(data[0]), "shown": takePendingShown()}),
+            success: function(result){
+                showHint(result, hintAttempt);
+            }
+        });
+    }
+
+    /**
+     * Queue a prefetched hint that was shown, so that the feedback stage asks about it. Shown hints
+     * are sent together two seconds later, or with the next get_hint request.
+     * @param student_answer is the normalized incorrect answer
+     * @param hint_id is the id of the hint shown
+     */
+    function queueShown(student_answer, hint_id){
+        pendingShown.push({"student_answer": student_answer, "hint_id": hint_id});
+        clearTimeout(pendingShownTimer);
+        pendingShownTimer = setTimeout(sendPendingShown, 2000);
+    }
+
+    /**
+     * Return the queued prefetched hints, and empty the queue.
+     */
+    function takePendingShown(){
+        clearTimeout(pendingShownTimer);
+        var shown = pendingShown;
+        pendingShown = [];
+        return shown;
+    }
+
+    /**
+     * Send the queued prefetched hints to the server in one request, and replace the bundle of
+     * prefetched hints if the server has a newer one.
+     * @param callback is called once the hints are recorded (right away if there are none)
+     */
+    function sendPendingShown(callback){
+        var shown = takePendingShown();
+        if(shown.length === 0){
+            if(callback){
+                callback();
+            }
+            return;
+        }
+        $.ajax({
+            type: "POST",
+            url: runtime.handlerUrl(element, 'record_hints'),
+            data: JSON.stringify({"shown": shown, "version": bundle.version}),
+            success: function(result){
+                if(result.bundle){
+                    bundle = result.bundle;
+                }
+                if(callback){
+                    callback();
+                }
+            }
         });
     }
 
@@ -45,12 +135,16 @@ function CrowdsourceHinter(runtime, element, data){
     function start_feedback(){
         $('.csh_correct', element).show();
         $(".csh_hint_reveal", element).hide();
-        //send empty data for ajax call because not having a data field causes error
-        $.ajax({
-            type: "POST",
-            url: runtime.handlerUrl(element, 'get_feedback'),
-            data: JSON.stringify({}),
-            success: showStudentContribution
+        //the prefetched hints that were shown are recorded before the feedback is asked for
+        sendPendingShown(function(){
+            //send empty data for ajax call because not having a data field causes error
+            $.ajax({
+                type: "POST",
+                url: runtime.handlerUrl(element, 'get_feedback_with_ratings'),
+                data: JSON.stringify({}),
+                success: showStudentContribution
+            });
+            shownHints = [];
         });
     }
 
@@ -63,9 +157,11 @@ function CrowdsourceHinter(runtime, element, data){
     function onStudentSubmission(){ return function(event_type, data, element){
         //search method of correctness of problem is brittle due to checking for a class within
         //the problem block.
+        attempt += 1;
         if (data[1].search(/class="correct/) === -1){
             get_hint(data);
         } else { //if the correct answer is submitted
+            Logger.log('crowd_hinter.solved', {"hinting_element": hintingElement, "attempt": attempt});
             start_feedback();
         }
     }}
@@ -73,12 +169,24 @@ function CrowdsourceHinter(runtime, element, data){
 
     /**
      * Modify csh_Hints attributes to show hint to the student.
+     * @param result is the hint, as returned by get_hint
+     * @param hintAttempt is the number of the graded submission the hint was asked for
      */
-    function showHint(result){
+    function showHint(result, hintAttempt){
         $('.csh_Hints', element).attr('student_answer', result.StudentAnswer);
         $('.csh_Hints', element).attr('hint_received', result.Hints);
+        $('.csh_Hints', element).attr('hint_id', result.HintId);
+        if(result.HintId !== null){
+            shownHints.push(result.HintId);
+        }
         $('.csh_Hints', element).text("Hint: " + result.Hints);
-        Logger.log('crowd_hinter.showHint', {"student_answer": result.StudentAnswer, "hint_received": result.Hints});
+        Logger.log('crowd_hinter.showHint', {
+            "student_answer": result.StudentAnswer,
+            "hint_received": result.Hints,
+            "hint_id": result.HintId,
+            "hinting_element": hintingElement,
+            "attempt": hintAttempt
+        });
     }
 
     /**
@@ -86,15 +194,21 @@ function CrowdsourceHinter(runtime, element, data){
      * showStudentSubmissoinHistory, after the student answered the question correctly.
      * Feedback on hints at this stage consists of upvote/downvote/report buttons.
      * @param hint is the first hint that was shown to the student
+     * @param hint_id is the id of the hint, which is sent to rate it
      * @param student_answer is the first incorrect answer submitted by the student
+     * @param rating is the current rating of the hint
      */
-    function showHintFeedback(hint, student_answer){
+    function showHintFeedback(hint, hint_id, student_answer, rating){
         $(".csh_student_answer", element).each(function(){
             if ($(this).find('.csh_answer_text').attr('answer') == student_answer){
                 var html = "";
                 $(function(){
                     var data = {
-                        hint: hint
+                        hint: hint,
+                        hintvalue: hint,
+                        hint_id: hint_id,
+                        answer: student_answer,
+                        rating: rating
                     };
                     html = Mustache.render($("#show_hint_feedback").html(), data);
                 });
@@ -111,20 +225,48 @@ function CrowdsourceHinter(runtime, element, data){
     /**
      * Show options to remove or return reported hints from/to the hint pool. Called after
      * correctly answering the question, only visible to staff.
-     * @param result is the reported hint text
+     * @param report is a reported hint from the moderation queue, with its hint text, answer and report count
      */
-    function showReportedFeedback(result){
+    function showReportedFeedback(report){
         var html = "";
         $(function(){
             var template = $('#show_reported_feedback').html();
-            var data = {
-                hint: result
-            };
-            html = Mustache.render(template, data);
+            html = Mustache.render(template, report);
         });
         $(".csh_reported_hints", element).append(html);
     }
 
+    /**
+     * Load a page of the moderation queue (the reported hints) for staff.
+     * @param cursor is the cursor of the page to load, null for the first page
+     */
+    function loadModerationQueue(cursor){
+        $.ajax({
+            type: "POST",
+            url: runtime.handlerUrl(element, 'get_moderation_queue'),
+            data: JSON.stringify({"cursor": cursor}),
+            success: showModerationQueue
+        });
+    }
+
+    /**
+     * Show a page of the moderation queue, with a button to load the next page if there is one.
+     * @param result contains the reported hints of the page and the cursor of the next page
+     */
+    function showModerationQueue(result){
+        $('.csh_more_reported', element).remove();
+        $.each(result.reports, function(index, report){
+            showReportedFeedback(report);
+        });
+        moderationCursor = result.cursor;
+        if(moderationCursor !== null){
+            $(".csh_reported_hints", element).append(Mustache.render($('#show_more_reported').html(), {}));
+        }
+    }
+    $(element).on('click', '.csh_more_reported', function(){
+        loadModerationQueue(moderationCursor);
+    });
+
     /**
      * Append new divisions into html for each answer the student submitted before correctly 
      * answering the question. showHintFeedback appends new hints into these divs.
@@ -146,29 +288,24 @@ function CrowdsourceHinter(runtime, element, data){
      * the corresponding hint(s) shown to the student are displayed. Students can upvote/downvote/report
      * hints or contribute a new hint for their incorrect answer(s).
      * Only one incorrect answer and hint will be shown when the hinter is set to show best.
-     * @param result is a dictionary of incorrect answers and hints, with the index being the hint and the value
-     * being the incorrect answer
+     * @param result contains the list of incorrect answers, the hints shown for them and the hints' ratings,
+     * and for staff the first page of the moderation queue
      */
     function showStudentContribution(result){
     //Set up the student feedback stage. Each student answer and all answer-specific hints for that answer are shown
     //to the student, as well as an option to create a new hint for an answer.
-        if(data.isStaff){
+        if(data.isStaff && !isShowingHintFeedback){
             $('.crowdsourcehinter_block', element).attr('class', 'crowdsourcehinter_block_is_staff');
-            $.each(result, function(index, value) {
-                if(value == "Reported") {
-                    //index represents the reported hint's text
-                    showReportedFeedback(index);
-                }
-            });
+            showModerationQueue(result.moderation);
         }
         if(!isShowingHintFeedback){
-            $.each(result, function(index, value) {
-              if(value != "Reported"){
-                showStudentSubmissionHistory(value);
-                student_answer = value;
-                hint = index;
-                //hints return null if no answer-specific hints exist
-                if(hint === "null"){
+            $.each(result.feedback, function(index, feedback) {
+              if(feedback.student_answer != "Reported"){
+                showStudentSubmissionHistory(feedback.student_answer);
+                student_answer = feedback.student_answer;
+                hint = feedback.hint;
+                //hints are null if no answer-specific hints exist
+                if(hint === null){
                     $(".csh_student_answer", element).each(function(){
                         if ($(this).find('.csh_answer_text').attr('answer') == student_answer){
                             var html = "";
@@ -184,9 +321,9 @@ function CrowdsourceHinter(runtime, element, data){
                         }
                     });
                 }
-                //reported hints have their corresponding answer set to "Reported"
+                //otherwise show the hint with options to rate it
                 else {
-                    showHintFeedback(hint, student_answer);
+                    showHintFeedback(hint, feedback.hint_id, student_answer, feedback.rating);
                 }
               }
             });
@@ -245,24 +382,107 @@ function CrowdsourceHinter(runtime, element, data){
     }}
     $(element).on('click', '.csh_submit_new', submit_new_hint($(this)));
 
+    /**
+     * Send the ratings made during the feedback stage to the server in one request.
+     */
+    function sendPendingRatings(){
+        clearTimeout(pendingRatingsTimer);
+        if(pendingRatings.length === 0){
+            return;
+        }
+        $.ajax({
+            type: "POST",
+            url: runtime.handlerUrl(element, 'rate_hints'),
+            data: JSON.stringify({"ratings": pendingRatings})
+        });
+        pendingRatings = [];
+    }
+
+    /**
+     * Send a request that is delivered even if the page is being closed, which cancels requests
+     * made with $.ajax. Return false if the browser cannot send it (or has no navigator.sendBeacon).
+     * @param handler is the name of the handler
+     * @param data is the data sent to the handler
+     */
+    function sendBeacon(handler, data){
+        if(!navigator.sendBeacon){
+            return false;
+        }
+        return navigator.sendBeacon(runtime.handlerUrl(element, handler), JSON.stringify(data));
+    }
+
+    /**
+     * Send the queued ratings and prefetched hints when the page is hidden or closed, so that they
+     * are not lost with their timers. What cannot be sent as a beacon is sent as usual.
+     */
+    function sendPendingOnUnload(){
+        if(pendingRatings.length && sendBeacon('rate_hints', {"ratings": pendingRatings})){
+            clearTimeout(pendingRatingsTimer);
+            pendingRatings = [];
+        }
+        if(pendingShown.length && sendBeacon('record_hints', {"shown": pendingShown, "version": bundle.version})){
+            takePendingShown();
+        }
+        sendPendingRatings();
+        sendPendingShown();
+    }
+    $(window).on('pagehide beforeunload', sendPendingOnUnload);
+    $(document).on('visibilitychange', function(){
+        if(document.visibilityState === 'hidden'){
+            sendPendingOnUnload();
+        }
+    });
+
+    /**
+     * Queue a rating made during the feedback stage. Ratings are sent together once the
+     * student has stopped rating for a second.
+     * @param clicked is the rate_hint button clicked (upvote/downvote/report) in a hint's feedback
+     */
+    function queueRating(clicked){
+        var feedback = $(clicked.currentTarget).closest('.csh_hint_value');
+        var rating = clicked.currentTarget.attributes['data-rate'].value;
+        var hint = feedback.attr('value');
+        var hint_id = feedback.attr('data-hint-id');
+        var student_answer = feedback.attr('data-answer');
+        if(feedback.attr('data-rated') && rating != "report"){
+            return;
+        }
+        if(rating == "report"){
+            alert("This hint has been reported for review.");
+        } else {
+            feedback.attr('data-rated', rating);
+        }
+        Logger.log('crowd_hinter.rate_hint.click.event',
+                   {"hint": hint, "student_answer": student_answer, "rating": rating});
+        pendingRatings.push({"student_rating": rating, "hint_id": hint_id, "student_answer": student_answer});
+        clearTimeout(pendingRatingsTimer);
+        pendingRatingsTimer = setTimeout(sendPendingRatings, 1000);
+    }
+
     /**
      * Send vote data to modify a hint's rating (or mark it as reported). Triggered by
      * clicking a button to upvote, downvote, or report the hint (both before and after
-     * the student correctly submits an answer).
+     * the student correctly submits an answer). Ratings made during the feedback stage
+     * are queued and sent together.
      * @param clicked is the rate_hint button clicked (upvote/downvote/report)
      */
     function rate_hint(){ return function(clicked){
+        if($(clicked.currentTarget).closest('.csh_hint_value').length){
+            queueRating(clicked);
+            return;
+        }
         rating = clicked.currentTarget.attributes['data-rate'].value;
         if(!voted || rating=="report"){
             if (rating == "report"){
                 alert("This hint has been reported for review.");
             }
             hint = $('.csh_Hints', element).attr('hint_received');
+            hint_id = $('.csh_Hints', element).attr('hint_id');
             student_answer = $('.csh_Hints', element).attr('student_answer');
             $.ajax({
                 type: "POST",
                 url: runtime.handlerUrl(element, 'rate_hint'),
-                data: JSON.stringify({"student_rating": rating, "hint": hint, "student_answer": student_answer}),
+                data: JSON.stringify({"student_rating": rating, "hint_id": hint_id, "student_answer": student_answer}),
                 success: Logger.log('crowd_hinter.rate_hint.click.event', {"hint": hint, "student_answer": student_answer, "rating": rating})
             });
             voted = true;
@@ -277,7 +497,7 @@ function CrowdsourceHinter(runtime, element, data){
      */
     function removeFeedback(){
         $('.csh_hint_value', element).each(function(){
-            if($(this).attr('value') == hint){
+            if($(this).attr('data-hint-id') == hint_id){
                 $(this).remove();
             }
         });
@@ -290,13 +510,14 @@ function CrowdsourceHinter(runtime, element, data){
      */
     function staff_rate_hint(){ return function(clicked){
         hint = $(clicked.currentTarget).parent().find(".csh_hint").text();
+        hint_id = $(clicked.currentTarget).parent().attr('data-hint-id');
         rating = clicked.currentTarget.attributes['data-rate'].value
-        student_answer = "Reported";
+        student_answer = $(clicked.currentTarget).parent().attr('data-answer');
         Logger.log('crowd_hinter.staff_rate_hint.click.event', {"hint": hint, "student_answer": student_answer, "rating": rating});
         $.ajax({
             type: "POST",
             url: runtime.handlerUrl(element, 'rate_hint'),
-            data: JSON.stringify({"student_rating": rating, "hint": hint, "student_answer": student_answer}),
+            data: JSON.stringify({"student_rating": rating, "hint_id": hint_id, "student_answer": student_answer}),
             success: removeFeedback()
         });
     }}
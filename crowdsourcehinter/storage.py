@@ -0,0 +1,1285 @@
+"""
+Storage for the hints of the Crowd Sourced Hinter.
+
+HintStorage keeps one shard per (normalized) incorrect answer in a key-value store, so that with a
+store that reads and writes its keys separately, a request only reads and writes the shard for
+the answer it touches.
+
+The key-value store is anything with `get(key, default)`, `set(key, value)` and `delete(key)`.
+A runtime can provide one as the 'hint_storage' service; otherwise the shards are kept in a
+Dict field of the block (FieldKeyValueStore), which keeps the block working in any runtime. The
+field is a single user_state_summary value, loaded and saved whole like the old `hint_database`
+(and somewhat larger, with the revisions and use times of the shards), so the sharding only
+pays off with the service.
+
+Votes are kept as conflict-free counters (see counters.py). With a VoteBuffer, votes and new
+hints are collected in the worker process and merged into the shards in batches.
+
+Every shard has a revision, changed on every write, against which the process-level cache of
+hint rankings (see ranking.py) is validated. The list of answers has a revision as well, for the
+cache of answer indexes (see answers.py).
+
+With a RetentionPolicy (see retention.py), cold and empty answers are evicted and badly rated
+hints dropped, a few answers at a time as shards are written, or all at once with compact().
+
+Hints are referred to by their hint id, a digest of their text (see hint_id), in the shards, the
+students' state and the handlers. The texts of the hints of an answer are stored next to its
+shard, one key per hint, and deleted with the hint or the answer; the shards of a block's field
+hold their texts themselves. Since ids are derived from the text, texts are cached in the process.
+
+Hints are ranked by a score computed from their upvotes and downvotes by a HintScorer (see
+scoring.py). Scores are stored in the shards, computed in one batch for the hints whose votes
+changed whenever a shard is written (with a VoteBuffer, when votes are flushed), so showing a
+hint only reads them. Shards also count the impressions of every hint (without a VoteBuffer,
+written at most once every IMPRESSIONS_INTERVAL seconds per answer and process), and the answers
+shown most often are indexed for the prefetched hints of the student view (see prefetch.py).
+
+The values of the key-value store are cached in the process and validated against a version of
+the hinter's data that every write changes (see cache.CachedKeyValueStore), so a request for a
+hinter whose data has not changed since it was last read only reads that version.
+"""
+import bisect
+import hashlib
+import itertools
+import json
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+
+from .answers import ANSWER_INDEXES, AnswerIndex, build_index, normalize_answer
+from .cache import CachedKeyValueStore, LRUCache, VersionedCache
+from .counters import MERGED_REPLICA, REPLICA_TTL, PNCounter
+from .ranking import HintRanking, RANKINGS
+from .retention import LAST_TOUCHED, TOUCH_INTERVAL
+from .scoring import DEFAULT_SCORER, votes
+
+# Number of shard writes made by this process, for incremental compaction.
+_WRITES = itertools.count(1)
+
+# Version of the layout of the hint storage. Version 1 keyed hints by their text.
+FORMAT_VERSION = 2
+
+# Texts of the hints, keyed by hint id.
+HINT_TEXTS = LRUCache(maxsize=10000)
+
+# Values of the key-value stores of the hinters, shared by the requests of this process.
+STORAGE_CACHE = VersionedCache(max_bytes=32 * 1024 * 1024)
+
+# Replica id of the votes counted without a VoteBuffer, which are written with the shard (and are only
+# conflict-free if the key-value store merges concurrent writes of a shard, which no store here does).
+LOCAL_REPLICA = u'local'
+
+# Number of answers in the index of the answers shown most often.
+POPULAR_SIZE = 100
+
+# Impressions counted without a VoteBuffer and not written yet, keyed by (namespace, answer), as
+# {"written": time of the last write, "counts": {"hint id": count}}. They are written to the shard,
+# under LOCAL_REPLICA, at most once every IMPRESSIONS_INTERVAL seconds per answer and process.
+PENDING_IMPRESSIONS = LRUCache(maxsize=10000)
+IMPRESSIONS_INTERVAL = 60
+
+# Key of the list of the namespaces of the hinters in a key-value store (see HintStorage.mark_migrated).
+NAMESPACES_KEY = u'crowdsourcehinter:namespaces'
+
+
+def _digest(text):
+    """
+    Short, key-safe digest of a piece of text. Answers are free text, so they are never used
+    in keys directly.
+    """
+    if not isinstance(text, bytes):
+        text = text.encode('utf8')
+    return hashlib.sha1(text).hexdigest()[:16]
+
+
+def hint_id(hint):
+    """
+    Return the id of a hint: the first 12 hex digits of the SHA-1 of its text.
+    """
+    return _digest(hint)[:12]
+
+
+def upgrade_shard(shard):
+    """
+    Return a shard of the version 1 layout, keyed by hint text, in the current layout, keyed by
+    hint id, and the {"hint id": text} of its hints.
+    """
+    texts = {}
+    for hints in (shard['hints'], shard.get('counters', {}), shard.get('reported', {})):
+        for hint in hints:
+            texts[hint_id(hint)] = hint
+    upgraded = {"answer": shard['answer'], "hints": {}, "version": FORMAT_VERSION}
+    for name in ('hints', 'counters', 'reported'):
+        if name in shard:
+            upgraded[name] = dict((hint_id(hint), value) for hint, value in shard[name].items())
+    if 'removed' in shard:
+        upgraded['removed'] = [hint_id(hint) for hint in shard['removed']]
+    return upgraded, texts
+
+
+def _texts_by_id(shard):
+    """
+    Return the {"hint id": text} of the texts kept in a shard (see HintStorage.texts_in_shards).
+    """
+    return dict((hint_id(text), text) for text in shard.get('texts', []))
+
+
+def _without_text(shard, hint):
+    """
+    Return a shard without the text of a hint, which is the shard itself if it does not keep it.
+    """
+    texts = [text for text in shard.get('texts', []) if hint_id(text) != hint]
+    if len(texts) == len(shard.get('texts', [])):
+        return shard
+    return dict(shard, texts=texts)
+
+
+def _merge_impressions(impressions, other):
+    """
+    Merge {"hint id": {"replica": count}} impressions, keeping the highest count of every replica.
+    """
+    merged = dict(impressions)
+    for hint, replicas in other.items():
+        counts = dict(merged.get(hint, {}))
+        for replica, count in replicas.items():
+            counts[replica] = max(counts.get(replica, 0), count)
+        merged[hint] = counts
+    return merged
+
+
+class InMemoryKeyValueStore(object):
+    """
+    A key-value store kept in a dictionary, for tests and the workbench. Values are stored
+    serialized, as a real backend would, so callers never share mutable state with the store.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        return json.loads(self.data[key])
+
+    def set(self, key, value):
+        self.data[key] = json.dumps(value)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class FieldKeyValueStore(object):
+    """
+    A key-value store kept in a Dict field of an XBlock. This is used when the runtime does not
+    provide a 'hint_storage' service. It is no cheaper to save than the old `hint_database`,
+    but it lets the block use the same storage code in every runtime.
+
+    The runtime saves the field whole, so it gives no concurrency guarantee: when blocks that
+    changed it are saved at the same time, the last one saved wins, and the votes and hints of
+    the others are lost.
+    """
+    def __init__(self, block, field_name):
+        self.block = block
+        self.field_name = field_name
+
+    def get(self, key, default=None):
+        return getattr(self.block, self.field_name).get(key, default)
+
+    def set(self, key, value):
+        getattr(self.block, self.field_name)[key] = value
+
+    def delete(self, key):
+        getattr(self.block, self.field_name).pop(key, None)
+
+
+class SqliteKeyValueStore(object):
+    """
+    A key-value store kept in an SQLite database file, for the bulk import and export of hints
+    (see bulk.py) and for runtimes without a database of their own. Writes are committed by
+    commit() or close(); set_many() writes a batch of values at once.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hints (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM hints WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO hints (key, value) VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in values.items()),
+        )
+
+    def delete(self, key):
+        self.connection.execute("DELETE FROM hints WHERE key = ?", (key,))
+
+    def keys(self, suffix=u''):
+        """
+        Iterate over the keys that end with `suffix`, in order.
+        """
+        pattern = u'%' + suffix.replace(u'\\', u'\\\\').replace(u'%', u'\\%').replace(u'_', u'\\_')
+        query = "SELECT key FROM hints WHERE key LIKE ? ESCAPE '\\' ORDER BY key"
+        for row in self.connection.execute(query, (pattern,)):
+            yield row[0]
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class HintStorage(object):
+    """
+    Hints of one hinter, sharded by incorrect answer.
+
+    Keys in the key-value store (all prefixed with the namespace):
+      'meta': {"migrated": True, "version": FORMAT_VERSION, "blocks": ["usage id"]}, with the blocks whose
+              legacy fields have been copied in
+      'answers': list of the answers that have a shard
+      'answers-revision': changes whenever an answer is added to 'answers'
+      'reports': {"answer": ["hint id"]}, the reported hints of every answer (the moderation queue)
+      'popular': {"answer": impressions}, the POPULAR_SIZE answers whose hints were shown most often
+      'hints:<answer digest>': the shard of an answer, a dictionary of
+        "answer": the answer
+        "hints": {"hint id": rating}, the ratings hints had before votes were counted
+        "counters": {"hint id": PNCounter}, the votes on each hint
+        "impressions": {"hint id": {"replica": count}}, the number of times each replica showed each hint
+        "replicas": {"replica": time}, the time (in seconds) at which each replica last wrote its votes
+        "scores": {"hint id": score}, the scores the hints are ranked by
+        "conversions": {"hint id": {"source": {"shown": count, "solved": count}}}, how often students
+                       shown each hint solved the problem soon after, by analytics job (see analytics.py)
+        "reported": {"hint id": ["reporter"]}, the hints that have been reported and who reported them
+        "removed": list of the ids of the hints that staff removed
+        "texts": the texts of the hints, only with `texts_in_shards`; their ids are their digests
+        "version": FORMAT_VERSION
+      'revision:<answer digest>': changes whenever the shard is written
+      'text:<answer digest>:<hint id>': the text of a hint of an answer, unless `texts_in_shards` is set.
+                                        It is deleted when the hint is removed or the answer evicted.
+      'used:<answer digest>': the time (in seconds) at which the answer was last used, roughly
+      'compaction-cursor': the position in 'answers' at which the next incremental compaction starts
+      'version': changes whenever anything but 'used' and 'compaction-cursor' is written, if the storage has a cache
+
+    The namespace is also added to the list in NAMESPACES_KEY, which is not prefixed, when the storage is
+    marked as migrated, so that bulk exports can find it in stores that cannot list their keys.
+
+    The rating of a hint is its rating in "hints" plus the value of its counter. A hint exists
+    if it is in either of them and not in "removed"; removal is permanent. The score of a hint
+    is computed from its upvotes and downvotes (see scoring.votes) by the storage's scorer.
+    Compaction folds the counters and impressions of the replicas that have not written a shard
+    for counters.REPLICA_TTL seconds into those of counters.MERGED_REPLICA.
+
+    Shards that have been read are remembered for the lifetime of the HintStorage object,
+    which is created once per block instance (and therefore once per request). With a `cache`
+    (by default the process' STORAGE_CACHE), the key-value store is read through it and every
+    write changes 'version'; every HintStorage on a store that is shared between processes must
+    use one. The hint_shards field (see FieldKeyValueStore) is used with cache=None: the runtime
+    loads the field whole, so reading its version would cost as much as reading every value, and
+    caching would save nothing. It is also used with `texts_in_shards`, since separate keys for
+    the texts would only add their size to the field.
+    """
+    def __init__(self, kvs, namespace, vote_buffer=None, retention=None, scorer=None, cache=STORAGE_CACHE,
+                 texts_in_shards=False):
+        self.namespace = namespace
+        self.texts_in_shards = texts_in_shards
+        # the key-value store without the cache, which the vote buffer writes with a HintStorage of its own
+        self.backend = kvs
+        if cache is not None:
+            # the times answers were used are only read by compactions
+            uncached = [self._key(u'used', u''), self._key(u'compaction-cursor')]
+            kvs = CachedKeyValueStore(kvs, self._key(u'version'), cache, uncached)
+        self.kvs = kvs
+        self.vote_buffer = vote_buffer
+        self.retention = retention
+        self.scorer = scorer or DEFAULT_SCORER
+        self._shards = {}
+        self._ratings = {}
+        self._compacting = False
+        self._meta = None
+        # texts read or added by this object, and the texts of upgraded shards, to write with them
+        self._texts = {}
+        self._pending_texts = {}
+
+    def _key(self, *parts):
+        return u":".join((self.namespace,) + parts)
+
+    def _shard_key(self, answer):
+        return self._key(u'hints', _digest(answer))
+
+    def _load(self, answer):
+        if answer not in self._shards:
+            shard = self.kvs.get(self._shard_key(answer)) or {"answer": answer, "hints": {}, "version": FORMAT_VERSION}
+            if shard.get('version') != FORMAT_VERSION:
+                # the texts of an upgraded shard are written with it
+                shard, texts = upgrade_shard(shard)
+                if self.texts_in_shards:
+                    shard['texts'] = sorted(texts.values())
+                else:
+                    self._pending_texts[answer] = texts
+                self._texts.update(texts)
+            self._shards[answer] = shard
+        return self._shards[answer]
+
+    def _text_key(self, answer, hint):
+        return self._key(u'text', _digest(answer), hint)
+
+    def hint_text(self, hint, answer):
+        """
+        Return the text of a hint of an answer, or None if it is unknown.
+        """
+        text = self._texts.get(hint) or HINT_TEXTS.get(hint)
+        if text is None:
+            answer = normalize_answer(answer)
+            text = _texts_by_id(self._load(answer)).get(hint)
+            if text is None and not self.texts_in_shards:
+                text = self.kvs.get(self._text_key(answer, hint))
+            if text is not None:
+                HINT_TEXTS.set(hint, text)
+        return text
+
+    def _delete_texts(self, answer, hints):
+        """
+        Delete the stored texts of hints of an answer, unless the texts are kept in the shards.
+        """
+        if not self.texts_in_shards:
+            for hint in hints:
+                self.kvs.delete(self._text_key(answer, hint))
+
+    def _revision_key(self, answer):
+        return self._key(u'revision', _digest(answer))
+
+    def _used_key(self, answer):
+        return self._key(u'used', _digest(answer))
+
+    def _save(self, answer, shard, changed=()):
+        """
+        Write the shard of an answer and return its new revision. `changed` are the hints whose rating
+        or reported status changed; a cached ranking that was current is updated for them instead of
+        being dropped.
+        """
+        old_revision = self.kvs.get(self._revision_key(answer))
+        if old_revision is None:
+            # only a new shard can be missing from the list of answers
+            answers = self.answers()
+            if answer not in answers:
+                self._add_answer(answers, answer)
+        revision = uuid.uuid4().hex[:8]
+        self._score([shard], changed)
+        self._shards[answer] = shard
+        self._ratings.pop(answer, None)
+        # in this order, so that a reader never sees the new revision with the old shard
+        values = OrderedDict(
+            (self._text_key(answer, hint), text) for hint, text in self._pending_texts.pop(answer, {}).items()
+        )
+        values[self._shard_key(answer)] = shard
+        values[self._revision_key(answer)] = revision
+        self._write(values)
+        ranking = RANKINGS.get((self.namespace, answer))
+        if ranking is not None:
+            if ranking.revision == old_revision:
+                self._rerank(answer, changed)
+                ranking.revision = revision
+            else:
+                RANKINGS.delete((self.namespace, answer))
+        policy = self.retention
+        if policy is not None and policy.compact_every and not self._compacting:
+            if next(_WRITES) % policy.compact_every == 0:
+                self.compact_step()
+        return revision
+
+    def _add_answer(self, answers, answer):
+        old_revision = self.kvs.get(self._key(u'answers-revision'))
+        revision = uuid.uuid4().hex[:8]
+        self._write(OrderedDict((
+            (self._key(u'answers'), answers + [answer]), (self._key(u'answers-revision'), revision),
+        )))
+        index = ANSWER_INDEXES.get(self.namespace)
+        if index is not None:
+            if index.revision == old_revision:
+                index.add(answer)
+                index.revision = revision
+            else:
+                ANSWER_INDEXES.delete(self.namespace)
+
+    def _score(self, shards, changed=None):
+        """
+        Store the scores of the hints of shards, computed in one batch: those of the hints in
+        `changed` (of every hint if it is None) and of the hints that have no score yet. Hints
+        without votes are not stored with a score (see scores).
+        """
+        changed = set(changed) if changed is not None else None
+        stale = []
+        for shard in shards:
+            stored = shard.get('scores', {})
+            ratings = shard['hints']
+            counters = shard.get('counters', {})
+            conversions = shard.get('conversions', {})
+            scores = {}
+            for hint in set(ratings).union(counters):
+                if hint in stored and changed is not None and hint not in changed:
+                    scores[hint] = stored[hint]
+                else:
+                    ups, downs = votes(ratings.get(hint, 0), counters.get(hint))
+                    ups, downs = self.scorer.evidence(ups, downs, conversions.get(hint))
+                    if ups or downs:
+                        stale.append((scores, hint, ups, downs))
+            if scores or stale:
+                shard['scores'] = scores
+            else:
+                shard.pop('scores', None)
+        if stale:
+            _, _, ups, downs = zip(*stale)
+            for (scores, hint, _, _), score in zip(stale, self.scorer.scores(ups, downs)):
+                scores[hint] = score
+
+    def _rerank(self, answer, changed):
+        """
+        Update the cached ranking of an answer, if there is one, for the changed hints.
+        """
+        ranking = RANKINGS.get((self.namespace, answer))
+        if ranking is None:
+            return
+        scores = self.scores(answer)
+        reported = self._load(answer).get('reported', {})
+        for hint in changed:
+            if hint not in scores:
+                ranking.remove(hint)
+                continue
+            ranking.set_score(hint, scores[hint])
+            if hint in reported:
+                ranking.report(hint)
+            else:
+                ranking.unreport(hint)
+
+    def _counters(self, answer, shard):
+        """
+        Return the merged {"hint id": PNCounter} of an answer: the stored counters and the
+        counters of this process that have not been flushed yet.
+        """
+        counters = dict(
+            (hint, PNCounter.from_json(counter)) for hint, counter in shard.get('counters', {}).items()
+        )
+        if self.vote_buffer is not None:
+            for hint, counter in self.vote_buffer.counters(self.namespace, answer, shard.get('counters', {})).items():
+                counters.setdefault(hint, PNCounter()).merge(counter)
+        return counters
+
+    def answers(self):
+        """
+        Return the list of answers that have a shard.
+        """
+        return self.kvs.get(self._key(u'answers'), [])
+
+    def answer_index(self):
+        """
+        Return the AnswerIndex of the answers that have a shard. The cached index is used if no
+        answer has been added since it was built. Otherwise a new one is built in the background
+        (see build_index), and until it is ready the cached index is used, or if there is none, an
+        empty one, which matches no answer.
+        """
+        revision = self.kvs.get(self._key(u'answers-revision'))
+        index = ANSWER_INDEXES.get(self.namespace)
+        if index is None or index.revision != revision:
+            build_index(self.namespace, self.answers, revision)
+            if index is None:
+                return AnswerIndex()
+        return index
+
+    def get_hints(self, answer):
+        """
+        Return the {"hint id": rating} dictionary for an answer. It is empty for unknown answers.
+        The dictionary must not be modified; use the methods below to make changes.
+        """
+        answer = normalize_answer(answer)
+        if answer not in self._ratings:
+            shard = self._load(answer)
+            ratings = dict(shard['hints'])
+            for hint, counter in self._counters(answer, shard).items():
+                ratings[hint] = ratings.get(hint, 0) + counter.value
+            for hint in shard.get('removed', []):
+                ratings.pop(hint, None)
+            self._ratings[answer] = ratings
+        return self._ratings[answer]
+
+    def revisions(self, answers):
+        """
+        Return the list of the revisions of the shards of answers (None for answers without a shard).
+        """
+        return [self.kvs.get(self._revision_key(answer)) for answer in answers]
+
+    def popular_answers(self, limit=POPULAR_SIZE):
+        """
+        Return the answers whose hints were shown most often, most shown first.
+        """
+        popular = self.kvs.get(self._key(u'popular'), {})
+        return sorted(popular, key=lambda answer: (-popular[answer], answer))[:limit]
+
+    def update_popular(self, answers):
+        """
+        Update the index of the answers shown most often with the impressions of answers, as
+        counted in their shards.
+        """
+        popular = self.kvs.get(self._key(u'popular'), {})
+        updated = dict(popular)
+        for answer in answers:
+            shard = self._load(normalize_answer(answer))
+            impressions = sum(sum(replicas.values()) for replicas in shard.get('impressions', {}).values())
+            if impressions:
+                updated[normalize_answer(answer)] = impressions
+        if len(updated) > POPULAR_SIZE:
+            updated = dict(sorted(updated.items(), key=lambda item: (-item[1], item[0]))[:POPULAR_SIZE])
+        if updated != popular:
+            self.kvs.set(self._key(u'popular'), updated)
+
+    def scores(self, answer):
+        """
+        Return the {"hint id": score} dictionary of the stored hints of an answer. Hints without
+        votes have the score of no votes, which is not stored. Hints added or voted on since the
+        votes were last flushed keep their stored score (or have none) until the next flush.
+        """
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        if 'scores' not in shard:
+            # shards written before hints were scored are scored as they are read
+            shard = self._shards[answer] = dict(shard)
+            self._score([shard])
+        stored = shard.get('scores', {})
+        unvoted = self.scorer.score(0, 0)
+        return dict((hint, stored.get(hint, unvoted)) for hint in set(shard['hints']).union(shard.get('counters', {})))
+
+    def counts(self, answer):
+        """
+        Return the {"hint id": {"ups": upvotes, "downs": downvotes, "impressions": impressions}}
+        of the hints of an answer, with the votes and impressions of this process that have not
+        been flushed yet.
+        """
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        counters = self._counters(answer, shard)
+        impressions = shard.get('impressions', {})
+        buffered = {}
+        if self.vote_buffer is not None:
+            buffered = self.vote_buffer.impressions(self.namespace, answer, impressions)
+        pending = (PENDING_IMPRESSIONS.get((self.namespace, answer)) or {}).get('counts', {})
+        counts = {}
+        for hint in self.get_hints(answer):
+            rating = shard['hints'].get(hint, 0)
+            counter = counters.get(hint, PNCounter())
+            replicas = dict(impressions.get(hint, {}))
+            if hint in buffered:
+                replica = self.vote_buffer.replica
+                replicas[replica] = max(replicas.get(replica, 0), buffered[hint])
+            if hint in pending:
+                replicas[LOCAL_REPLICA] = replicas.get(LOCAL_REPLICA, 0) + pending[hint]
+            counts[hint] = {
+                "ups": max(rating, 0) + counter.ups,
+                "downs": max(-rating, 0) + counter.downs,
+                "impressions": sum(replicas.values()),
+            }
+        return counts
+
+    def ranking(self, answer):
+        """
+        Return the HintRanking of an answer, by stored score. The cached ranking is used if the
+        shard has not been written since it was built.
+        """
+        answer = normalize_answer(answer)
+        revision = self.kvs.get(self._revision_key(answer))
+        ranking = RANKINGS.get((self.namespace, answer))
+        if ranking is None or ranking.revision != revision:
+            ranking = HintRanking(self.scores(answer), self._load(answer).get('reported', {}), revision)
+            RANKINGS.set((self.namespace, answer), ranking)
+        return ranking
+
+    def has_hint(self, answer, hint):
+        return hint in self.get_hints(answer)
+
+    def add_hint(self, answer, text, rating=0):
+        """
+        Add a hint for an answer and return its id. An existing hint keeps its rating, and removed
+        hints are not added again.
+        """
+        answer = normalize_answer(answer)
+        hint = hint_id(text)
+        shard = self._load(answer)
+        if hint in self.get_hints(answer) or hint in shard.get('removed', []):
+            return hint
+        self._texts[hint] = text
+        HINT_TEXTS.set(hint, text)
+        if self.texts_in_shards:
+            shard = dict(shard, texts=shard.get('texts', []) + [text])
+        else:
+            self.kvs.set(self._text_key(answer, hint), text)
+        if self.vote_buffer is not None and not rating and not self.texts_in_shards:
+            # a counter without votes is enough to make the hint exist; it is ranked once flushed
+            self.vote_buffer.add(self.backend, self.namespace, answer, hint, 0)
+            self._ratings.pop(answer, None)
+            self.vote_buffer.flush_if_due()
+        else:
+            shard = dict(shard, hints=dict(shard['hints']))
+            shard['hints'][hint] = rating
+            self._save(answer, shard, [hint])
+        return hint
+
+    def change_rating(self, answer, hint, delta):
+        """
+        Add delta to the rating of a hint and return the new rating. With a VoteBuffer, the score
+        of the hint changes when the vote is flushed. Votes on hints the answer does not have are
+        dropped, and their rating is 0.
+        """
+        answer = normalize_answer(answer)
+        ratings = self.get_hints(answer)
+        if hint not in ratings:
+            return 0
+        if self.vote_buffer is not None:
+            self.vote_buffer.add(self.backend, self.namespace, answer, hint, delta)
+            # flushing the vote does not change the rating, so the ratings are updated rather than read again
+            ratings = self._ratings[answer] = dict(ratings)
+            ratings[hint] += delta
+            self.vote_buffer.flush_if_due()
+        else:
+            shard = self._load(answer)
+            counter = PNCounter.from_json(shard.get('counters', {}).get(hint, {}))
+            counter.add(LOCAL_REPLICA, delta)
+            shard = dict(shard, counters=dict(shard.get('counters', {})))
+            shard['counters'][hint] = counter.to_json()
+            self._save(answer, shard, [hint])
+        return self.get_hints(answer).get(hint, 0)
+
+    def record_impression(self, answer, hint):
+        """
+        Count that a hint was shown for an answer. With a VoteBuffer, showing a hint never writes
+        the hint storage. Without one, the impressions of the process are written to the shard, and
+        the answer to the index of the answers shown most often, at most once every
+        IMPRESSIONS_INTERVAL seconds per answer, so that most requests that show a hint do not
+        change the hint storage.
+        """
+        answer = normalize_answer(answer)
+        if self.vote_buffer is not None:
+            self.vote_buffer.show(self.backend, self.namespace, answer, hint)
+            self.vote_buffer.flush_if_due()
+            return
+        pending = PENDING_IMPRESSIONS.get((self.namespace, answer))
+        if pending is None:
+            pending = {'written': 0, 'counts': {}}
+            PENDING_IMPRESSIONS.set((self.namespace, answer), pending)
+        pending['counts'][hint] = pending['counts'].get(hint, 0) + 1
+        now = time.time()
+        if now - pending['written'] < IMPRESSIONS_INTERVAL:
+            return
+        counts, pending['counts'], pending['written'] = pending['counts'], {}, now
+        shard = self._load(answer)
+        impressions = dict(shard.get('impressions', {}))
+        for hint, count in counts.items():
+            # impressions of hints removed since they were shown are dropped
+            if hint in shard['hints'] and hint not in shard.get('removed', []):
+                impressions[hint] = dict(impressions.get(hint, {}))
+                impressions[hint][LOCAL_REPLICA] = impressions[hint].get(LOCAL_REPLICA, 0) + count
+        if impressions != shard.get('impressions', {}):
+            self._save(answer, dict(shard, impressions=impressions))
+            self.update_popular([answer])
+
+    def reload(self, answer):
+        """
+        Read the shard of an answer again, and return it.
+        """
+        answer = normalize_answer(answer)
+        self._shards.pop(answer, None)
+        self._ratings.pop(answer, None)
+        return self._load(answer)
+
+    def merge_counters(self, answer, counters, impressions=None, replica=None):
+        """
+        Merge {"hint id": PNCounter} into the stored counters of an answer, and the impressions
+        {"hint id": count} of a replica into the stored impressions, record that the replica wrote
+        the shard, and rescore the hints voted on. Counters and impressions of removed hints are
+        dropped. The shard should have been read just before (see reload), so that counters
+        written by other replicas since it was loaded are kept.
+
+        Returns the revision of the shard written. A concurrent write may overwrite the merged
+        counters, so the VoteBuffer checks them later (see has_counters).
+        """
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        removed = shard.get('removed', [])
+        counters = dict((hint, counter) for hint, counter in counters.items() if hint not in removed)
+        impressions = dict((hint, count) for hint, count in (impressions or {}).items() if hint not in removed)
+        merged = dict(shard.get('counters', {}))
+        for hint, counter in counters.items():
+            merged[hint] = PNCounter.from_json(merged.get(hint, {})).merge(counter).to_json()
+        shard = dict(shard, counters=merged)
+        if impressions:
+            shard['impressions'] = _merge_impressions(shard.get('impressions', {}), dict(
+                (hint, {replica: count}) for hint, count in impressions.items()
+            ))
+        if replica is not None:
+            shard['replicas'] = dict(shard.get('replicas', {}))
+            shard['replicas'][replica] = int(time.time())
+        return self._save(answer, shard, counters.keys())
+
+    def has_counters(self, answer, counters, impressions=None, replica=None):
+        """
+        Return whether the stored counters of an answer include {"hint id": PNCounter}, and its stored
+        impressions the impressions {"hint id": count} of a replica. A write that read the shard before
+        merge_counters wrote it may overwrite the merged counters, so the VoteBuffer checks them until
+        the shard has not been written for a while. Removed hints are left out, as merge_counters drops them.
+        """
+        stored = self.kvs.get(self._shard_key(normalize_answer(answer))) or {}
+        removed = stored.get('removed', [])
+        counters = dict((hint, counter) for hint, counter in counters.items() if hint not in removed)
+        impressions = dict((hint, count) for hint, count in (impressions or {}).items() if hint not in removed)
+        stored_counters = stored.get('counters', {})
+        return all(
+            PNCounter.from_json(stored_counters.get(hint, {})).merge(counter).to_json() == stored_counters.get(hint)
+            for hint, counter in counters.items()
+        ) and all(
+            stored.get('impressions', {}).get(hint, {}).get(replica, 0) >= count for hint, count in impressions.items()
+        )
+
+    def _set_reported(self, answer, shard, reported, hint):
+        """
+        Save the reported hints of an answer and update the moderation queue if the set of
+        reported hints changed.
+        """
+        self._save(answer, dict(shard, reported=reported), [hint])
+        if sorted(reported) != sorted(shard.get('reported', {})):
+            index = self.kvs.get(self._key(u'reports'), {})
+            if reported:
+                index[answer] = sorted(reported)
+            else:
+                index.pop(answer, None)
+            self.kvs.set(self._key(u'reports'), index)
+
+    def report_hint(self, answer, hint, reporter=None):
+        """
+        Mark a hint as reported, which keeps it from being shown until it is unreported.
+        """
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        reporters = shard.get('reported', {}).get(hint, [])
+        if hint not in shard.get('reported', {}) or (reporter is not None and reporter not in reporters):
+            reported = dict(shard.get('reported', {}))
+            reported[hint] = reporters + ([reporter] if reporter is not None else [])
+            self._set_reported(answer, shard, reported, hint)
+
+    def unreport_hint(self, answer, hint):
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        if hint in shard.get('reported', {}):
+            reported = dict(shard['reported'])
+            del reported[hint]
+            # a reported hint that is not stored (see migrate) is gone once unreported, and so is its text
+            stored = hint in self.get_hints(answer)
+            if not stored:
+                shard = _without_text(shard, hint)
+            self._set_reported(answer, shard, reported, hint)
+            if not stored:
+                self._delete_texts(answer, [hint])
+
+    def remove_hint(self, answer, hint):
+        answer = normalize_answer(answer)
+        shard = self._load(answer)
+        if hint not in shard.get('removed', []):
+            self.unreport_hint(answer, hint)
+            shard = _without_text(self._load(answer), hint)
+            shard = dict(shard, hints=dict(shard['hints']), counters=dict(shard.get('counters', {})))
+            shard['hints'].pop(hint, None)
+            shard['counters'].pop(hint, None)
+            for name in ('impressions', 'conversions'):
+                if hint in shard.get(name, {}):
+                    shard[name] = dict(shard[name])
+                    del shard[name][hint]
+            shard['removed'] = shard.get('removed', []) + [hint]
+            self._save(answer, shard, [hint])
+            self._delete_texts(answer, [hint])
+
+    def reported_answers(self, hint):
+        """
+        Return the answers for which a hint has been reported.
+        """
+        index = self.kvs.get(self._key(u'reports'), {})
+        return [answer for answer, hints in index.items() if hint in hints]
+
+    def moderation_queue(self, cursor=None, limit=20):
+        """
+        Return a page of the reported hints, ordered by answer and hint id, and the cursor of the next page
+        (None on the last page). The cost depends on the number of reported hints and the page size,
+        not on the size of the hint database.
+
+        Args:
+          cursor: the cursor returned with the previous page, or None for the first page
+          limit: the maximum number of reported hints on the page
+
+        Returns:
+          ([{"answer", "hint_id", "hint", "rating", "ups", "downs", "impressions", "count", "reporters"}], cursor)
+        """
+        index = self.kvs.get(self._key(u'reports'), {})
+        entries = sorted((answer, hint) for answer, hints in index.items() for hint in hints)
+        start = bisect.bisect_right(entries, tuple(cursor)) if cursor else 0
+        page = []
+        for answer, hint in entries[start:start + limit]:
+            reporters = self._load(answer).get('reported', {}).get(hint, [])
+            counts = self.counts(answer).get(hint, {"ups": 0, "downs": 0, "impressions": 0})
+            page.append({
+                "answer": answer,
+                "hint_id": hint,
+                "hint": self.hint_text(hint, answer),
+                "rating": self.get_hints(answer).get(hint, 0),
+                "ups": counts["ups"],
+                "downs": counts["downs"],
+                "impressions": counts["impressions"],
+                "count": len(reporters),
+                "reporters": reporters,
+            })
+        if start + limit < len(entries):
+            return page, list(entries[start + limit - 1])
+        return page, None
+
+    def gauges(self):
+        """
+        Return the number of answers and of reported hints, which are cheap to read.
+        """
+        reports = self.kvs.get(self._key(u'reports'), {})
+        return {'answers': len(self.answers()), 'reported': sum(len(hints) for hints in reports.values())}
+
+    def size(self):
+        """
+        Return the gauges with the number of hints and the size in bytes of the stored hints
+        (the serialized shards and texts, list of answers and reports). This reads every shard
+        and text.
+        """
+        size = self.gauges()
+        answers = self.answers()
+        size['hints'] = sum(len(self.get_hints(answer)) for answer in answers)
+        size['bytes'] = sum(len(json.dumps(self._load(answer))) for answer in answers) + len(json.dumps(answers)) + len(
+            json.dumps(self.kvs.get(self._key(u'reports'), {}))
+        )
+        if not self.texts_in_shards:
+            size['bytes'] += sum(
+                len(json.dumps(self.hint_text(hint, answer))) for answer in answers for hint in self.get_hints(answer)
+            )
+        return size
+
+    def touch(self, answer):
+        """
+        Record that an answer was used, for the retention policy. This is written at most once
+        every TOUCH_INTERVAL seconds per answer and process, and only for answers with a shard.
+        """
+        answer = normalize_answer(answer)
+        now = time.time()
+        if now - LAST_TOUCHED.get((self.namespace, answer), 0) < TOUCH_INTERVAL:
+            return
+        LAST_TOUCHED.set((self.namespace, answer), now)
+        if self.kvs.get(self._revision_key(answer)) is not None:
+            self.kvs.set(self._used_key(answer), int(now))
+
+    def _last_used(self, answer, now):
+        """
+        Return the time an answer was last used. Answers used before their use was recorded
+        are recorded as used now.
+        """
+        last_used = self.kvs.get(self._used_key(answer))
+        if last_used is None:
+            last_used = int(now)
+            self.kvs.set(self._used_key(answer), last_used)
+        return last_used
+
+    def evict(self, answers):
+        """
+        Delete the shards of answers, and the texts of their hints, and remove them from the list of answers.
+        """
+        evicted = set(answers)
+        if not evicted:
+            return
+        for answer in evicted:
+            shard = self._load(answer)
+            self._delete_texts(answer, set(shard['hints']).union(shard.get('counters', {}), shard.get('reported', {})))
+            self.kvs.delete(self._shard_key(answer))
+            self.kvs.delete(self._revision_key(answer))
+            self.kvs.delete(self._used_key(answer))
+            self._shards.pop(answer, None)
+            self._ratings.pop(answer, None)
+            RANKINGS.delete((self.namespace, answer))
+        self.kvs.set(self._key(u'answers'), [answer for answer in self.answers() if answer not in evicted])
+        self.kvs.set(self._key(u'answers-revision'), uuid.uuid4().hex[:8])
+        popular = self.kvs.get(self._key(u'popular'), {})
+        if evicted.intersection(popular):
+            self.kvs.set(self._key(u'popular'), dict(
+                (answer, impressions) for answer, impressions in popular.items() if answer not in evicted
+            ))
+        ANSWER_INDEXES.delete(self.namespace)
+
+    def compact(self, policy=None, answers=None):
+        """
+        Apply a retention policy (by default the storage's own) to some answers, or to all of them.
+        Only a compaction of all the answers enforces the policy's `max_answers`. The idle replicas
+        of the compacted answers are folded as well (see the class docstring).
+
+        Returns:
+          {"evicted_answers": number of answers evicted, "dropped_hints": number of hints dropped}
+        """
+        policy = policy or self.retention
+        full = answers is None
+        answers = self.answers() if full else answers
+        now = time.time()
+        reports = self.kvs.get(self._key(u'reports'), {})
+        evicted = []
+        kept = []
+        dropped = 0
+        self._compacting = True
+        try:
+            for answer in answers:
+                self._fold_replicas(answer, now)
+                shard = self._load(answer)
+                for hint in policy.hints_to_drop(self.get_hints(answer), self._counters(answer, shard)):
+                    self.remove_hint(answer, hint)
+                    dropped += 1
+                if answer in reports:
+                    continue
+                last_used = self._last_used(answer, now)
+                shard = self._load(answer)
+                ratings = self.get_hints(answer)
+                counters = self._counters(answer, shard)
+                if policy.should_evict(ratings, counters, shard.get('removed', []), last_used, now):
+                    evicted.append(answer)
+                else:
+                    kept.append((last_used, answer))
+            if full and policy.max_answers is not None:
+                excess = len(answers) - len(evicted) - policy.max_answers
+                evicted.extend(answer for _, answer in sorted(kept)[:max(excess, 0)])
+            self.evict(evicted)
+        finally:
+            self._compacting = False
+        return {"evicted_answers": len(evicted), "dropped_hints": dropped}
+
+    def _fold_replicas(self, answer, now):
+        """
+        Fold the counters and impressions of the replicas that have not written the shard of an
+        answer for REPLICA_TTL seconds into those of MERGED_REPLICA.
+        """
+        shard = self._load(answer)
+        if not any(now - written > REPLICA_TTL for written in shard.get('replicas', {}).values()):
+            return
+        # read again, so that as few votes as possible are written between the read and the write
+        shard = self.reload(answer)
+        idle = [replica for replica, written in shard.get('replicas', {}).items() if now - written > REPLICA_TTL]
+        if not idle:
+            return
+        counters = dict(
+            (hint, PNCounter.from_json(counter).fold(idle).to_json())
+            for hint, counter in shard.get('counters', {}).items()
+        )
+        impressions = {}
+        for hint, replicas in shard.get('impressions', {}).items():
+            replicas = dict(replicas)
+            for replica in idle:
+                if replica in replicas and replica != MERGED_REPLICA:
+                    replicas[MERGED_REPLICA] = replicas.get(MERGED_REPLICA, 0) + replicas.pop(replica)
+            impressions[hint] = replicas
+        shard = dict(shard, counters=counters, impressions=impressions, replicas=dict(
+            (replica, written) for replica, written in shard['replicas'].items() if replica not in idle
+        ))
+        for name in ('counters', 'impressions', 'replicas'):
+            if not shard[name]:
+                del shard[name]
+        self._save(answer, shard)
+
+    def compact_step(self):
+        """
+        Compact the next `batch_size` answers, continuing where the previous step stopped.
+        """
+        answers = self.answers()
+        start = self.kvs.get(self._key(u'compaction-cursor'), 0)
+        if start >= len(answers):
+            start = 0
+        batch = answers[start:start + self.retention.batch_size]
+        evicted = self.compact(answers=batch)['evicted_answers']
+        self.kvs.set(self._key(u'compaction-cursor'), start + len(batch) - evicted)
+
+    def bulk_update(self, updates):
+        """
+        Apply many changes with one write per shard, and at most one write of the list of answers
+        and of the reported hints. This is the API for importing hints and for offline jobs.
+
+        Args:
+          updates: {"answer": [change]}, where a change is a dictionary with the "hint" text (or the
+          "hint_id" of a stored hint) and any of
+            "rating": the rating the hint has before votes are counted, which replaces the stored one
+                      (a hint that is not stored yet is added with a rating of 0 if this is missing,
+                      unless the change only reports it or only has its conversions)
+            "counter": votes on the hint, as PNCounter JSON, merged into the stored ones
+            "impressions": {"replica": count}, the times the hint was shown, merged into the stored ones
+            "reporters": people who reported the hint (an empty list reports it without a reporter)
+            "conversions": {"source": {"shown": count, "solved": count}}, replacing the stored conversions
+                           of the same sources; conversions of hints that are not stored are ignored
+            "removed": True to remove the hint, permanently
+          Answers are normalized, and the changes of answers that only differ in case or whitespace
+          are applied in order to the same shard.
+        """
+        values = {}
+        # the texts of removed hints
+        deleted = []
+        new_answers = []
+        reports = {}
+        grouped = OrderedDict()
+        for answer, changes in updates.items():
+            grouped.setdefault(normalize_answer(answer), []).extend(changes)
+        for answer, changes in grouped.items():
+            self._shards.pop(answer, None)
+            shard = self._load(answer)
+            hints = dict(shard['hints'])
+            counters = dict(shard.get('counters', {}))
+            impressions = dict(shard.get('impressions', {}))
+            conversions = dict(shard.get('conversions', {}))
+            reported = dict(shard.get('reported', {}))
+            removed = list(shard.get('removed', []))
+            texts = _texts_by_id(shard)
+            # the hints whose text is stored already
+            known = set(hints).union(counters, reported)
+            for hint, text in self._pending_texts.pop(answer, {}).items():
+                values[self._text_key(answer, hint)] = text
+            for change in changes:
+                if 'hint_id' in change:
+                    hint = change['hint_id']
+                else:
+                    hint = hint_id(change['hint'])
+                    self._texts[hint] = change['hint']
+                    if hint not in removed and hint not in known:
+                        known.add(hint)
+                        if self.texts_in_shards:
+                            texts[hint] = change['hint']
+                        else:
+                            values[self._text_key(answer, hint)] = change['hint']
+                if change.get('removed'):
+                    for stored in (hints, counters, impressions, conversions, reported, texts):
+                        stored.pop(hint, None)
+                    values.pop(self._text_key(answer, hint), None)
+                    deleted.append(self._text_key(answer, hint))
+                    if hint not in removed:
+                        removed.append(hint)
+                    continue
+                if hint in removed:
+                    continue
+                if 'rating' in change:
+                    hints[hint] = change['rating']
+                elif hint not in hints and hint not in counters and (
+                        set(change) == set(['hint'])
+                        or set(change) - set(['hint', 'hint_id', 'reporters', 'conversions'])
+                ):
+                    hints[hint] = 0
+                if 'counter' in change:
+                    counter = PNCounter.from_json(counters.get(hint, {})).merge(PNCounter.from_json(change['counter']))
+                    counters[hint] = counter.to_json()
+                if 'impressions' in change:
+                    impressions = _merge_impressions(impressions, {hint: change['impressions']})
+                if 'conversions' in change and (hint in hints or hint in counters):
+                    sources = dict(conversions.get(hint, {}))
+                    sources.update(change['conversions'])
+                    conversions[hint] = sources
+                if 'reporters' in change:
+                    reporters = reported.get(hint, [])
+                    reported[hint] = reporters + [
+                        reporter for reporter in change['reporters'] if reporter not in reporters
+                    ]
+            shard = {"answer": answer, "hints": hints, "version": FORMAT_VERSION}
+            for name, value in (
+                ('counters', counters), ('impressions', impressions), ('conversions', conversions),
+                ('reported', reported), ('removed', removed), ('texts', sorted(texts.values())),
+            ):
+                if value:
+                    shard[name] = value
+            if sorted(reported) != sorted(self._load(answer).get('reported', {})):
+                reports[answer] = sorted(reported)
+            self._shards[answer] = shard
+            self._ratings.pop(answer, None)
+            RANKINGS.delete((self.namespace, answer))
+            values[self._shard_key(answer)] = shard
+            values[self._revision_key(answer)] = uuid.uuid4().hex[:8]
+            new_answers.append(answer)
+        # the hints of all the updated answers are scored in one batch
+        self._score([self._shards[answer] for answer in new_answers])
+        answers = self.answers()
+        known = set(answers)
+        new_answers = [answer for answer in new_answers if answer not in known]
+        if new_answers:
+            values[self._key(u'answers')] = answers + new_answers
+            values[self._key(u'answers-revision')] = uuid.uuid4().hex[:8]
+            ANSWER_INDEXES.delete(self.namespace)
+        if reports:
+            index = self.kvs.get(self._key(u'reports'), {})
+            for answer, hints in reports.items():
+                if hints:
+                    index[answer] = hints
+                else:
+                    index.pop(answer, None)
+            values[self._key(u'reports')] = index
+        self._write(values)
+        if not self.texts_in_shards:
+            for key in deleted:
+                self.kvs.delete(key)
+
+    def _write(self, values):
+        """
+        Write many {key: value} at once, with one call if the key-value store has set_many.
+        """
+        if hasattr(self.kvs, 'set_many'):
+            self.kvs.set_many(values)
+        else:
+            for key, value in values.items():
+                self.kvs.set(key, value)
+
+    def rescore(self, batch_size=1000):
+        """
+        Recompute the score of every hint, such as after the scorer was changed, `batch_size`
+        answers at a time. The hints of a batch are scored at once, and only the shards whose
+        scores changed are written.
+
+        Returns the number of hints scored.
+        """
+        answers = self.answers()
+        count = 0
+        for start in range(0, len(answers), batch_size):
+            batch = []
+            for answer in answers[start:start + batch_size]:
+                self._shards.pop(answer, None)
+                shard = dict(self._load(answer))
+                batch.append((answer, shard, shard.get('scores')))
+            self._score([shard for _, shard, _ in batch])
+            values = {}
+            for answer, shard, scores in batch:
+                count += len(set(shard['hints']).union(shard.get('counters', {})))
+                self._shards.pop(answer, None)
+                if shard.get('scores') == scores and answer not in self._pending_texts:
+                    continue
+                for hint, text in self._pending_texts.pop(answer, {}).items():
+                    values[self._text_key(answer, hint)] = text
+                values[self._shard_key(answer)] = shard
+                values[self._revision_key(answer)] = uuid.uuid4().hex[:8]
+                RANKINGS.delete((self.namespace, answer))
+            self._write(values)
+        return count
+
+    def export(self):
+        """
+        Iterate over the stored and the reported hints of every answer, as (answer, [change]) in the
+        format of bulk_update, with every field present. Hints that are reported but not stored (as
+        legacy reports can be) have no rating, so that they are imported as reports only. Shards are
+        read one at a time and not kept.
+        """
+        for answer in self.answers():
+            shard = self.kvs.get(self._shard_key(answer))
+            if shard is None:
+                continue
+            texts = _texts_by_id(shard)
+            if shard.get('version') != FORMAT_VERSION:
+                shard, texts = upgrade_shard(shard)
+            counters = shard.get('counters', {})
+            reported = shard.get('reported', {})
+            changes = []
+            for hint in sorted(set(shard['hints']) | set(counters) | set(reported)):
+                text = texts.get(hint) or HINT_TEXTS.get(hint) or self.kvs.get(self._text_key(answer, hint))
+                change = {"hint": text} if text is not None else {"hint_id": hint}
+                if hint in shard['hints'] or hint in counters:
+                    change['rating'] = shard['hints'].get(hint, 0)
+                if hint in counters:
+                    change['counter'] = counters[hint]
+                if hint in shard.get('impressions', {}):
+                    change['impressions'] = shard['impressions'][hint]
+                if hint in shard.get('conversions', {}):
+                    change['conversions'] = shard['conversions'][hint]
+                if hint in reported:
+                    change['reporters'] = reported[hint]
+                changes.append(change)
+            changes.extend({"hint_id": hint, "removed": True} for hint in shard.get('removed', []))
+            yield answer, changes
+
+    def _get_meta(self):
+        if self._meta is None:
+            self._meta = self.kvs.get(self._key(u'meta'), {})
+        return self._meta
+
+    def is_migrated(self, block=None):
+        """
+        Return whether the storage has been migrated, or if `block` is given, whether the legacy fields of
+        the block with that usage id have been copied into it.
+        """
+        if block is None:
+            return bool(self._get_meta().get('migrated'))
+        return block in self._get_meta().get('blocks', [])
+
+    def is_upgraded(self):
+        """
+        Return whether the storage has the current layout (see FORMAT_VERSION).
+        """
+        return self._get_meta().get('version') == FORMAT_VERSION
+
+    def migrate(self, hint_database, reported=None, block=None):
+        """
+        Merge hints from the legacy {"incorrect_answer": {"hint": rating}} layout, and reports from
+        the legacy {"hint": "incorrect_answer"} layout, into the shards and mark the legacy fields of
+        `block` (a usage id) as migrated, so this happens once per block.
+
+        Blocks for the same Element share the storage, so the hints of every block are merged: a
+        stored hint keeps the higher of its rating and the legacy one, removed hints stay removed,
+        and hints that are stored and not reported are not reported again, since staff may have
+        moderated them. Merging the same fields twice changes nothing.
+        """
+        updates = {}
+        for answer, hints in hint_database.items():
+            answer = normalize_answer(answer)
+            stored = self._load(answer)
+            for hint, rating in hints.items():
+                hint_key = hint_id(hint)
+                if hint_key in stored.get('removed', []):
+                    continue
+                if hint_key not in stored['hints'] or rating > stored['hints'][hint_key]:
+                    updates.setdefault(answer, []).append({"hint": hint, "rating": rating})
+        for hint, answer in (reported or {}).items():
+            answer = normalize_answer(answer)
+            if hint_id(hint) not in self.get_hints(answer) or hint_id(hint) in self._load(answer).get('reported', {}):
+                updates.setdefault(answer, []).append({"hint": hint, "reporters": []})
+        if updates:
+            self.bulk_update(updates)
+        self.mark_migrated(block)
+
+    def upgrade(self):
+        """
+        Rewrite the shards of the version 1 layout, and the index of reported hints, with hint ids.
+        """
+        for answer in self.answers():
+            shard = self.kvs.get(self._shard_key(answer))
+            if shard is not None and shard.get('version') != FORMAT_VERSION:
+                self._save(answer, self._load(answer))
+                RANKINGS.delete((self.namespace, answer))
+        reports = self.kvs.get(self._key(u'reports'), {})
+        if reports:
+            index = {}
+            for answer in reports:
+                reported = self._load(answer).get('reported', {})
+                if reported:
+                    index[answer] = sorted(reported)
+            self.kvs.set(self._key(u'reports'), index)
+        self.mark_migrated()
+
+    def mark_migrated(self, block=None):
+        """
+        Mark the storage as migrated to the current layout and, if `block` is given, the legacy fields
+        of the block with that usage id as copied into it.
+        """
+        blocks = self._get_meta().get('blocks', [])
+        if block is not None and block not in blocks:
+            blocks = blocks + [block]
+        self._meta = {"migrated": True, "version": FORMAT_VERSION, "blocks": blocks}
+        self.kvs.set(self._key(u'meta'), self._meta)
+        # the list is shared by every namespace, so it is not read through the cache of this one
+        namespaces = self.backend.get(NAMESPACES_KEY, [])
+        if self.namespace not in namespaces:
+            self.backend.set(NAMESPACES_KEY, namespaces + [self.namespace])
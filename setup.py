@@ -30,10 +30,18 @@ setup(
     install_requires=[
         'XBlock',
     ],
+    extras_require={
+        # computes the scores of large batches of hints faster
+        'numpy': ['numpy'],
+    },
     entry_points={
         'xblock.v1': [
             'crowdsourcehinter = crowdsourcehinter:CrowdsourceHinter',
-        ]
+        ],
+        'console_scripts': [
+            'crowdsourcehinter-hints = crowdsourcehinter.bulk:main',
+            'crowdsourcehinter-analytics = crowdsourcehinter.analytics:main',
+        ],
     },
     package_data=package_data("crowdsourcehinter", ["static", "public"]),
 )
@@ -0,0 +1,39 @@
+"""
+Tests of the offline analytics of the effectiveness of hints.
+"""
+from crowdsourcehinter.analytics import count_conversions, outcomes
+
+
+def shown(user, attempt, hint, element='e'):
+    return user, element, attempt, 'foo', hint
+
+
+def solved(user, attempt, element='e'):
+    return user, element, attempt, None, None
+
+
+def test_solutions_within_the_attempts_convert():
+    events = [shown('alice', 1, 'a'), shown('bob', 1, 'a'), solved('alice', 4), solved('bob', 5)]
+    assert sorted(outcomes(events, attempts=3)) == [('e', 'foo', 'a', False), ('e', 'foo', 'a', True)]
+    assert list(outcomes([shown('alice', 2, 'a'), solved('alice', 2)], attempts=3)) == [('e', 'foo', 'a', False)]
+
+
+def test_unsolved_showings_are_resolved_as_they_age():
+    events = [shown('alice', 1, 'a'), shown('alice', 3, 'b'), shown('alice', 4, 'c')]
+    results = outcomes(events, attempts=3)
+    # the showing of 'a' can no longer convert once the student is 3 submissions past it
+    assert next(results) == ('e', 'foo', 'a', False)
+    assert list(results) == [('e', 'foo', 'b', False), ('e', 'foo', 'c', False)]
+
+
+def test_hints_shown_again_count_every_showing():
+    events = [shown('alice', 1, 'a'), shown('alice', 2, 'a'), solved('alice', 3)]
+    assert count_conversions(outcomes(events, attempts=3)) == {('e', 'foo', 'a'): [2, 2]}
+    assert count_conversions(outcomes(events, attempts=1)) == {('e', 'foo', 'a'): [2, 1]}
+
+
+def test_reloaded_pages_and_evicted_students_do_not_convert():
+    reloaded = [shown('alice', 3, 'a'), solved('alice', 1)]
+    assert list(outcomes(reloaded)) == [('e', 'foo', 'a', False)]
+    crowded = [shown('alice', 1, 'a'), shown('bob', 1, 'b'), solved('alice', 2)]
+    assert list(outcomes(crowded, max_open=1)) == [('e', 'foo', 'a', False), ('e', 'foo', 'b', False)]
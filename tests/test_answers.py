@@ -0,0 +1,115 @@
+"""
+Tests of the matching of incorrect answers with known ones.
+"""
+import threading
+import uuid
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter import answers
+from crowdsourcehinter.answers import AnswerIndex
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+LIGHT = hint_id('think about the light')
+
+
+def wait_for_indexes():
+    for thread in list(answers._BUILDING.values()):
+        thread.join()
+
+
+def course():
+    """
+    Return a course whose hinter has a hint for 'photosynthesis', and whose answer index is built.
+    """
+    course = InMemoryCourse(
+        Element=u'i4x://test/%s' % uuid.uuid4().hex, initial_hints={'photosynthesis': {'think about the light': 0}},
+    )
+    course.call('alice', 'get_hint', {'submittedanswer': 'photosynthesis'})
+    course.block('alice').get_hint_storage().answer_index()
+    wait_for_indexes()
+    return course
+
+
+def test_answer_indexes_are_built_off_the_request_path():
+    kvs = InMemoryKeyValueStore()
+    storage = HintStorage(kvs, u'i4x://test/%s' % uuid.uuid4().hex)
+    storage.add_hint('photosynthesis', 'think about the light')
+    assert len(storage.answer_index()) == 0
+    wait_for_indexes()
+    assert storage.answer_index().match('photosynthesys') == ['photosynthesis']
+    storage.add_hint('respiration', 'think about the oxygen')
+    assert storage.answer_index().match('respiratoin') == ['respiration']
+
+
+def test_answers_are_added_while_answers_are_looked_up():
+    index = AnswerIndex()
+    words = [hint_id(str(number)) for number in range(2000)]
+    errors = []
+
+    def add():
+        for word in words:
+            index.add(word)
+
+    def match():
+        try:
+            for word in words:
+                index.match(word[1:])
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+
+    threads = [threading.Thread(target=add), threading.Thread(target=match)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(index) == 2000
+
+
+def test_the_students_answer_is_kept_for_hints_of_close_answers():
+    hinter = course()
+    result = hinter.call('bob', 'get_hint', {'submittedanswer': 'Photosynthesys'})
+    assert result == {'Hints': 'think about the light', 'HintId': LIGHT, 'StudentAnswer': 'photosynthesys'}
+    assert hinter.call('bob', 'get_feedback', {}) == {'think about the light': 'photosynthesys'}
+    rating = {'student_answer': 'photosynthesys', 'hint_id': LIGHT}
+    assert hinter.call('bob', 'get_ratings', rating)['rating'] == 0
+
+
+def test_hints_of_close_answers_are_rated_where_they_are_stored():
+    hinter = course()
+    ratings = []
+    for student, answer in (('bob', 'photosynthesys'), ('carol', 'Photosynthesis!')):
+        hinter.call(student, 'get_hint', {'submittedanswer': answer})
+        vote = {'student_answer': answer, 'hint_id': LIGHT, 'student_rating': 'upvote'}
+        ratings.append(hinter.call(student, 'rate_hint', vote)['rating'])
+    assert ratings == ['1', '2']
+    storage = hinter.block('bob').get_hint_storage()
+    assert storage.get_hints('photosynthesis') == {LIGHT: 2}
+    assert storage.get_hints('photosynthesys') == {}
+
+
+def test_hints_of_close_answers_are_reported_where_they_are_stored():
+    hinter = course()
+    hinter.call('bob', 'get_hint', {'submittedanswer': 'photosynthesys'})
+    report = {'student_answer': 'photosynthesys', 'hint_id': LIGHT, 'student_rating': 'report'}
+    assert hinter.call('bob', 'rate_hint', report)['rating'] == 'reported'
+    assert hinter.block('bob').get_hint_storage().reported_answers(LIGHT) == ['photosynthesis']
+
+
+def test_reported_hints_of_close_answers_are_no_longer_shown():
+    hinter = course()
+    hinter.call('bob', 'get_hint', {'submittedanswer': 'photosynthesys'})
+    vote = {'student_answer': 'photosynthesys', 'hint_id': LIGHT, 'student_rating': 'upvote'}
+    hinter.call('bob', 'rate_hint', vote)
+    hinter.call('carol', 'get_hint', {'submittedanswer': 'photosynthesys'})
+    hinter.call('carol', 'rate_hint', dict(vote, student_rating='report'))
+    assert hinter.call('dave', 'get_hint', {'submittedanswer': 'photosynthesys'})['HintId'] is None
+    assert hinter.call('dave', 'get_hint', {'submittedanswer': 'photosynthesis'})['HintId'] is None
+
+
+def test_the_feedback_stage_has_the_ratings_of_hints_of_close_answers():
+    hinter = course()
+    hinter.call('bob', 'get_hint', {'submittedanswer': 'photosynthesys'})
+    assert hinter.call('bob', 'get_feedback_with_ratings', {})['feedback'] == [
+        {'student_answer': 'photosynthesys', 'hint_id': LIGHT, 'hint': 'think about the light', 'rating': 0},
+    ]
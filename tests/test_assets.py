@@ -0,0 +1,38 @@
+"""
+Tests of the minification of the hinter's stylesheets and scripts.
+"""
+from crowdsourcehinter.assets import ASSETS, minify_css, minify_js
+
+
+def test_scripts_keep_strings_urls_and_regular_expressions():
+    js = (
+        'var url = "http://example.com/a"; // the url\n'
+        'var quote = \'/* not a comment */\';\n'
+        '    var words = text.split(/\\s+\\/\\//g); /* a comment\n'
+        'over two lines */ var ratio = a / b / c;\n'
+        'var template = `// ${name}`;\n'
+        'return /x/.test(y);\n'
+    )
+    assert minify_js(js) == (
+        'var url = "http://example.com/a";\n'
+        'var quote = \'/* not a comment */\';\n'
+        'var words = text.split(/\\s+\\/\\//g);\n'
+        'var ratio = a / b / c;\n'
+        'var template = `// ${name}`;\n'
+        'return /x/.test(y);\n'
+    )
+
+
+def test_comments_between_tokens_keep_them_apart():
+    assert minify_js('a/**/b\nc/*\n*/d') == 'a b\nc\nd\n'
+
+
+def test_stylesheets_keep_strings():
+    css = '/* header */\na {\n  content: "x ; /* y */ }" ;\n  color: red;\n}\nb > c { }'
+    assert minify_css(css) == 'a{content: "x ; /* y */ }";color: red}b>c{}'
+
+
+def test_the_script_bundle_only_loses_whitespace_and_comments():
+    js = ASSETS.text("static/js/src/crowdsourcehinter.js")
+    assert len(ASSETS.bundle('js')) < len(js)
+    assert 'Logger.listen(\'seq_next\', null, stopScript);' in ASSETS.bundle('js')
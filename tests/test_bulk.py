@@ -0,0 +1,72 @@
+"""
+Tests of the bulk import and export of hints.
+"""
+import io
+import json
+
+import pytest
+
+from crowdsourcehinter.bulk import export_hints, import_hints, namespaces
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, SqliteKeyValueStore, hint_id
+
+ELEMENT = u'i4x://test/problem/bulk'
+
+
+def export(kvs):
+    lines = io.StringIO()
+    export_hints(kvs, list(namespaces(kvs)), lines)
+    return lines.getvalue().splitlines()
+
+
+def line(**record):
+    return json.dumps(dict(record, element=ELEMENT))
+
+
+def test_answers_differing_in_case_are_imported_together():
+    kvs = InMemoryKeyValueStore()
+    import_hints(kvs, [
+        line(answer=u'Foo', hint=u'check the f', rating=2),
+        line(answer=u'foo ', hint=u'check the o', rating=1),
+    ])
+    storage = HintStorage(kvs, ELEMENT, cache=None)
+    assert storage.answers() == [u'foo']
+    assert storage.get_hints(u'foo') == {hint_id(u'check the f'): 2, hint_id(u'check the o'): 1}
+
+
+def test_hints_without_fields_are_imported():
+    kvs = InMemoryKeyValueStore()
+    assert import_hints(kvs, [line(answer=u'foo', hint=u'check the f')]) == 1
+    assert HintStorage(kvs, ELEMENT, cache=None).get_hints(u'foo') == {hint_id(u'check the f'): 0}
+
+
+def test_reported_hints_that_are_not_stored_are_exported():
+    kvs = InMemoryKeyValueStore()
+    storage = HintStorage(kvs, ELEMENT, cache=None)
+    storage.migrate({u'foo': {u'check the f': 1}}, {u'rude': u'foo'})
+    assert [json.loads(record) for record in export(kvs)] == [
+        {"element": ELEMENT, "answer": u'foo', "hint": u'check the f', "rating": 1},
+        {"element": ELEMENT, "answer": u'foo', "hint": u'rude', "reporters": []},
+    ]
+
+
+def test_exports_can_be_imported_again(tmpdir):
+    source = InMemoryKeyValueStore()
+    storage = HintStorage(source, ELEMENT, cache=None)
+    storage.migrate({u'Foo': {u'check the f': 1, u'wrong': 0}, u'bar': {u'check the b': 0}}, {u'rude': u'bar'})
+    storage.change_rating(u'foo', hint_id(u'check the f'), -1)
+    storage.record_impression(u'foo', hint_id(u'check the f'))
+    storage.report_hint(u'foo', hint_id(u'wrong'), u'alice')
+    storage.remove_hint(u'foo', hint_id(u'wrong'))
+    lines = export(source)
+    for target in (InMemoryKeyValueStore(), SqliteKeyValueStore(str(tmpdir.join('hints.sqlite')))):
+        assert import_hints(target, lines) == len(lines)
+        assert export(target) == lines
+        assert import_hints(target, lines) == len(lines)
+        assert export(target) == lines
+
+
+def test_lines_that_are_not_objects_are_reported():
+    for bad in ('[]', '1', '"foo"', '{"answer": "foo"}'):
+        with pytest.raises(ValueError) as error:
+            import_hints(InMemoryKeyValueStore(), [line(answer=u'foo', hint=u'check the f'), bad])
+        assert 'Line 2 is not a hint' in str(error.value)
@@ -0,0 +1,74 @@
+"""
+Tests of the process-level cache of the values of the hint storage.
+"""
+import json
+
+from crowdsourcehinter.cache import CachedKeyValueStore, VersionedCache
+from crowdsourcehinter.storage import InMemoryKeyValueStore
+
+
+def store(kvs, cache):
+    """
+    Return the key-value store of one request, as a HintStorage reads it.
+    """
+    return CachedKeyValueStore(kvs, u'ns:version', cache, [u'ns:used:'])
+
+
+def test_every_write_changes_the_version():
+    kvs = InMemoryKeyValueStore()
+    cached = store(kvs, VersionedCache(max_bytes=1024))
+    versions = []
+    cached.set(u'ns:a', 1)
+    versions.append(kvs.get(u'ns:version'))
+    cached.set_many({u'ns:a': 2, u'ns:b': 3})
+    versions.append(kvs.get(u'ns:version'))
+    cached.delete(u'ns:b')
+    versions.append(kvs.get(u'ns:version'))
+    assert [version.split(u'.')[0] for version in versions] == [u'1', u'2', u'3']
+    cached.set(u'ns:used:a', 4)
+    cached.delete(u'ns:used:a')
+    assert kvs.get(u'ns:version') == versions[-1]
+
+
+def test_writes_of_other_processes_are_seen_by_the_next_request():
+    kvs = InMemoryKeyValueStore()
+    cache, other_cache = VersionedCache(max_bytes=1024), VersionedCache(max_bytes=1024)
+    store(kvs, cache).set(u'ns:a', 1)
+    assert store(kvs, cache).get(u'ns:a') == 1
+    current = store(kvs, cache)
+    assert current.get(u'ns:a') == 1
+    store(kvs, other_cache).set(u'ns:a', 2)
+    # a request keeps reading the version it started with, and the next one reads the new value
+    assert current.get(u'ns:a') == 1
+    assert store(kvs, cache).get(u'ns:a') == 2
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 2)
+
+
+def test_values_read_are_cached_for_their_version():
+    kvs = InMemoryKeyValueStore()
+    cache = VersionedCache(max_bytes=1024)
+    store(kvs, cache).set(u'ns:a', [1, 2])
+    kvs.data[u'ns:a'] = json.dumps([3])
+    # written by this class, so the value is read from the store and then cached
+    assert store(kvs, cache).get(u'ns:a') == [3]
+    kvs.data[u'ns:a'] = json.dumps([4])
+    assert store(kvs, cache).get(u'ns:a') == [3]
+    assert store(kvs, cache).get(u'ns:missing', u'default') == u'default'
+    assert store(kvs, cache).get(u'ns:missing', u'default') == u'default'
+
+
+def test_least_recently_used_values_are_evicted():
+    cache = VersionedCache(max_bytes=80)
+    cache.set(u'a', u'1', u'x' * 9)
+    cache.set(u'b', u'1', u'x' * 9)
+    cache.set(u'too large', u'1', u'x' * 9)
+    assert cache.get(u'too large', u'1') is None
+    assert cache.get(u'a', u'1') == u'x' * 9
+    for key in u'cdefghi':
+        cache.set(key, u'1', u'x' * 9)
+    assert cache.get(u'b', u'1') is None
+    assert cache.get(u'a', u'1') == u'x' * 9
+    assert cache.get(u'a', u'2') is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (8, 80, 1)
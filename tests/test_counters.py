@@ -0,0 +1,126 @@
+"""
+Tests of the vote counters and of the buffer that writes them to the hint storage.
+"""
+import threading
+import time
+import uuid
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter.counters import MERGED_REPLICA, REPLICA_TTL, VoteBuffer, worker_replica
+from crowdsourcehinter.retention import DEFAULT_RETENTION
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+
+def element():
+    return u'i4x://test/%s' % uuid.uuid4().hex
+
+
+def drain(buffers):
+    while any(vote_buffer.has_pending() for vote_buffer in buffers):
+        for vote_buffer in buffers:
+            vote_buffer.flush()
+
+
+def test_concurrent_votes_are_all_counted():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    hint = HintStorage(kvs, namespace).add_hint('foo', 'check the f')
+    buffers = [VoteBuffer(max_pending=3, max_delay=0.001, verify_delay=0.05) for _ in range(4)]
+
+    def vote(vote_buffer):
+        for _ in range(250):
+            HintStorage(kvs, namespace, vote_buffer).change_rating('foo', hint, 1)
+
+    threads = [threading.Thread(target=vote, args=(buffers[number % 4],)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    drain(buffers)
+    assert HintStorage(kvs, namespace).get_hints('foo') == {hint: 2000}
+
+
+def test_votes_on_unknown_hints_are_dropped():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    for vote_buffer in (VoteBuffer(verify_delay=0), None):
+        storage = HintStorage(kvs, namespace, vote_buffer)
+        storage.add_hint('foo', 'check the f', rating=0 if vote_buffer else 1)
+        assert storage.change_rating('foo', 'deadbeef0000', 1) == 0
+        if vote_buffer:
+            drain([vote_buffer])
+        assert 'deadbeef0000' not in HintStorage(kvs, namespace).get_hints('foo')
+
+
+def test_students_cannot_vote_on_unknown_hints():
+    course = InMemoryCourse(initial_hints={'foo': {'check the f': 0}})
+    vote = {'student_answer': 'foo', 'hint_id': 'deadbeef0000', 'student_rating': 'upvote'}
+    assert course.call('mallory', 'rate_hint', vote)['rating'] == '0'
+    assert course.call('mallory', 'get_hint', {'submittedanswer': 'foo'})['HintId'] == hint_id('check the f')
+
+
+def test_a_restarted_worker_continues_its_totals():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    hint = HintStorage(kvs, namespace).add_hint('foo', 'check the f')
+    for _ in range(2):
+        vote_buffer = VoteBuffer(replica=u'worker-0', verify_delay=0)
+        HintStorage(kvs, namespace, vote_buffer).change_rating('foo', hint, 1)
+        drain([vote_buffer])
+    shard = HintStorage(kvs, namespace).reload('foo')
+    assert shard['counters'][hint] == {'p': {u'worker-0': 2}, 'n': {}}
+
+
+def test_workers_have_distinct_replica_ids():
+    first = worker_replica()
+    assert first != worker_replica()
+    assert len(first) == 12
+
+
+def test_flushed_votes_are_pruned():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    hint = HintStorage(kvs, namespace).add_hint('foo', 'check the f')
+    vote_buffer = VoteBuffer(verify_delay=0.01)
+    HintStorage(kvs, namespace, vote_buffer).change_rating('foo', hint, -1)
+    HintStorage(kvs, namespace, vote_buffer).record_impression('foo', hint)
+    vote_buffer.flush(True)
+    time.sleep(0.02)
+    drain([vote_buffer])
+    assert not (vote_buffer._votes or vote_buffer._impressions or vote_buffer._written)
+    assert HintStorage(kvs, namespace, vote_buffer).counts('foo') == {hint: {'ups': 0, 'downs': 1, 'impressions': 1}}
+
+
+def test_votes_do_not_wait_for_a_flush():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    hint = HintStorage(kvs, namespace).add_hint('foo', 'check the f')
+    vote_buffer = VoteBuffer(max_pending=1, verify_delay=0)
+    with vote_buffer._flush_lock:
+        start = time.time()
+        assert HintStorage(kvs, namespace, vote_buffer).change_rating('foo', hint, 1) == 1
+        assert time.time() - start < 1
+    drain([vote_buffer])
+    assert HintStorage(kvs, namespace).get_hints('foo') == {hint: 1}
+
+
+def test_compaction_folds_idle_replicas():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    hint = HintStorage(kvs, namespace).add_hint('foo', 'check the f')
+    for replica in (u'old', u'new'):
+        vote_buffer = VoteBuffer(replica=replica)
+        HintStorage(kvs, namespace, vote_buffer).change_rating('foo', hint, 1)
+        HintStorage(kvs, namespace, vote_buffer).record_impression('foo', hint)
+        vote_buffer.flush(True)
+    # the storage is not read through the cache from here on, since the shard is changed behind its back
+    storage = HintStorage(kvs, namespace, cache=None)
+    shard = storage.reload('foo')
+    shard['replicas'][u'old'] -= REPLICA_TTL + 1
+    kvs.set(storage._shard_key(u'foo'), shard)
+    storage.compact(DEFAULT_RETENTION, ['foo'])
+    shard = HintStorage(kvs, namespace, cache=None).reload('foo')
+    assert shard['counters'][hint] == {'p': {MERGED_REPLICA: 1, u'new': 1}, 'n': {}}
+    assert shard['impressions'][hint] == {MERGED_REPLICA: 1, u'new': 1}
+    assert list(shard['replicas']) == [u'new']
+    assert HintStorage(kvs, namespace, cache=None).get_hints('foo') == {hint: 2}
@@ -0,0 +1,108 @@
+"""
+Tests of the feedback stage: the hints a student is asked about, and the ratings they give.
+"""
+import json
+import uuid
+
+from webob import Request
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter.storage import hint_id
+
+FOO = hint_id('check the f')
+BAR = hint_id('check the b')
+
+
+def course():
+    return InMemoryCourse(
+        Element=u'i4x://test/%s' % uuid.uuid4().hex,
+        initial_hints={'foo': {'check the f': 0}, 'bar': {'check the b': 2}},
+    )
+
+
+def status(course, user_id, handler, data, staff=False):
+    """
+    Call a JSON handler and return the status code of the response.
+    """
+    block = course.block(user_id, staff)
+    return getattr(block, handler)(Request.blank('/', method='POST', body=json.dumps(data).encode('utf8'))).status_int
+
+
+def remove(hinter, answer, hint):
+    report = {'student_answer': answer, 'hint_id': hint, 'student_rating': 'report'}
+    hinter.call('mallory', 'rate_hint', report)
+    hinter.call('staff', 'rate_hint', dict(report, student_rating='remove'), staff=True)
+
+
+def test_feedback_has_the_ratings_of_the_hints_used():
+    hinter = course()
+    hinter.call('alice', 'get_hint', {'submittedanswer': 'bar'})
+    assert hinter.call('alice', 'get_feedback_with_ratings', {}) == {'feedback': [
+        {'student_answer': 'bar', 'hint_id': BAR, 'hint': 'check the b', 'rating': 2},
+    ]}
+    assert hinter.call('alice', 'get_feedback_with_ratings', {}) == {'feedback': []}
+
+
+def test_removed_hints_have_no_feedback():
+    hinter = course()
+    hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+    remove(hinter, 'foo', FOO)
+    assert hinter.call('alice', 'get_feedback_with_ratings', {})['feedback'] == [
+        {'student_answer': 'foo', 'hint_id': None, 'hint': None, 'rating': None},
+    ]
+
+
+def test_ratings_of_unknown_hints_are_not_found():
+    hinter = course()
+    assert hinter.call('alice', 'get_ratings', {'student_answer': 'foo', 'hint': 'check the f'})['rating'] == 0
+    assert status(hinter, 'alice', 'get_ratings', {'student_answer': 'foo', 'hint_id': 'deadbeef0000'}) == 404
+    remove(hinter, 'foo', FOO)
+    assert status(hinter, 'alice', 'get_ratings', {'student_answer': 'foo', 'hint_id': FOO}) == 404
+
+
+def test_batches_of_ratings_take_ids_and_texts():
+    hinter = course()
+    hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+    ratings = [
+        {'student_answer': 'foo', 'hint_id': FOO, 'student_rating': 'upvote'},
+        {'student_answer': 'bar', 'hint': 'check the b', 'student_rating': 'downvote'},
+        {'student_answer': 'bar', 'hint': 'check the b', 'student_rating': 'upvote'},
+    ]
+    assert hinter.call('alice', 'rate_hints', {'ratings': ratings})['results'] == [
+        {'rating': '1', 'hint_id': FOO}, {'rating': '1', 'hint_id': BAR}, {'rating': 'voted', 'hint_id': BAR},
+    ]
+
+
+def test_batches_of_ratings_are_capped():
+    hinter = course()
+    ratings = [
+        {'student_answer': 'foo', 'hint': 'hint %d' % number, 'student_rating': 'upvote'} for number in range(60)
+    ]
+    assert len(hinter.call('alice', 'rate_hints', {'ratings': ratings})['results']) == 50
+
+
+def test_rejected_batches_apply_nothing():
+    hinter = course()
+    upvote = {'student_answer': 'foo', 'hint_id': FOO, 'student_rating': 'upvote'}
+    for rejected, code in (
+        ({'student_answer': 'bar', 'hint_id': BAR, 'student_rating': 'remove'}, 403),
+        ({'student_answer': 'bar', 'student_rating': 'upvote'}, 400),
+    ):
+        assert status(hinter, 'alice', 'rate_hints', {'ratings': [upvote, rejected]}) == code
+    assert status(hinter, 'staff', 'rate_hints', {'ratings': [
+        upvote, {'student_answer': 'bar', 'hint_id': BAR, 'student_rating': 'remove'},
+    ]}, staff=True) == 404
+    assert status(hinter, 'alice', 'rate_hints', {'ratings': 'upvote'}) == 400
+    assert hinter.call('alice', 'get_ratings', {'student_answer': 'foo', 'hint_id': FOO})['rating'] == 0
+
+
+def test_recorded_hints_are_asked_about_in_the_feedback_stage():
+    hinter = course()
+    shown = [
+        {'student_answer': 'Bar', 'hint_id': BAR},
+        {'student_answer': 'foo', 'hint_id': 'deadbeef0000'},
+        {'student_answer': 'foo', 'hint_id': FOO},
+    ]
+    bundle = hinter.call('alice', 'record_hints', {'shown': shown, 'version': None})['bundle']
+    assert hinter.call('alice', 'record_hints', {'shown': [], 'version': bundle['version']}) == {'bundle': None}
+    assert hinter.call('alice', 'get_feedback', {}) == {'check the b': 'bar'}
@@ -0,0 +1,65 @@
+"""
+Tests of the instrumentation of the handlers.
+"""
+import json
+import logging
+import uuid
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter import metrics
+from crowdsourcehinter.metrics import Collector, LoggingSink
+
+
+class ListSink(object):
+    def __init__(self):
+        self.measurements = []
+
+    def record(self, measurement):
+        self.measurements.append(measurement.to_json())
+
+
+def course(**kwargs):
+    return InMemoryCourse(
+        Element=u'i4x://test/%s' % uuid.uuid4().hex, initial_hints={'foo': {'check the f': 0}}, **kwargs
+    )
+
+
+def test_field_reads_and_writes_are_counted():
+    hinter = course(service=False)
+    sink = ListSink()
+    metrics.configure([sink])
+    try:
+        hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+        hinter.call('alice', 'get_feedback', {})
+    finally:
+        metrics.configure()
+    get_hint, get_feedback = sink.measurements
+    assert get_hint['handler'] == 'get_hint'
+    assert get_hint['counts']['field_reads'] >= 2
+    assert get_hint['counts']['field_writes'] >= 1
+    assert get_hint['counts']['field_bytes_written'] > 0
+    assert get_hint['gauges'] == {'answers': 1, 'reported': 0}
+    assert get_feedback['counts']['field_bytes_read'] > 0
+
+
+def test_service_reads_are_counted_and_collected(caplog):
+    hinter = course()
+    collector = Collector()
+    metrics.configure([collector, LoggingSink()])
+    try:
+        with caplog.at_level(logging.INFO, logger='crowdsourcehinter.metrics'):
+            for _ in range(2):
+                hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+    finally:
+        metrics.configure()
+    snapshot = collector.snapshot()
+    assert snapshot['counters']['get_hint.calls'] == 2
+    assert snapshot['counters']['get_hint.storage_reads'] > 0
+    assert snapshot['timers']['get_hint.wall_ms']['count'] == 2
+    logged = [json.loads(record.getMessage().split(' ', 1)[1]) for record in caplog.records]
+    assert [measurement['handler'] for measurement in logged] == ['get_hint', 'get_hint']
+
+
+def test_blocks_without_field_internals_count_no_fields():
+    assert metrics._field_sizes(object(), ['hint_shards']) == 0
+    assert metrics._dirty_fields(object()) == []
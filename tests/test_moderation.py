@@ -0,0 +1,76 @@
+"""
+Tests of the reporting and moderation of hints.
+"""
+import json
+import uuid
+
+from webob import Request
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter.storage import hint_id
+
+RUDE = hint_id('rude')
+
+
+def course():
+    course = InMemoryCourse(
+        Element=u'i4x://test/%s' % uuid.uuid4().hex, initial_hints={'foo': {'rude': 0, 'kind': 0}},
+    )
+    course.call('mallory', 'get_hint', {'submittedanswer': 'foo'})
+    course.call('alice', 'rate_hint', {'student_answer': 'foo', 'hint_id': RUDE, 'student_rating': 'report'})
+    return course
+
+
+def status(course, user_id, handler, data, staff=False):
+    """
+    Call a JSON handler and return the status code of the response.
+    """
+    block = course.block(user_id, staff)
+    return getattr(block, handler)(Request.blank('/', method='POST', body=json.dumps(data).encode('utf8'))).status_int
+
+
+def test_only_staff_can_moderate_hints():
+    hinter = course()
+    for rating in ('remove', 'unreport'):
+        data = {'student_answer': 'foo', 'hint_id': RUDE, 'student_rating': rating}
+        assert status(hinter, 'mallory', 'rate_hint', data) == 403
+    queue = hinter.call('staff', 'get_moderation_queue', {}, staff=True)
+    assert [report['hint_id'] for report in queue['reports']] == [RUDE]
+    data = {'student_answer': 'foo', 'hint_id': RUDE, 'student_rating': 'remove'}
+    assert hinter.call('staff', 'rate_hint', data, staff=True) == {'rating': 'removed'}
+    assert hinter.call('staff', 'get_moderation_queue', {}, staff=True)['reports'] == []
+
+
+def test_only_reported_hints_can_be_moderated():
+    hinter = course()
+    for answer, hint in (('foo', 'zzz'), ('foo', hint_id('kind')), ('bar', RUDE)):
+        data = {'student_answer': answer, 'hint_id': hint, 'student_rating': 'unreport'}
+        assert status(hinter, 'staff', 'rate_hint', data, staff=True) == 404
+    data = {'student_answer': 'foo', 'hint_id': hint_id('kind'), 'student_rating': 'remove'}
+    assert status(hinter, 'staff', 'rate_hint', data, staff=True) == 404
+    data = {'student_answer': 'Reported', 'hint_id': RUDE, 'student_rating': 'unreport'}
+    assert hinter.call('staff', 'rate_hint', data, staff=True) == {'rating': 'unreported'}
+
+
+def test_unknown_hints_cannot_be_reported():
+    hinter = course()
+    data = {'student_answer': 'foo', 'hint_id': 'deadbeef0000', 'student_rating': 'report'}
+    assert hinter.call('mallory', 'rate_hint', data)['rating'] == '0'
+    queue = hinter.call('staff', 'get_moderation_queue', {}, staff=True)
+    assert [report['hint_id'] for report in queue['reports']] == [RUDE]
+
+
+def test_only_staff_can_read_the_studio_data():
+    hinter = course()
+    assert status(hinter, 'mallory', 'studiodata', {}) == 403
+    data = hinter.call('staff', 'studiodata', {}, staff=True)
+    assert [report['reporters'] for report in data['reports']] == [['alice']]
+
+
+def test_moderation_queue_pages_are_validated():
+    hinter = course()
+    for data in ({'limit': 'ten'}, {'limit': None}, {'cursor': 5}, {'cursor': ['foo', 3]}):
+        assert status(hinter, 'staff', 'get_moderation_queue', data, staff=True) == 400
+    for limit in (0, -5):
+        page = hinter.call('staff', 'get_moderation_queue', {'limit': limit}, staff=True)
+        assert [report['hint_id'] for report in page['reports']] == [RUDE]
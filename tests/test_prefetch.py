@@ -0,0 +1,54 @@
+"""
+Tests of the prefetched hints, with and without a hint storage service.
+"""
+import uuid
+
+import pytest
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter import storage
+from crowdsourcehinter.counters import VOTE_BUFFER
+from crowdsourcehinter.storage import LOCAL_REPLICA, hint_id
+
+FOO = hint_id('check the f')
+
+
+def course(service):
+    return InMemoryCourse(
+        service=service,
+        Element=u'i4x://test/%s' % uuid.uuid4().hex,
+        initial_hints={'foo': {'check the f': 0}, 'bar': {'check the b': 2}},
+    )
+
+
+@pytest.mark.parametrize('service', [True, False])
+def test_bundles_have_the_hints_shown_most_often(service):
+    hinter = course(service)
+    for user in ('alice', 'bob', 'carol'):
+        hinter.call(user, 'get_hint', {'submittedanswer': 'foo'})
+    if service:
+        VOTE_BUFFER.flush(True)
+    assert hinter.block('dave').prefetch_data()['bundle']['hints'] == {'foo': [FOO, 'check the f']}
+
+
+def test_impressions_without_a_service_are_written_once_an_interval(monkeypatch):
+    hinter = course(service=False)
+    for user in ('alice', 'bob', 'carol'):
+        hinter.call(user, 'get_hint', {'submittedanswer': 'foo'})
+    hints = hinter.block('dave').get_hint_storage()
+    assert hints.reload('foo')['impressions'] == {FOO: {LOCAL_REPLICA: 1}}
+    assert hints.counts('foo')[FOO]['impressions'] == 3
+    monkeypatch.setattr(storage, 'IMPRESSIONS_INTERVAL', 0)
+    hinter.call('erin', 'get_hint', {'submittedanswer': 'foo'})
+    hints = hinter.block('dave').get_hint_storage()
+    assert hints.reload('foo')['impressions'] == {FOO: {LOCAL_REPLICA: 4}}
+    assert hints.popular_answers() == ['foo']
+
+
+def test_recently_checked_bundles_do_not_read_the_hint_storage():
+    hinter = course(service=False)
+    hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+    assert hinter.block('bob').prefetch_data()['bundle']['hints'] == {'foo': [FOO, 'check the f']}
+    block = hinter.block('carol')
+    assert block.prefetch_data()['bundle']['hints'] == {'foo': [FOO, 'check the f']}
+    assert getattr(block, '_hint_storage', None) is None
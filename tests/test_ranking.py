@@ -0,0 +1,58 @@
+"""
+Tests of the ranked hint index of an answer.
+"""
+import uuid
+
+from crowdsourcehinter.ranking import RANKINGS, HintRanking
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+GOOD = hint_id('check the f')
+BETTER = hint_id('check the o')
+
+
+def storage(kvs=None, namespace=None):
+    return HintStorage(kvs or InMemoryKeyValueStore(), namespace or u'i4x://test/%s' % uuid.uuid4().hex, cache=None)
+
+
+def test_hints_are_ranked_by_score_then_id():
+    ranking = HintRanking({'b': 0.5, 'a': 0.5, 'c': 0.9, 'd': 0.1}, reported=['c'])
+    assert ranking.hints() == ['a', 'b', 'd']
+    assert ranking.best(exclude={'a'}) == 'b'
+    ranking.unreport('c')
+    ranking.set_score('d', 0.7)
+    assert ranking.hints() == ['c', 'd', 'a', 'b']
+    ranking.remove('c')
+    ranking.report('d')
+    assert ranking.hints() == ['a', 'b']
+
+
+def test_votes_reorder_the_cached_ranking():
+    hints = storage()
+    hints.add_hint('foo', 'check the f', rating=1)
+    hints.add_hint('foo', 'check the o')
+    ranking = hints.ranking('foo')
+    assert ranking.hints() == [GOOD, BETTER]
+    for _ in range(3):
+        hints.change_rating('foo', BETTER, 1)
+    assert hints.ranking('foo') is ranking
+    assert ranking.hints() == [BETTER, GOOD]
+    hints.report_hint('foo', BETTER)
+    assert hints.ranking('foo').best() == GOOD
+
+
+def test_rankings_are_rebuilt_after_writes_of_other_storages():
+    kvs = InMemoryKeyValueStore()
+    namespace = u'i4x://test/%s' % uuid.uuid4().hex
+    hints = storage(kvs, namespace)
+    hints.add_hint('foo', 'check the f', rating=1)
+    hints.add_hint('foo', 'check the o')
+    ranking = hints.ranking('foo')
+    # another process, which has a cache of its own, votes
+    RANKINGS.delete((namespace, u'foo'))
+    other = storage(kvs, namespace)
+    for _ in range(3):
+        other.change_rating('foo', BETTER, 1)
+    RANKINGS.set((namespace, u'foo'), ranking)
+    rebuilt = storage(kvs, namespace).ranking('foo')
+    assert rebuilt is not ranking
+    assert rebuilt.hints() == [BETTER, GOOD]
@@ -0,0 +1,39 @@
+"""
+Tests of the retention policy of the hint storage.
+"""
+import uuid
+
+from crowdsourcehinter.counters import PNCounter
+from crowdsourcehinter.retention import DAY, RetentionPolicy
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+
+def storage():
+    return HintStorage(InMemoryKeyValueStore(), u'i4x://test/%s' % uuid.uuid4().hex, cache=None)
+
+
+def age(hints, answers):
+    for answer in answers:
+        hints.kvs.set(hints._used_key(answer), 0)
+
+
+def test_idle_answers_need_downvotes_to_be_evicted():
+    policy = RetentionPolicy(ttl=DAY)
+    now = 2 * DAY
+    assert not policy.should_evict({'a': 0}, {}, [], 0, now)
+    assert not policy.should_evict({'a': 1}, {'a': PNCounter({'x': 2}, {'x': 1})}, [], 0, now)
+    assert policy.should_evict({'a': 0}, {'a': PNCounter({}, {'x': 1})}, [], 0, now)
+    assert policy.should_evict({'a': -2}, {}, [], 0, now)
+    assert not policy.should_evict({'a': -2, 'b': 0}, {}, [], 0, now)
+    assert not policy.should_evict({'a': -2}, {}, [], now, now)
+    assert policy.should_evict({}, {}, [], now, now)
+
+
+def test_initial_hints_are_kept():
+    hints = storage()
+    hints.bulk_update({'foo': [{"hint": "check the f", "rating": 0}], 'bar': [{"hint": "check the b", "rating": 0}]})
+    hints.change_rating('bar', hint_id('check the b'), -1)
+    age(hints, ['foo', 'bar'])
+    assert hints.compact(RetentionPolicy(ttl=DAY)) == {"evicted_answers": 1, "dropped_hints": 0}
+    assert hints.answers() == ['foo']
+    assert hints.get_hints('foo') == {hint_id('check the f'): 0}
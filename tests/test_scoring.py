@@ -0,0 +1,37 @@
+"""
+Tests of the scores hints are ranked by.
+"""
+import random
+
+import pytest
+
+from crowdsourcehinter import scoring
+from crowdsourcehinter.scoring import HintScorer, votes
+
+
+def test_established_hints_beat_new_ones():
+    for method in ('wilson', 'bayesian'):
+        scorer = HintScorer(method)
+        assert scorer.score(40, 2) > scorer.score(1, 0) > scorer.score(0, 1)
+        assert scorer.score(40, 38) < scorer.score(40, 2)
+    assert HintScorer('wilson').score(0, 0) == 0.0
+    assert HintScorer('bayesian').score(0, 0) == 0.5
+
+
+def test_conversions_count_as_fractions_of_votes():
+    scorer = HintScorer(conversion_weight=0.25)
+    assert scorer.evidence(1, 0, {'day': {'shown': 8, 'solved': 4}}) == (2.0, 1.0)
+    assert scorer.evidence(1, 0, None) == (1, 0)
+    assert votes(-2, {'p': {'a': 3}, 'n': {'b': 1}}) == (3, 3)
+
+
+def test_numpy_scores_match_the_pure_python_ones():
+    pytest.importorskip('numpy')
+    rng = random.Random(4)
+    ups = [rng.randint(0, 50) for _ in range(scoring.NUMPY_MIN_BATCH * 4)]
+    downs = [rng.randint(0, 50) for _ in ups]
+    ups[0] = downs[0] = 0
+    for method in ('wilson', 'bayesian'):
+        scorer = HintScorer(method)
+        expected = [scorer.score(up, down) for up, down in zip(ups, downs)]
+        assert scorer.scores(ups, downs) == pytest.approx(expected, abs=1e-4)
@@ -0,0 +1,65 @@
+"""
+Tests of the compact per-student state: the bounded hint history and votes, and the migration of
+the legacy fields.
+"""
+import uuid
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter.state import MAX_HISTORY, MAX_VOTED, add_to_history, add_vote
+from crowdsourcehinter.storage import hint_id
+
+FOO = hint_id('check the f')
+
+
+def course():
+    return InMemoryCourse(
+        Element=u'i4x://test/%s' % uuid.uuid4().hex,
+        initial_hints={'foo': {'check the f': 0}, 'bar': {'check the b': 2}},
+    )
+
+
+def test_history_keeps_the_first_pair_and_the_latest():
+    history = []
+    for number in range(MAX_HISTORY + 5):
+        history = add_to_history(history, u'answer %d' % number, u'hint %d' % number)
+    assert len(history) == MAX_HISTORY
+    assert history[0] == [u'answer 0', u'hint 0']
+    assert history[1:] == [[u'answer %d' % number, u'hint %d' % number] for number in range(6, MAX_HISTORY + 5)]
+    assert add_to_history([], u'answer', None) == [[u'answer', None]]
+
+
+def test_votes_forget_the_oldest_first():
+    voted = {}
+    for number in range(MAX_VOTED + 2):
+        add_vote(voted, u'hint %d' % number)
+    assert len(voted) == MAX_VOTED
+    assert u'hint 0' not in voted and u'hint 1' not in voted
+    assert u'hint 2' in voted and u'hint %d' % (MAX_VOTED + 1) in voted
+    add_vote(voted, u'hint 2')
+    add_vote(voted, u'hint new')
+    assert u'hint 2' in voted and u'hint 3' not in voted
+
+
+def test_legacy_history_is_moved_to_the_hint_history():
+    hinter = course()
+    block = hinter.block('alice')
+    block.WrongAnswers = [u'foo', u'bar']
+    block.Used = [u'check the f', u'check the b']
+    block.save()
+    hinter.call('alice', 'get_hint', {'submittedanswer': 'foo'})
+    block = hinter.block('alice')
+    assert block.hint_history == [[u'foo', FOO], [u'bar', hint_id('check the b')], [u'foo', FOO]]
+    assert not block.fields['WrongAnswers'].is_set_on(block)
+    assert not block.fields['Used'].is_set_on(block)
+
+
+def test_legacy_votes_are_moved_to_the_voted_hints():
+    hinter = course()
+    block = hinter.block('alice')
+    block.Voted = [u'check the f']
+    block.save()
+    vote = {'student_answer': 'foo', 'hint_id': FOO, 'student_rating': 'upvote'}
+    assert hinter.call('alice', 'rate_hint', vote)['rating'] == 'voted'
+    block = hinter.block('alice')
+    assert list(block.voted_hints) == [FOO]
+    assert not block.fields['Voted'].is_set_on(block)
@@ -0,0 +1,96 @@
+"""
+Tests of the sharded hint storage and of the migration of the legacy fields into it.
+"""
+import uuid
+
+from benchmarks.harness import InMemoryCourse
+from crowdsourcehinter.storage import HintStorage, InMemoryKeyValueStore, hint_id
+
+
+class CountingStore(InMemoryKeyValueStore):
+    """
+    Key-value store that records the keys read.
+    """
+    def __init__(self):
+        super(CountingStore, self).__init__()
+        self.reads = []
+
+    def get(self, key, default=None):
+        self.reads.append(key)
+        return super(CountingStore, self).get(key, default)
+
+
+def element():
+    return u'i4x://test/%s' % uuid.uuid4().hex
+
+
+def test_blocks_of_an_element_merge_their_legacy_hints():
+    shared = element()
+    first = InMemoryCourse(usage_id='a', Element=shared, hint_database={'foo': {'check the f': 2}})
+    second = InMemoryCourse(usage_id='b', Element=shared, hint_database={'bar': {'check the b': 1}})
+    second.services['hint_storage'] = first.services['hint_storage']
+    assert first.call('alice', 'get_hint', {'submittedanswer': 'foo'})['Hints'] == 'check the f'
+    assert second.call('bob', 'get_hint', {'submittedanswer': 'bar'})['Hints'] == 'check the b'
+    assert second.call('bob', 'get_hint', {'submittedanswer': 'foo'})['Hints'] == 'check the f'
+
+
+def test_migration_is_idempotent():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    legacy = {'foo': {'first': 3, 'second': 0}}
+    storage = HintStorage(kvs, namespace, cache=None)
+    storage.migrate(legacy, {'second': 'foo'}, 'a')
+    storage.change_rating('foo', hint_id('first'), 1)
+    storage.unreport_hint('foo', hint_id('second'))
+    storage = HintStorage(kvs, namespace, cache=None)
+    storage.migrate(legacy, {'second': 'foo'}, 'b')
+    assert storage.get_hints('foo') == {hint_id('first'): 4, hint_id('second'): 0}
+    assert storage.reported_answers(hint_id('second')) == []
+    assert storage.is_migrated('a') and storage.is_migrated('b') and not storage.is_migrated('c')
+
+
+def test_migration_keeps_removed_hints_removed():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    HintStorage(kvs, namespace, cache=None).migrate({'foo': {'rude': 0}}, None, 'a')
+    HintStorage(kvs, namespace, cache=None).remove_hint('foo', hint_id('rude'))
+    storage = HintStorage(kvs, namespace, cache=None)
+    storage.migrate({'foo': {'rude': 5}}, None, 'b')
+    assert storage.get_hints('foo') == {}
+
+
+def test_writing_a_known_shard_does_not_read_the_answers():
+    kvs = CountingStore()
+    namespace = element()
+    HintStorage(kvs, namespace, cache=None).add_hint('foo', 'check the f')
+    storage = HintStorage(kvs, namespace, cache=None)
+    kvs.reads = []
+    storage.change_rating('foo', hint_id('check the f'), 1)
+    assert namespace + u':answers' not in kvs.reads
+    storage.add_hint('bar', 'check the b')
+    assert storage.answers() == [u'foo', u'bar']
+
+
+def test_texts_are_deleted_with_their_hints():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    storage = HintStorage(kvs, namespace, cache=None)
+    storage.migrate({'foo': {'rude': 0, 'kind': 0}, 'bar': {'check the b': 0}}, {'gone': 'foo'}, 'a')
+    storage.remove_hint('foo', hint_id('rude'))
+    storage.unreport_hint('foo', hint_id('gone'))
+    storage.evict(['bar'])
+    texts = sorted(value for key, value in kvs.data.items() if u':text:' in key)
+    assert texts == ['"kind"']
+
+
+def test_texts_are_kept_in_the_shards_of_a_field():
+    kvs = InMemoryKeyValueStore()
+    namespace = element()
+    storage = HintStorage(kvs, namespace, cache=None, texts_in_shards=True)
+    storage.migrate({'foo': {'rude': 0}}, None, 'a')
+    hint = storage.add_hint('foo', 'kind')
+    storage.remove_hint('foo', hint_id('rude'))
+    assert not [key for key in kvs.data if u':text:' in key]
+    storage = HintStorage(kvs, namespace, cache=None, texts_in_shards=True)
+    assert storage.hint_text(hint, 'foo') == 'kind'
+    assert storage.reload('foo')['texts'] == ['kind']